@@ -1,11 +1,21 @@
-try:
-    # works if calling from an repo or an pip install -e installation
-    from setuptools_scm import get_version
-    __version__ = get_version()
-except LookupError:
+def _get_version():
     try:
-        # works if calling from other pip install methods
-        from ._version import version as __version__
-    except ImportError:
-        # worst case scenario
-        __version__ = '0.0.0'
+        # works if calling from an repo or an pip install -e installation
+        from setuptools_scm import get_version
+        return get_version()
+    except LookupError:
+        try:
+            # works if calling from other pip install methods
+            from ._version import version
+            return version
+        except ImportError:
+            # worst case scenario
+            return '0.0.0'
+
+def __getattr__(name):
+    # NOTE version is only worked out when asked for, setuptools_scm is slow to
+    # import and gopest is called (by PEST) once for every model run
+    if name == '__version__':
+        globals()['__version__'] = _get_version()
+        return globals()['__version__']
+    raise AttributeError("module '%s' has no attribute '%s'" % (__name__, name))
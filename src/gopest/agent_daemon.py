@@ -0,0 +1,219 @@
+""" Resident agent daemon for 'gopest run-pest-model'.
+
+PEST (or its agents) calls 'gopest run-pest-model' once for every model run,
+each as a fresh Python process that re-imports numpy/h5py/PyTOUGH and reloads
+the config, geometry, original model input and parameter/observation plans.
+
+Started in a slave directory, 'gopest agent-daemon' keeps all these in memory
+(see gopest.common.resident_load()) and listens on a Unix socket in the same
+directory.  'gopest run-pest-model' then only hands the run over to the daemon
+and waits until it finishes (ie. pest_model.obf written).  If no daemon is
+running in the working directory, the model run is done as usual.
+
+Usage:
+    gopest agent-daemon [--idle-timeout SECONDS]
+    gopest agent-daemon --stop
+
+While a run is going, the daemon sends a space every KEEPALIVE seconds.  If
+'gopest run-pest-model' hears nothing from the daemon for REPLY_TIMEOUT seconds
+(eg. the daemon hangs, or is busy with another client), the model run fails.
+It is not done in the client's own process, as the daemon may still pick up
+the request later and both would write the same model files.  The daemon
+skips requests whose client has already given up.
+
+NOTE the daemon keeps goPESTconfig.toml as loaded when it started, restart it
+after changing the config.  Files like the original model and the plans are
+reloaded automatically if they change.
+"""
+
+import json
+import os
+import os.path
+import socket
+import sys
+import threading
+import time
+import traceback
+
+SOCKET_NAME = '_gopest_agent.sock'
+KEEPALIVE = 5.0
+REPLY_TIMEOUT = 60.0
+
+def request(req, fsock=SOCKET_NAME, timeout=REPLY_TIMEOUT):
+    """ sends request (a dict) to the agent daemon listening in the working
+    directory, waits for and returns its reply, None if no daemon running.
+    Raises exception if nothing (not even keep-alive) is received from the
+    daemon for timeout seconds. """
+    if not os.path.exists(fsock):
+        return None
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.settimeout(timeout)
+    try:
+        s.connect(fsock)
+    except (ConnectionRefusedError, FileNotFoundError, socket.timeout):
+        # stale socket file, daemon has gone
+        s.close()
+        return None
+    with s:
+        data = b''
+        try:
+            s.sendall((json.dumps(req) + '\n').encode())
+            s.shutdown(socket.SHUT_WR)
+            while True:
+                chunk = s.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+        except socket.timeout:
+            raise Exception('Agent daemon in %s not responding for %s seconds.' % (
+                os.path.dirname(os.path.abspath(fsock)), str(timeout)))
+    if not data.strip():
+        raise Exception('Agent daemon closed connection without reply.')
+    return json.loads(data.decode())
+
+def preload():
+    """ loads model files into the resident cache, ready for the first run """
+    from gopest.common import enable_resident_cache
+    from gopest.common import runtime
+    from gopest.geo_cache import load_geometry
+    from gopest.par import load_original_input, load_par_plan
+    from gopest.obs import load_obs_plan
+    enable_resident_cache()
+    fgeo = runtime['filename']['geom']
+    fdato = runtime['filename']['dat_orig']
+    if os.path.isfile(fgeo):
+        load_geometry(fgeo)
+    if os.path.isfile(fdato):
+        load_original_input(fdato)
+    load_par_plan('goPESTpar.plan')
+    load_obs_plan('goPESTobs.plan')
+
+def run_model(argv):
+    """ runs pest_model.main_cli() in this process, returns reply dict """
+    from gopest.pest_model import main_cli
+    from gopest.obs import reset_obs_names
+    # nothing of the previous run should be carried over, the resident model
+    # files are not modified by runs (see gopest.common.resident_load())
+    reset_obs_names()
+    sys_argv = sys.argv
+    sys.argv = [sys_argv[0]] + argv
+    try:
+        main_cli(argv)
+        return {'ok': True}
+    except (Exception, SystemExit):
+        traceback.print_exc()
+        return {'ok': False, 'error': traceback.format_exc()}
+    finally:
+        sys.argv = sys_argv
+        sys.stdout.flush()
+
+def run_with_keepalive(conn, argv):
+    """ run_model(), while sending a space to conn every KEEPALIVE seconds,
+    which is ignored by json.loads() of the reply """
+    done = threading.Event()
+    def keepalive():
+        while not done.wait(KEEPALIVE):
+            try:
+                conn.sendall(b' ')
+            except OSError:
+                break
+    th = threading.Thread(target=keepalive, daemon=True)
+    th.start()
+    try:
+        return run_model(argv)
+    finally:
+        done.set()
+        th.join()
+
+def client_waiting(conn):
+    """ True if the client of conn is still waiting for the reply, a request
+    queued while the daemon was busy may have been given up by its client """
+    try:
+        conn.sendall(b' ')
+        return True
+    except OSError:
+        return False
+
+def handle(conn):
+    """ reads request from conn, does it and replies, returns the request """
+    conn.settimeout(None)
+    data = b''
+    while True:
+        chunk = conn.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    req = json.loads(data.decode())
+    if req.get('cmd') == 'run':
+        if not client_waiting(conn):
+            print('Agent daemon client gone, run request skipped.')
+            return req
+        if os.path.realpath(req['cwd']) != os.path.realpath(os.getcwd()):
+            reply = {'ok': False, 'error': 'Agent daemon is running in %s, not %s' % (os.getcwd(), req['cwd'])}
+        else:
+            reply = run_with_keepalive(conn, req['argv'])
+    else:
+        reply = {'ok': True}
+    try:
+        conn.sendall((json.dumps(reply) + '\n').encode())
+    except OSError:
+        # client gave up waiting
+        print('Agent daemon unable to reply to client.')
+    return req
+
+def serve(fsock=SOCKET_NAME, idle_timeout=None):
+    """ listens on Unix socket fsock (in working dir), handles one request at
+    a time until stopped, or no request within idle_timeout seconds """
+    if request({'cmd': 'ping'}, fsock) is not None:
+        raise Exception('Agent daemon already running in %s' % os.getcwd())
+    if os.path.exists(fsock):
+        os.remove(fsock)
+    START_TIME = time.time()
+    preload()
+    print('Agent daemon ready in %s after %.2f seconds' % (os.getcwd(), time.time() - START_TIME))
+    sys.stdout.flush()
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        server.bind(fsock)
+        server.listen(1)
+        server.settimeout(idle_timeout)
+        while True:
+            try:
+                conn, addr = server.accept()
+            except socket.timeout:
+                print('Agent daemon idle for %s seconds, exit.' % str(idle_timeout))
+                break
+            with conn:
+                req = handle(conn)
+            if req.get('cmd') == 'stop':
+                print('Agent daemon stopped.')
+                break
+    finally:
+        server.close()
+        if os.path.exists(fsock):
+            os.remove(fsock)
+
+def run_pest_model_cli(argv=[]):
+    """ 'gopest run-pest-model', hands the run over to the agent daemon in the
+    working directory if there is one, otherwise runs it in this process """
+    reply = request({'cmd': 'run', 'argv': argv, 'cwd': os.getcwd()})
+    if reply is None:
+        from gopest.pest_model import main_cli
+        main_cli(argv)
+    elif not reply['ok']:
+        print(reply['error'])
+        exit(1)
+
+def agent_daemon_cli(argv=[]):
+    if '--help' in argv:
+        print(__doc__)
+        return
+    if '--stop' in argv:
+        if request({'cmd': 'stop'}) is None:
+            print('No agent daemon running in %s' % os.getcwd())
+        return
+    idle_timeout = None
+    if '--idle-timeout' in argv:
+        idle_timeout = float(argv[argv.index('--idle-timeout') + 1])
+    serve(idle_timeout=idle_timeout)
@@ -0,0 +1,115 @@
+""" Content-addressed archive of the model files of each PEST iteration.
+
+PEST_HP distributes the model files of the best run of each iteration to the
+master directory (as '*.999', see make_case_pst.fixpcf_modelcmd()), which used
+to be simply renamed and kept, a full copy of the save/incon/output h5 for
+every iteration.
+
+If [pest] archive_iterations is true, 'gopest save-iter-files' stores them in
+the archive directory instead:
+
+    goPESTarchive/chunks/ab/ab12...     zlib compressed chunks, named by sha1
+    goPESTarchive/iterations/3.json     manifest of iteration 3
+
+Files are split into fixed size chunks, a chunk is only stored once, so the
+parts of a file that have not changed since any previous iteration (eg. the
+mesh, or large datasets of h5 files) take no extra space.  The manifest lists
+each file's chunks, size and modification time, so any iteration can be
+restored with 'gopest save-iter-files --restore ITERATION [DIR]'.
+"""
+
+import hashlib
+import json
+import os
+import os.path
+import zlib
+
+ARCHIVE_DIR = 'goPESTarchive'
+CHUNK_SIZE = 4 << 20
+
+def _chunk_path(store, digest):
+    return os.path.join(store, 'chunks', digest[:2], digest)
+
+def _manifest_path(store, iteration):
+    return os.path.join(store, 'iterations', '%i.json' % iteration)
+
+def _write_atomic(fname, data):
+    d = os.path.dirname(fname)
+    if not os.path.isdir(d):
+        os.makedirs(d, exist_ok=True)
+    with open(fname + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(fname + '.tmp', fname)
+
+def store_file(fname, store=ARCHIVE_DIR, chunk_size=CHUNK_SIZE):
+    """ stores content of file fname as chunks, returns (manifest entry, number
+    of bytes newly stored (compressed)) """
+    chunks, stored = [], 0
+    with open(fname, 'rb') as f:
+        for data in iter(lambda: f.read(chunk_size), b''):
+            digest = hashlib.sha1(data).hexdigest()
+            fchunk = _chunk_path(store, digest)
+            if not os.path.exists(fchunk):
+                zdata = zlib.compress(data, 6)
+                _write_atomic(fchunk, zdata)
+                stored += len(zdata)
+            chunks.append(digest)
+    st = os.stat(fname)
+    entry = {
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'chunks': chunks,
+    }
+    return entry, stored
+
+def archive_iteration(iteration, files, store=ARCHIVE_DIR, chunk_size=CHUNK_SIZE):
+    """ stores files (dict of archived name to file name) as iteration, an
+    existing manifest of the same iteration is replaced.  Returns dict of
+    counts 'files', 'bytes' (total size) and 'stored' (new bytes in store). """
+    manifest = {'iteration': iteration, 'files': {}}
+    counts = {'files': 0, 'bytes': 0, 'stored': 0}
+    for name, fname in sorted(files.items()):
+        entry, stored = store_file(fname, store, chunk_size)
+        manifest['files'][name] = entry
+        counts['files'] += 1
+        counts['bytes'] += entry['size']
+        counts['stored'] += stored
+    _write_atomic(_manifest_path(store, iteration),
+                  json.dumps(manifest, indent=1).encode('utf-8'))
+    return counts
+
+def load_manifest(iteration, store=ARCHIVE_DIR):
+    with open(_manifest_path(store, iteration), 'r') as f:
+        return json.load(f)
+
+def list_iterations(store=ARCHIVE_DIR):
+    """ returns sorted list of archived iteration numbers """
+    d = os.path.join(store, 'iterations')
+    if not os.path.isdir(d):
+        return []
+    return sorted([int(f[:-5]) for f in os.listdir(d) if f.endswith('.json')])
+
+def restore_iteration(iteration, dest='.', store=ARCHIVE_DIR, names=None):
+    """ writes the archived files of iteration (all, or only those in names)
+    into directory dest, returns list of file names written """
+    manifest = load_manifest(iteration, store)
+    if not os.path.isdir(dest):
+        os.makedirs(dest)
+    written = []
+    for name, entry in sorted(manifest['files'].items()):
+        if names is not None and name not in names:
+            continue
+        fname = os.path.join(dest, name)
+        with open(fname + '.tmp', 'wb') as f:
+            for digest in entry['chunks']:
+                with open(_chunk_path(store, digest), 'rb') as fc:
+                    data = zlib.decompress(fc.read())
+                if hashlib.sha1(data).hexdigest() != digest:
+                    raise Exception('Archive chunk %s of %s is corrupted.' % (digest, name))
+                f.write(data)
+        if os.path.getsize(fname + '.tmp') != entry['size']:
+            raise Exception('Restored %s has wrong size.' % name)
+        os.utime(fname + '.tmp', ns=(entry['mtime_ns'], entry['mtime_ns']))
+        os.replace(fname + '.tmp', fname)
+        written.append(fname)
+    return written
@@ -0,0 +1,267 @@
+""" Benchmarks of goPEST's own work in a forward run, ie. everything apart from
+the simulator itself.
+
+A synthetic Waiwera case (mulgrid geometry, input JSON, HDF5 output, PEST
+model file and goPESTobs.list) of configurable size is generated in a working
+directory, then these stages are timed:
+
+    par-substitution    par.generate_real_model()
+    obs-plan            obs.generate_obses_and_ins(), as done by 'gopest init'
+    obs-extraction      makeObfValues() of all observations
+    obf-writing         writing extracted values into .obf
+    read-from-model     obs.read_from_real_model(), as in 'run-pest-model'
+
+Usage:
+    gopest bench [--blocks N] [--layers N] [--sources N] [--times N]
+                 [--obs N] [--params N] [--repeat N] [--obs-workers N]
+                 [--dir DIR] [--json FILE]
+
+NOTE goPEST modules are only imported after the case directory (which has its
+own goPESTconfig.toml) becomes the working directory, so this must run before
+anything else loads the config, see gopest.common.load_config().
+"""
+
+import json
+import os
+import os.path
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import h5py
+
+from mulgrids import mulgrid
+
+BENCH_DEFAULTS = {
+    'blocks': 2000,
+    'layers': 10,
+    'sources': 20,
+    'times': 100,
+    'obs': 500,
+    'params': 200,
+    'repeat': 3,
+    'obs-workers': 1,
+}
+
+BENCH_CONFIG = """# goPEST configuration of synthetic benchmark case
+[pest]
+case-name = 'bench'
+
+[model]
+skip = true
+skip-pr = true
+silent = true
+sequence = ['ns']
+obs-workers = %i
+
+[model.original]
+geometry-files = ['g_bench.dat']
+
+[simulator]
+input-type = "waiwera"
+output-type = "h5"
+executable = "waiwera"
+cmd-options = []
+"""
+
+SECONDS_PER_YEAR = 365.25*24.*60.*60.
+
+def make_bench_case(dirname, blocks=2000, layers=10, sources=20, times=100,
+                    obs=500, params=200, obs_workers=1, seed=0):
+    """ Writes a synthetic Waiwera case into dirname.  The geometry has roughly
+    the number of blocks specified, half of the observations are block
+    temperatures, the other half are enthalpy histories of the sources.
+    """
+    rng = np.random.default_rng(seed)
+    ncols = max(1, int(round(blocks / float(layers))))
+    nx = max(1, int(np.sqrt(ncols)))
+    ny = max(1, ncols // nx)
+    geo = mulgrid().rectangular([100.]*nx, [100.]*ny, [10.]*layers,
+                                atmos_type=0, block_order='dmplex')
+    natm = geo.num_atmosphere_blocks
+    ncells = geo.num_blocks - natm
+    sources = min(sources, ncells)
+    geo.write(os.path.join(dirname, 'g_bench.dat'))
+
+    ### Waiwera input JSON, rock types and sources are the parameters
+    nsrcpar = min(sources, params // 5)
+    nrocks = max(1, min(ncells, (params - nsrcpar) // 4))
+    rocks = [{
+        'name': 'R%04i' % i,
+        'permeability': [1.e-14, 1.e-14, 1.e-15],
+        'porosity': 0.1,
+        'cells': list(range(i, ncells, nrocks)),
+        } for i in range(nrocks)]
+    src_cells = rng.choice(ncells, sources, replace=False)
+    srcs = [{
+        'name': 'S%04i' % i,
+        'cell': int(c),
+        'rate': -1.0,
+        'enthalpy': 1.e6,
+        } for i,c in enumerate(src_cells)]
+    wjson = {
+        'mesh': {'filename': 'g_bench.msh'},
+        'rock': {'types': rocks},
+        'source': srcs,
+        'time': {'start': 0.0, 'stop': (times - 1) * SECONDS_PER_YEAR},
+    }
+    with open(os.path.join(dirname, 'real_model_original.json'), 'w') as f:
+        json.dump(wjson, f, indent=4, sort_keys=True)
+    shutil.copy(os.path.join(dirname, 'real_model_original.json'),
+                os.path.join(dirname, 'real_model_ns.json'))
+
+    ### PEST template and model file, as PEST would write from pest_model.tpl
+    pars = []
+    for r in rocks:
+        for pt,v in [('permeability_1_byrock', 2.e-14),
+                     ('permeability_2_byrock', 2.e-14),
+                     ('permeability_3_byrock', 2.e-15),
+                     ('porosity_byrock', 0.2)]:
+            pars.append((pt, r['name'], v))
+    for s in srcs[:nsrcpar]:
+        pars.append(('massgener_rate', s['name'], -2.0))
+    with open(os.path.join(dirname, 'pest_model.tpl'), 'w') as ftpl:
+        ftpl.write('ptf $\n')
+        with open(os.path.join(dirname, 'pest_model.dat'), 'w') as f:
+            for i,(pt,name,v) in enumerate(pars):
+                ftpl.write('$%-7s$, %-20s, "%s"\n' % ('P%05i' % i, ('"%s"' % pt), str([name])))
+                f.write('%9.3e, %-20s, "%s"\n' % (v, ('"%s"' % pt), str([name])))
+
+    ### Waiwera HDF5 output, cells and sources in shuffled order
+    with h5py.File(os.path.join(dirname, 'real_model_ns.h5'), 'w') as h5:
+        h5.create_dataset('time', data=np.arange(times, dtype=float).reshape(-1,1) * SECONDS_PER_YEAR)
+        h5.create_dataset('cell_index', data=rng.permutation(ncells).reshape(-1,1))
+        h5.create_dataset('source_index', data=rng.permutation(sources).reshape(-1,1))
+        cf = h5.create_group('cell_fields')
+        cf.create_dataset('fluid_pressure', data=1.e5 + 1.e7 * rng.random((times, ncells)))
+        cf.create_dataset('fluid_temperature', data=20.0 + 300.0 * rng.random((times, ncells)))
+        sf = h5.create_group('source_fields')
+        sf.create_dataset('source_rate', data=-rng.random((times, sources)))
+        sf.create_dataset('source_enthalpy', data=1.e6 * (1.0 + rng.random((times, sources))))
+
+    ### observations and field data files
+    nbt = min(ncells, obs // 2)
+    nen = max(1, min(times, (obs - nbt) // sources))
+    lines = [
+        '[ObservationType]', 'blocktemperature', '',
+        '[Defaults]', "OBSNME = 'TB'", "OBGNME = 'temp'", '',
+        '[Obs]', "'surface', 0.0", 'bench_temp_by_block.dat', '',
+        '[ObservationType]', 'enthalpy', '',
+        '[Defaults]', "OBSNME = 'En'", "OBGNME = 'enth'", '',
+    ]
+    with open(os.path.join(dirname, 'bench_temp_by_block.dat'), 'w') as f:
+        for b in rng.choice(ncells, nbt, replace=False):
+            f.write("'%s', %.2f\n" % (geo.block_name_list[natm + b], 20.0 + 300.0 * rng.random()))
+    for s in srcs:
+        fdata = 'bench_enth_%s.dat' % s['name']
+        with open(os.path.join(dirname, fdata), 'w') as f:
+            for t in np.linspace(0.0, times - 1.0, nen):
+                f.write('%.4f %.2f\n' % (t, 1000.0 + 500.0 * rng.random()))
+        lines += ['[Obs]', "'%s'" % s['name'], fdata, '']
+    with open(os.path.join(dirname, 'goPESTobs.list'), 'w') as f:
+        f.write('\n'.join(lines))
+
+    with open(os.path.join(dirname, 'goPESTconfig.toml'), 'w') as f:
+        f.write(BENCH_CONFIG % obs_workers)
+
+    return {
+        'blocks': geo.num_blocks,
+        'sources': sources,
+        'times': times,
+        'obs': nbt + nen * sources,
+        'params': 4 * nrocks + nsrcpar,
+    }
+
+def _time_it(func, repeat):
+    """ returns list of wall times (seconds) of calling func() repeat times """
+    ts = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        ts.append(time.perf_counter() - t0)
+    return ts
+
+def run_benchmarks(repeat=3, obs_workers=1):
+    """ Times each stage in the current working directory, which should be a
+    case made by make_bench_case().  Returns an (ordered) dict of stage name
+    to list of wall times. """
+    from gopest.par import generate_real_model
+    from gopest.par import save_par_plan
+    from gopest.obs import generate_obses_and_ins
+    from gopest.obs import read_from_real_model
+    from gopest.obs import load_obs_plan, load_model, open_listing
+    from gopest.obs import collect_obf, write_obf
+    fgeo, fdat, flst = 'g_bench.dat', 'real_model_ns.json', 'real_model_ns.h5'
+
+    # parameter plan is usually saved by generate_params_and_tpl() at init
+    save_par_plan('pest_model.tpl', 'goPESTpar.plan')
+
+    results = {}
+    results['par-substitution'] = _time_it(lambda: generate_real_model(
+        'real_model_original.json', 'pest_model.dat', fdat), repeat)
+    results['obs-plan'] = _time_it(lambda: generate_obses_and_ins(
+        fgeo, fdat, 'pest_model.ins', '.pest_obs_data'), repeat)
+
+    obf = {}
+    def extract():
+        geo, dat = load_model(fgeo, fdat, waiwera=True)
+        lst = open_listing(fgeo, flst, geo, dat, waiwera=True)
+        userEntries = load_obs_plan('goPESTobs.plan')
+        all_values = [ue.makeObfValues(geo, dat, lst) for ue in userEntries]
+        obf['names'], obf['values'] = collect_obf(userEntries, all_values)
+        lst.close()
+    def write():
+        write_obf('pest_model.obf', obf['names'], obf['values'])
+    results['obs-extraction'] = _time_it(extract, repeat)
+    results['obf-writing'] = _time_it(write, repeat)
+    results['read-from-model'] = _time_it(lambda: read_from_real_model(
+        fgeo, fdat, flst, 'pest_model.obf', waiwera=True, workers=obs_workers), repeat)
+    return results
+
+def print_results(case, results):
+    print('Case: ' + ', '.join(['%s=%i' % (k,v) for k,v in case.items()]))
+    print('%-20s %10s %10s %10s' % ('stage', 'min (s)', 'mean (s)', 'max (s)'))
+    for name,ts in results.items():
+        print('%-20s %10.4f %10.4f %10.4f' % (name, min(ts), np.mean(ts), max(ts)))
+
+def bench_cli(argv=[]):
+    if '--help' in argv:
+        print(__doc__)
+        return
+    opts = dict(BENCH_DEFAULTS)
+    for k in opts:
+        if '--' + k in argv:
+            iarg = argv.index('--' + k) + 1
+            if iarg >= len(argv):
+                raise Exception('Option --%s requires a number.' % k)
+            opts[k] = int(argv[iarg])
+    dirname, fjson = None, None
+    if '--dir' in argv:
+        dirname = os.path.abspath(argv[argv.index('--dir') + 1])
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+    if '--json' in argv:
+        fjson = os.path.abspath(argv[argv.index('--json') + 1])
+
+    workdir = dirname if dirname is not None else tempfile.mkdtemp(prefix='gopest_bench_')
+    original_dir = os.getcwd()
+    try:
+        case = make_bench_case(workdir, blocks=opts['blocks'], layers=opts['layers'],
+                               sources=opts['sources'], times=opts['times'],
+                               obs=opts['obs'], params=opts['params'],
+                               obs_workers=opts['obs-workers'])
+        os.chdir(workdir)
+        results = run_benchmarks(repeat=opts['repeat'], obs_workers=opts['obs-workers'])
+    finally:
+        os.chdir(original_dir)
+        if dirname is None:
+            shutil.rmtree(workdir)
+    print_results(case, results)
+    if fjson is not None:
+        with open(fjson, 'w') as f:
+            json.dump({'case': case, 'results': results}, f, indent=4)
+
+if __name__ == '__main__':
+    bench_cli(sys.argv)
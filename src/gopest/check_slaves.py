@@ -9,9 +9,7 @@ import glob
 import subprocess
 import collections.abc
 
-import yaml
 import tomlkit
-import xlwt
 
 from gopest.common import config
 from gopest.common import runtime
@@ -118,26 +116,8 @@ class message(object):
 
 
 def check_sim_ends(spath):
-    """ extract summary of waiwera simulation from yaml log """
-    def waiwera_ends(fyaml):
-        """ return elapsed time in seconds of waiwera simulation time, None if not
-        successful """
-        try:
-            with open(fyaml) as f:
-                data = yaml.load(f, Loader=yaml.CSafeLoader)
-                r = {''}
-                if data[-3][:3] == ['info', 'timestep', 'end']:
-                    time = data[-3][3]['time']
-                    size = data[-3][3]['size']
-                if data[-1][:3] == ['info', 'simulation', 'destroy']:
-                    elapsed = data[-1][3]['elapsed_seconds']
-                return {'endtime': time, 'stepsize': size, 'elapsed': elapsed}
-        except:
-            return {}
-    cwd = os.getcwd()
-    os.chdir(spath)
-    print('Working in %s...' % spath)
-
+    """ extract summary of waiwera simulation from the end of yaml log """
+    from gopest.utils.waiwera_log import sim_ends
     results = {'run': {}}
     sequence = config['model']['sequence']
     input_typ = config['simulator']['input-type']
@@ -145,34 +125,59 @@ def check_sim_ends(spath):
     for i,seq in enumerate(sequence):
         results['run'][seq] = {}
         if input_typ== 'waiwera':
-            fyaml = flsts[i].replace('.h5', '.yaml')
-            results['run'][seq] = waiwera_ends(fyaml)
+            fyaml = os.path.join(spath, flsts[i].replace('.h5', '.yaml'))
+            results['run'][seq] = sim_ends(fyaml)
         else:
             raise NotImplementedError()
-
-    os.chdir(cwd)
-    # print('Restored directory %s' % cwd)
     return results
 
-def check_run_status(spath):
-    """ extract summary of waiwera simulation from yaml log """
-    cwd = os.getcwd()
-    os.chdir(spath)
-    print('Working in %s...' % spath)
-
+def check_timesteps(spath):
+    """ extract timestep statistics of waiwera simulation from yaml log """
+    from gopest.utils.waiwera_log import timestep_stats
     results = {'run': {}}
     sequence = config['model']['sequence']
     input_typ = config['simulator']['input-type']
     flsts = runtime['filename']['lst_seq']
     for i,seq in enumerate(sequence):
         results['run'][seq] = {}
-        results['run'][seq]['exists'] = os.path.exists(flsts[i])
+        if input_typ== 'waiwera':
+            fyaml = os.path.join(spath, flsts[i].replace('.h5', '.yaml'))
+            if os.path.exists(fyaml):
+                stats = timestep_stats(fyaml)
+                results['run'][seq] = dict([('timestep-' + k, v) for k,v in stats.items()])
+        else:
+            raise NotImplementedError()
+    return results
 
-    os.chdir(cwd)
-    # print('Restored directory %s' % cwd)
+def check_run_status(spath):
+    """ checks if model output files exist """
+    results = {'run': {}}
+    sequence = config['model']['sequence']
+    flsts = runtime['filename']['lst_seq']
+    for i,seq in enumerate(sequence):
+        results['run'][seq] = {}
+        results['run'][seq]['exists'] = os.path.exists(os.path.join(spath, flsts[i]))
     return results
 
 def get_obj_fn(spath):
+    """ Return objective function values calculated by goPEST (gopest.phi) from
+    the PEST case file and the model output (.obf, or model output file if .obf
+    is missing or older) of the slave.  Nothing is modified.
+    """
+    from gopest.phi import dir_phi
+    flst = runtime['filename']['lst_seq'][-1]
+    if not (os.path.exists(os.path.join(spath, 'pest_model.obf')) or
+            os.path.exists(os.path.join(spath, flst))):
+        print('Model output files are missing in %s, cannot get obj. fn.' % spath)
+        return {}
+    try:
+        phis = dir_phi(spath, config['pest']['case-name'] + '.pst', flst=flst)
+    except Exception as e:
+        print('Unable to calculate obj. fn. in %s: %s' % (spath, str(e)))
+        return {}
+    return {'obj-fn': phis}
+
+def get_obj_fn_pest(spath):
     """ Return PEST calculated objective function values by modifying config and
     PEST case file to run a dummy run.  Then read results from case .rec file.
 
@@ -186,42 +191,36 @@ def get_obj_fn(spath):
     Unfortunately I need to modify the config.toml file, because gopest run-
     pest-model is involked by PEST, not this script directly.
     """
-    cwd = os.getcwd()
-    os.chdir(spath)
-    print('Working in %s...' % spath)
-
     # only works if the final real model output file exists
-    flst = runtime['filename']['lst_seq'][-1]
+    flst = os.path.join(spath, runtime['filename']['lst_seq'][-1])
     if not os.path.exists(flst):
         print('Real model output file %s is missing, cannot get obj. fn.' % flst)
-        os.chdir(cwd)
         return {}
 
     # modify config to skip model run
-    with open('goPESTconfig.toml', 'r') as f:
+    fcfg = os.path.join(spath, 'goPESTconfig.toml')
+    with open(fcfg, 'r') as f:
         cfg = tomlkit.load(f)
     cfg['model']['skip'] = True
-    with open('goPESTconfig.toml', 'w') as f:
+    with open(fcfg, 'w') as f:
         tomlkit.dump(cfg, f)
 
     # modify NOPTMAX in control data .pst file
-    fpst = config['pest']['case-name'] + '.pst'
+    fpst = os.path.join(spath, config['pest']['case-name'] + '.pst')
     fixpcf_noptmax(fpst, 0)
 
     cmd = [
         os.path.join(config['pest']['dir'], config['pest']['executable']),
         config['pest']['case-name'],
         ]
-    print('Running: ', cmd)
+    print('Running in %s: %s' % (spath, str(cmd)))
     results = {}
-    subprocess.call(cmd)
-    results['obj-fn'] = read_rec('case_reg.rec')
-
-    os.chdir(cwd)
-    # print('Restored directory %s' % cwd)
+    subprocess.call(cmd, cwd=spath)
+    results['obj-fn'] = read_rec(os.path.join(spath, 'case_reg.rec'))
     return results
 
 def export_xls(data):
+    import xlwt
     phis, regs, others = [], [], []
     for sln,sl in data.items():
         if 'obj-fn' in sl:
@@ -265,6 +264,28 @@ def export_xls(data):
                     ws.write(i, j, sl['run'][rn][sn])
     wb.save('goPESTslaves.xls')
 
+TASK_FN = {
+    'end-time': check_sim_ends,
+    'timesteps': check_timesteps,
+    'status': check_run_status,
+    'obj-fn': get_obj_fn,
+    'obj-fn-pest': get_obj_fn_pest,
+}
+
+def check_slave(args):
+    """ runs all tasks on a single slave directory, returns (name, results) """
+    spath, tasks = args
+    results = {}
+    for task in tasks:
+        results = nested_dict_update(results, TASK_FN[task](spath))
+    return os.path.basename(spath), results
+
+def save_json(data, fout):
+    """ writes via a temporary file, so fout is always complete """
+    with open(fout + '.tmp', 'w') as f:
+        json.dump(data, f, indent=4, sort_keys=True)
+    os.replace(fout + '.tmp', fout)
+
 def init_slave(cfg, rt):
     """ used in multiprocessing Pool to initialise threads with the the updated
     gopest.common.config and gopest.common.runtime
@@ -275,7 +296,8 @@ def init_slave(cfg, rt):
     runtime = rt
 
 hlp = '''
-Usage: gopest check-slaves [--help] [--status] [--end-time] [--obj-fn]
+Usage: gopest check-slaves [--help] [--status] [--end-time] [--timesteps]
+                           [--obj-fn] [--obj-fn-pest]
                            [--dir path_to_slaves] [--pest-exe pest_executable]
                            [--export-xls]
 
@@ -292,14 +314,26 @@ It tries not to destroy whatever that is already in the file.
 in the lsave directories.  (ie. did the runs produce any output files at all)
 
 "--end-time" enables extraction of simulation end time (from output YAML file if
-running waiwera as simulator).
-
-"--obj-fn" is more destructive.  Within each slave directory, it will run PEST
-(with the NOPTMAX set to 0) once with the internal settings set to skip actual
-model runs.  This essentially runs PEST so that observations and objective
-function will be extracted from model outputs within the slave directory.
-
-"--pest-exe" is useful with the "--obj-fn" option when user have the slaves
+running waiwera as simulator).  Only the end of the YAML log is read, so this is
+fast even for very long logs.
+
+"--timesteps" scans the whole YAML log (waiwera) once and extracts timestep
+statistics: number of steps, retries, failures (timestep warnings/errors) and
+the min/max time step sizes.
+
+"--obj-fn" calculates the objective function (phi, measured and regularisation
+phi, and phi of each observation group) of each slave, from the observation data
+and prior information of the PEST case file and the model results (pest_model.obf,
+or the model output file if .obf is missing or older).  PEST is not run, and no
+file is modified.
+
+"--obj-fn-pest" is the original, more destructive, way to get the objective
+function.  Within each slave directory, it will run PEST (with the NOPTMAX set to
+0) once with the internal settings set to skip actual model runs.  This
+essentially runs PEST so that observations and objective function will be
+extracted from model outputs within the slave directory.
+
+"--pest-exe" is useful with the "--obj-fn-pest" option when user have the slaves
 directories in a different environment than where it was originally run.
 pest_executable here can include the path to the executable if it's not already
 in the system's PATH.
@@ -349,9 +383,15 @@ def check_slaves_cli(argv=[]):
         if "--end-time" in argv:
             nopts += 1
             tasks.append('end-time')
+        if "--timesteps" in argv:
+            nopts += 1
+            tasks.append('timesteps')
         if "--obj-fn" in argv:
             nopts += 1
             tasks.append('obj-fn')
+        if "--obj-fn-pest" in argv:
+            nopts += 1
+            tasks.append('obj-fn-pest')
         xls = False
         if "--export-xls" in argv:
             nopts += 1
@@ -365,18 +405,7 @@ def check_slaves_cli(argv=[]):
     if not all([os.path.exists(spath), os.path.isdir(spath)]):
         raise Exception('Specified path_to_slaves needs to be a valid directory: %s' % spath)
 
-    task_fn = {
-        'end-time': check_sim_ends,
-        'status': check_run_status,
-        'obj-fn': get_obj_fn,
-    }
-
     slave_paths = sorted([p for p in glob.glob(os.path.join(spath, '*')) if os.path.isdir(p)])
-    slave_names = [os.path.basename(sp) for sp in slave_paths]
-
-    ncpu = max(1, cpu_count() - 1)
-    print('Starting %i workers to process %i slaves' % (ncpu, len(slave_paths)))
-    pool = Pool(ncpu, initializer=init_slave, initargs=(config, runtime))
 
     fout = 'goPESTslaves.json'
     if os.path.exists(fout):
@@ -385,13 +414,21 @@ def check_slaves_cli(argv=[]):
     else:
         data = {}
 
-    for task in tasks:
-        print('Checking %s...' % task)
-        results = pool.map(task_fn[task], slave_paths)
-        data = nested_dict_update(data, dict(zip(slave_names, results)))
-
-    with open(fout, 'w') as f:
-        json.dump(data, f, indent=4, sort_keys=True)
+    if tasks:
+        ncpu = max(1, min(cpu_count() - 1, len(slave_paths)))
+        print('Starting %i workers to check %s of %i slaves' % (ncpu, ', '.join(tasks), len(slave_paths)))
+        # results are saved as each slave completes, at most every few seconds
+        save_time, ndone = time.time(), 0
+        with Pool(ncpu, initializer=init_slave, initargs=(config, runtime)) as pool:
+            jobs = [(sp, tasks) for sp in slave_paths]
+            for name, results in pool.imap_unordered(check_slave, jobs):
+                data[name] = nested_dict_update(data.get(name, {}), results)
+                ndone += 1
+                if time.time() - save_time > 2.0:
+                    print('Checked %i/%i slaves' % (ndone, len(slave_paths)))
+                    save_json(data, fout)
+                    save_time = time.time()
+        save_json(data, fout)
 
     if xls:
         export_xls(data)
@@ -1,12 +1,13 @@
 import sys
-
-from gopest import __version__
+import importlib
 
 title = """
 goPEST - Interfacing PEST with Waiwera and (AU)TOUGH2 simulators
 """
 
-version = """Version: (%s)
+def version():
+    from gopest import __version__
+    return """Version: (%s)
 """ % __version__
 
 hlp = """
@@ -17,12 +18,16 @@ Supported COMMANDs:
     init [--no-copy][--no-par][--no-obs]    (make_case_pst)
     submit                                  (submit_beopest)
     run                                     (run_beopest)
+    run-batch PARFILE... [--workers N]      (run_manager)
+    run-workers [--workers N][--master CMD] (run_manager)
     par                                     (goPESTpar)
     obs                                     (goPESTobs)
     run-pest-model                          (pest_model)
+    agent-daemon [--stop]                   (agent_daemon)
     run-forward                             (run_ns_pr)
-    save-iter-files                         (rename_latest_files)
+    save-iter-files [--list][--restore N]   (rename_latest_files)
     check-slaves                            (check_slaves)
+    bench [--help]                          (bench)
 
 Important files for goPEST to work:
     goPESTconfig.toml
@@ -35,42 +40,47 @@ Important files for goPEST to work:
 University of Auckland, 2012, 2022
 """
 
+# COMMAND: (module, function), only the module of the selected command is
+# imported, as PEST calls 'gopest run-pest-model' once for every model run
+# NOTE loading config (via gopest.common) checks goPESTconfig.toml
+cmds = {
+    'par': ('gopest.par', 'goPESTpar'),
+    'obs': ('gopest.obs', 'goPESTobs'),
+    'run-pest-model': ('gopest.agent_daemon', 'run_pest_model_cli'),
+    'agent-daemon': ('gopest.agent_daemon', 'agent_daemon_cli'),
+    'run-forward': ('gopest.run_ns_pr', 'main_cli'),
+    'submit': ('gopest.submit_beopest', 'submit_cli'),
+    'run': ('gopest.run_beopest', 'run_cli'),
+    'run-batch': ('gopest.run_manager', 'run_batch_cli'),
+    'run-workers': ('gopest.run_manager', 'run_workers_cli'),
+    'init': ('gopest.make_case_pst', 'make_case_cli'),
+    'save-iter-files': ('gopest.rename_latest_files', 'rename_latest_files'),
+    # as written into PEST case file by 'gopest init'
+    'save-iter-model': ('gopest.rename_latest_files', 'rename_latest_files'),
+    'check-slaves': ('gopest.check_slaves', 'check_slaves_cli'),
+    # runs in its own synthetic case, with its own goPESTconfig.toml
+    'bench': ('gopest.bench', 'bench_cli'),
+}
+
 def gopest_cli():
     print(title)
     argc = len(sys.argv)
     if argc < 2:
-        print(version + hlp)
+        print(version() + hlp)
     else:
         if sys.argv[1] == 'help':
-            print(version + hlp)
+            print(version() + hlp)
         else:
-            # NOTE loading gopest.common checks goPESTconfig.toml
-            import gopest.common
-            import gopest.par
-            import gopest.obs
-            import gopest.pest_model
-            import gopest.run_ns_pr
-            import gopest.submit_beopest
-            import gopest.run_beopest
-            import gopest.make_case_pst
-            import gopest.rename_latest_files
-            import gopest.check_slaves
-            cmds = {
-                'par': gopest.par.goPESTpar,
-                'obs': gopest.obs.goPESTobs,
-                'run-pest-model': gopest.pest_model.main_cli,
-                'run-forward': gopest.run_ns_pr.main_cli,
-                'submit': gopest.submit_beopest.submit_cli,
-                'run': gopest.run_beopest.run_cli,
-                'init': gopest.make_case_pst.make_case_cli,
-                'save-iter-files': gopest.rename_latest_files.rename_latest_files,
-                'check-slaves': gopest.check_slaves.check_slaves_cli,
-            }
             if sys.argv[1] not in cmds:
-                print(version + hlp)
+                print(version() + hlp)
                 print('Error! COMMAND not recognised.')
                 exit(1)
-            cmds[sys.argv[1]](sys.argv[1:])
+            modname, funcname = cmds[sys.argv[1]]
+            if sys.argv[1] != 'bench':
+                import gopest.common
+                gopest.common.load_config()
+            func = getattr(importlib.import_module(modname), funcname)
+            func(sys.argv[1:])
 
 """
 - NOTE good reference on designing CLI command names:
@@ -1,14 +1,24 @@
 import os
 import os.path
+import re
 import string
 import importlib.resources as resources
 import shutil
+import hashlib
+import json
 
 # Access nested dictionary items via a list of keys
 from functools import reduce  # forward compatibility for Python 3
 import operator
 
-import tomlkit
+try:
+    # optional, much faster JSON for large Waiwera models
+    import orjson
+except ImportError:
+    orjson = None
+
+# a parameter field in PEST template file, eg. $P00001  $
+TPL_FIELD = re.compile(r'\$([^$]*)\$')
 
 def check_required(finput, name, fdefault=None):
     if not os.path.isfile(finput):
@@ -30,27 +40,63 @@ def check_required(finput, name, fdefault=None):
             exit(1)
 
 
-check_required('goPESTconfig.toml', 'Configuration')
-
 """ this allows gopest.common.config to be used directly, eg.
         from gopest.common import config as cfg
         print(cfg['pest']['executable'])
         print(cfg['simulator']['executable'])
+    NOTE config is only loaded (and goPESTconfig.toml checked) when first
+    accessed, so importing gopest.common itself has no side effect.
 """
-with open('goPESTconfig.toml', 'r') as f:
-    config = tomlkit.load(f)
-
-    if 'silent_slaves' not in config['pest']:
-        config['pest']['silent_slaves'] = True
+_config = None
+def load_config(fconfig='goPESTconfig.toml'):
+    """ loads (once) the goPEST configuration from the working directory, user
+    will be asked to create a default one if missing """
+    global _config
+    if _config is None:
+        import tomlkit
+        check_required(fconfig, 'Configuration')
+        with open(fconfig, 'r') as f:
+            cfg = tomlkit.load(f)
+        if 'silent_slaves' not in cfg['pest']:
+            cfg['pest']['silent_slaves'] = True
+        if 'agent_daemon' not in cfg['pest']:
+            cfg['pest']['agent_daemon'] = False
+        if 'link_slave_inputs' not in cfg['pest']:
+            cfg['pest']['link_slave_inputs'] = True
+        for k,v in [('max_restarts', 3), ('adaptive_slaves', False),
+                    ('min_slaves', 1), ('mem_reserve_mb', 2000),
+                    ('archive_iterations', False)]:
+            if k not in cfg['pest']:
+                cfg['pest'][k] = v
+        if 'obs-workers' not in cfg['model']:
+            cfg['model']['obs-workers'] = 1
+        if 'json-format' not in cfg['simulator']:
+            cfg['simulator']['json-format'] = 'pretty'
+        _config = cfg
+    return _config
 
 """ this allows gopest.common.runtime to be used directly, eg.
         from gopest.common import runtime
         print(runtime['filename']['fincon'])
         print(runtime['filename']['fdatns'])
 """
-runtime = {}
+_runtime = None
+def load_runtime():
+    global _runtime
+    if _runtime is None:
+        _runtime = {'filename': runtime_filenames()}
+    return _runtime
+
+def __getattr__(name):
+    if name == 'config':
+        return load_config()
+    elif name == 'runtime':
+        return load_runtime()
+    raise AttributeError("module '%s' has no attribute '%s'" % (__name__, name))
+
 def runtime_filenames(check=False):
     """ work out filenames for all internal model files """
+    config = load_config()
     def getext(fn): return os.path.splitext(fn)[1].lower()
     all_geoms = ['g_real_model' + getext(f) for f in config['model']['original']['geometry-files']]
     input_typ = config['simulator']['input-type']
@@ -96,7 +142,6 @@ def runtime_filenames(check=False):
                 if not os.path.exists(fn):
                     raise Exception('Cannot find file %s in the working dir.' % fn)
     return filenames
-runtime['filename'] = runtime_filenames()
 
 ########## utility classes and functions
 class TwoWayDict(dict):
@@ -186,9 +231,88 @@ def private_cleanup_name(s):
     for c in rep: s = s.replace(c,'_')
     return s
 
+def file_hash(filename, blocksize=1<<20):
+    """ returns sha1 hex digest of a file's content, used to check if cached
+    or compiled files are still in sync with their source. """
+    h = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(blocksize), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def load_json(filename):
+    """ loads a JSON file, uses orjson if installed """
+    if orjson is not None:
+        with open(filename, 'rb') as f:
+            try:
+                return orjson.loads(f.read())
+            except orjson.JSONDecodeError:
+                # eg. NaN/Infinity accepted by json but not orjson
+                pass
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+def dump_json(data, filename, indent=4):
+    """ writes data into a JSON file, format is controlled by config
+    ['simulator']['json-format']:
+        'pretty'  - indented, with sorted keys (default)
+        'compact' - no whitespace and key order kept, uses orjson if installed
+    Non-finite values (NaN, Infinity) raise ValueError in compact format, with
+    or without orjson (which would otherwise write them as null).
+    """
+    if load_config()['simulator']['json-format'] == 'compact':
+        if orjson is not None:
+            text = orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+            if b'null' in text:
+                # may be NaN/Infinity, checked (and raised) by json instead
+                json.dumps(data, allow_nan=False, default=lambda o: o.tolist())
+            with open(filename, 'wb') as f:
+                f.write(text)
+        else:
+            text = json.dumps(data, separators=(',', ':'), allow_nan=False)
+            with open(filename, 'w') as f:
+                f.write(text)
+    else:
+        with open(filename, 'w') as f:
+            json.dump(data, f, indent=indent, sort_keys=True)
+
 def getFromDict(dataDict, mapList):
     return reduce(operator.getitem, mapList, dataDict)
 
 def setInDict(dataDict, mapList, value):
     getFromDict(dataDict, mapList[:-1])[mapList[-1]] = value
 
+
+""" resident cache, only enabled in a long-lived agent daemon (see
+gopest.agent_daemon), so model files are loaded once instead of every forward
+run.  Each entry is (filenames) -> (file sizes and modification times, object)
+"""
+_resident = None
+def enable_resident_cache():
+    global _resident
+    if _resident is None:
+        _resident = {}
+
+def resident_cache_enabled():
+    return _resident is not None
+
+def resident_load(loader, *filenames):
+    """ returns loader(*filenames).  If the resident cache is enabled, the
+    result is kept and returned again until any of the files changes (or is
+    created/removed), so the caller must not modify it. """
+    if _resident is None:
+        return loader(*filenames)
+    stats = []
+    for fn in filenames:
+        try:
+            st = os.stat(fn)
+            stats.append((st.st_size, st.st_mtime_ns))
+        except OSError:
+            stats.append(None)
+    stats = tuple(stats)
+    key = (loader,) + filenames
+    if key in _resident and _resident[key][0] == stats:
+        return _resident[key][1]
+    obj = loader(*filenames)
+    _resident[key] = (stats, obj)
+    return obj
@@ -0,0 +1,125 @@
+""" Binary cache of the PyTOUGH mulgrid geometry used by goPEST.
+
+Forward runs (read_from_real_model etc.) need the model geometry, which is
+parsed from the text geometry file, and observation functions then build the
+column quadtree, node kdtree and well track blocks (geo.qtree, geo.kdtree and
+geo.wellblocks).  'gopest init' saves the mulgrid object together with all
+these into a pickle file, keyed by the content hash of the geometry file, so
+slaves can load it instead of re-parsing and re-building.
+"""
+
+import os.path
+import pickle
+import sys
+import threading
+
+from mulgrids import mulgrid
+from mulgrids import default_read_function
+
+from gopest.common import file_hash
+from gopest.common import resident_load
+
+# bump this whenever the content of the cache changes
+GEO_CACHE_VERSION = 1
+
+# mulgrid's columns, nodes and connections are all linked to each other, so
+# pickling recurses very deeply, this is done in a thread with a large stack
+GEO_CACHE_STACK_SIZE = 512 * 1024 * 1024
+GEO_CACHE_RECURSION_LIMIT = 1000000
+
+def geo_cache_filename(fgeo):
+    """ cache file name of geometry file fgeo """
+    return fgeo + '.cache'
+
+def face_cache_filename(fgeo):
+    """ file name of wlisting's face/connection index map of geometry fgeo """
+    return fgeo + '.faces.npz'
+
+def deep_recursion(func, *args):
+    """ runs func(*args) in a thread with large stack and recursion limit,
+    exceptions are re-raised in the calling thread """
+    result = {}
+    def target():
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(GEO_CACHE_RECURSION_LIMIT)
+        try:
+            result['value'] = func(*args)
+        except Exception as e:
+            result['error'] = e
+        finally:
+            sys.setrecursionlimit(limit)
+    stack_size = threading.stack_size(GEO_CACHE_STACK_SIZE)
+    try:
+        th = threading.Thread(target=target)
+        th.start()
+        th.join()
+    finally:
+        threading.stack_size(stack_size)
+    if 'error' in result:
+        raise result['error']
+    return result['value']
+
+def save_geometry_cache(geo, fgeo, fcache=None):
+    """ Saves mulgrid geo (loaded from file fgeo) into cache file, with spatial
+    indices built.  Any geo.wellblocks already worked out by the observation
+    functions are also kept. """
+    if fcache is None:
+        fcache = geo_cache_filename(fgeo)
+    if 'qtree' not in geo.__dict__:
+        geo.qtree = geo.column_quadtree()
+    if 'kdtree' not in geo.__dict__:
+        geo.kdtree = geo.get_node_kdtree()
+    if 'wellblocks' not in geo.__dict__:
+        geo.wellblocks = {}
+    cache = {
+        'version': GEO_CACHE_VERSION,
+        'geo_hash': file_hash(fgeo),
+        'geo': geo,
+    }
+    # read_function holds local functions that cannot be pickled
+    read_function = geo.read_function
+    geo.read_function = None
+    try:
+        data = deep_recursion(pickle.dumps, cache, pickle.HIGHEST_PROTOCOL)
+    finally:
+        geo.read_function = read_function
+    # replaced, not overwritten, slave directories may hardlink the old one
+    ftmp = '%s.%i.tmp' % (fcache, os.getpid())
+    with open(ftmp, 'wb') as f:
+        f.write(data)
+    os.replace(ftmp, fcache)
+
+def load_geometry_cache(fgeo, fcache=None):
+    """ Returns mulgrid from the cache file of geometry file fgeo, None if cache
+    does not exist or is out of date. """
+    if fcache is None:
+        fcache = geo_cache_filename(fgeo)
+    if not os.path.isfile(fcache):
+        return None
+    try:
+        with open(fcache, 'rb') as f:
+            cache = deep_recursion(pickle.load, f)
+    except Exception as e:
+        print("Warning! Unable to load geometry cache '%s': %s" % (fcache, str(e)))
+        return None
+    if cache.get('version') != GEO_CACHE_VERSION:
+        return None
+    if cache.get('geo_hash') != file_hash(fgeo):
+        print("Warning! Geometry cache '%s' is out of date with '%s', ignored." % (fcache, fgeo))
+        return None
+    geo = cache['geo']
+    geo.read_function = default_read_function
+    return geo
+
+def _load_geometry(fgeo, fcache):
+    geo = load_geometry_cache(fgeo, fcache)
+    if geo is None:
+        geo = mulgrid(fgeo)
+    return geo
+
+def load_geometry(fgeo, fcache=None):
+    """ Returns mulgrid of geometry file fgeo, use the cache if possible.  The
+    mulgrid is kept in memory by an agent daemon, see resident_load(). """
+    if fcache is None:
+        fcache = geo_cache_filename(fgeo)
+    return resident_load(_load_geometry, fgeo, fcache)
@@ -1,6 +1,8 @@
 import time
 import json
 import inspect
+import pickle
+import os.path
 
 from mulgrids import *
 from t2data import *
@@ -11,7 +13,13 @@ from gopest.common import TwoWayDict
 from gopest.common import readList
 from gopest.common import updateObj
 from gopest.common import merge_dols
+from gopest.common import file_hash
+from gopest.common import load_json
+from gopest.common import resident_load
 from gopest import obs_def
+from gopest.geo_cache import load_geometry
+from gopest.geo_cache import save_geometry_cache
+from gopest.geo_cache import face_cache_filename
 
 from gopest.utils.waiwera_listing import wlisting
 from gopest.utils.t2listingh5 import t2listingh5
@@ -19,6 +27,48 @@ from gopest.utils.t2listingh5 import t2listingh5
 OBS_USER_FUNC = dict(inspect.getmembers(obs_def,inspect.isfunction))
 OBS_ALIAS = TwoWayDict(obs_def.shortNames)
 
+# bump this whenever UserEntryObserv or the obs records it holds changes
+OBS_PLAN_VERSION = 6
+
+# line formats of PEST instruction (.ins), model output (.obf) files and
+# observation data section of control file (.pst)
+INS_LINE = 'l1 [%s]21:41\n'
+OBF_LINE = '%-20s %20.13e\n'
+PST_LINE = ' %-20s %20.13e %12.5e %s\n'
+
+def format_lines(fmt, columns):
+    """ returns text of lines, the i-th line is fmt (with a trailing newline)
+    formatted with the i-th item of each of columns (lists or arrays of the
+    same length).  All lines are formatted by a single % operation. """
+    n = len(columns[0]) if columns else 0
+    if n == 0:
+        return ''
+    flat = [None] * (n * len(columns))
+    for i,c in enumerate(columns):
+        flat[i::len(columns)] = c.tolist() if hasattr(c, 'tolist') else list(c)
+    return (fmt * n) % tuple(flat)
+
+def write_obf(fobf, names, values):
+    """ writes model output file (.obf) of observation names and values """
+    with open(fobf, 'w') as f:
+        f.write(format_lines(OBF_LINE, [names, values]))
+
+def write_ins(fins, obses):
+    """ writes PEST instruction file (.ins) reading obses from .obf """
+    with open(fins, 'w') as f:
+        f.write('pif #\n')
+        f.write(format_lines(INS_LINE, [[o.OBSNME for o in obses]]))
+
+def write_obs_data(fobses, obses):
+    """ writes lines of PEST control file's observation data section """
+    with open(fobses, 'w') as f:
+        f.write(format_lines(PST_LINE, [
+            [o.OBSNME for o in obses],
+            [o.OBSVAL for o in obses],
+            [o.WEIGHT for o in obses],
+            [o.OBGNME for o in obses],
+        ]))
+
 class PestObsDataName(Singleton):
     """ remembers a list of observation data and observation data """
     def __init__(self):
@@ -37,6 +87,12 @@ class PestObsDataName(Singleton):
     def add(self,newname):
         self.basenames.add(newname)
 
+def reset_obs_names():
+    """ forgets all observation names given so far, so each gopest init or
+    forward run (incl. runs of an agent daemon) names obses from scratch """
+    obs_def.obsBaseNameCount = {}
+    PestObsDataName().basenames.clear()
+
 class PestObservData(object):
     def __init__(self,OBSNME='',OBSVAL=0.0,WEIGHT=1.0,OBGNME=''):
         self.OBSNME=OBSNME
@@ -45,6 +101,24 @@ class PestObservData(object):
         self.OBGNME=OBGNME
     def __repr__(self):
         return  self.OBSNME +' '+ str(self.OBSVAL) +' '+ str(self.WEIGHT) +' '+ self.OBGNME
+    def new(self):
+        """ returns a new observation with the values of this (default) object,
+        other settings (eg. _DESIRED_DATA_TIMES) are not copied """
+        return PestObservation(self.OBSNME, self.OBSVAL, self.WEIGHT, self.OBGNME)
+
+class PestObservation(object):
+    """ a single observation created by obs types, there can be many thousands
+    of these, so no __dict__, only the PEST values and the extraction settings
+    used by obs types' _modelresult """
+    __slots__ = ('OBSNME', 'OBSVAL', 'WEIGHT', 'OBGNME',
+                 '_block_', '_mtime_', '_dtime_', '_bindx_', '_wpos_', '_well_')
+    def __init__(self,OBSNME='',OBSVAL=0.0,WEIGHT=1.0,OBGNME=''):
+        self.OBSNME=OBSNME
+        self.OBSVAL=OBSVAL
+        self.WEIGHT=WEIGHT
+        self.OBGNME=OBGNME
+    def __repr__(self):
+        return  self.OBSNME +' '+ str(self.OBSVAL) +' '+ str(self.WEIGHT) +' '+ self.OBGNME
 
 class UserEntryObserv(object):
     """
@@ -61,9 +135,6 @@ class UserEntryObserv(object):
         self.obsDefault = deepcopy(obsDefault)
 
         self.all_obses = None
-        self.all_pst_lines = None # should be a list of strings
-        self.all_ins_lines = None # should be a list of strings
-        self.all_obf_lines = None # should be a list of strings
 
         # this is expected to be directly written into self, by custom function
         self.batch_plot_entry = []
@@ -77,9 +148,16 @@ class UserEntryObserv(object):
             self.customFilter,
             str(self.obsDefault),
             ''])
+    def __getstate__(self):
+        """ plots and coverage are only needed by gopest init, they are not
+        kept when pickled into an observation plan """
+        state = self.__dict__.copy()
+        state['batch_plot_entry'] = []
+        state['coverage'] = {}
+        return state
     def makeObsDataInsLines(self,geo,dat):
-        """ generate a tuple of two lists:
-            - list of Pest * observation data """
+        """ generate self.all_obses, the list of PestObservation, which are
+        written into .pst and .ins by write_obs_data() and write_ins() """
         # maybe + ('%5s' % str(self.obsInfo[0])) with fill?
         if self.obsDefault.OBSNME == '':
             newBaseName = PestObsDataName().newName(OBS_ALIAS[self.obsType])
@@ -93,22 +171,15 @@ class UserEntryObserv(object):
         ### this line does all the work
         self.all_obses = OBS_USER_FUNC[self.obsType+'_fielddata'](geo,dat,self)
 
-        self.all_pst_lines = []
-        self.all_ins_lines = []
-        for obs in self.all_obses:
-            self.all_ins_lines.append('l1 [%s]21:41' % obs.OBSNME)
-            self.all_pst_lines.append(' %-20s %20.13e %12.5e %s' % (obs.OBSNME,
-                obs.OBSVAL,obs.WEIGHT,obs.OBGNME))
-
-    def makeObfLines(self,geo,dat,lst):
-        """ generate a list of:
-            - values for obf file that PEST requires """
+    def makeObfValues(self,geo,dat,lst):
+        """ returns model values of self.all_obses for obf file that PEST
+        requires.  Nothing is kept in self, which may be shared by the runs of
+        an agent daemon. """
 
         ### this line does all the work
         obfValues = OBS_USER_FUNC[self.obsType+'_modelresult'](geo,dat,lst,self)
-        self.all_obf_lines = []
-        for (v,obs) in zip(obfValues,self.all_obses):
-            self.all_obf_lines.append('%-20s %20.13e' % (obs.OBSNME,v))
+        # extra values (or obses) are dropped, as zip() used to
+        return obfValues[:len(self.all_obses)]
 
 def readUserObservation(userListName):
     """ returns a list of UserEntryObserv from reading the file with name
@@ -160,37 +231,110 @@ def readUserObservation(userListName):
                 obsDefault))
     return userEntries
 
-def generate_obses_and_ins(fgeo, fdat, insToWrite, fobses, fplts='goPESTobs.json', fcovs='goPESTobs.coverage'):
+def plan_sources(fgeo):
+    """ returns list of files an observation plan made with geometry fgeo
+    depends on, apart from goPESTobs.list: the geometry, the original model
+    input and the field data files loaded since obs_def.field_files_loaded
+    was cleared.  The model input used by gopest init (last of the sequence)
+    is rewritten by every forward run, the original input stands for it. """
+    from gopest.common import runtime
+    return ([fgeo, runtime['filename']['dat_orig']] +
+            sorted(obs_def.field_files_loaded))
+
+def _file_stamp(fn):
+    """ (size, mtime_ns, content hash) of file fn, None if it is missing """
+    if not os.path.isfile(fn):
+        return None
+    st = os.stat(fn)
+    return (st.st_size, st.st_mtime_ns, file_hash(fn))
+
+def _file_changed(fn, stamp):
+    """ True if file fn no longer matches stamp, content is only hashed if
+    size or modification time differ """
+    if not os.path.isfile(fn) or stamp is None:
+        return os.path.isfile(fn) or stamp is not None
+    st = os.stat(fn)
+    if (st.st_size, st.st_mtime_ns) == stamp[:2]:
+        return False
+    return st.st_size != stamp[0] or file_hash(fn) != stamp[2]
+
+def save_obs_plan(userEntries, fplan, userlistname='goPESTobs.list', sources=()):
+    """ Saves user entries (after *_fielddata has been run) as an observation
+    plan.  The plan holds all observation names and whatever extraction info
+    the _fielddata functions stored in each obs, so forward runs can skip
+    re-processing goPESTobs.list and all the field data files.  The plan is
+    outdated once goPESTobs.list or any of the sources (see plan_sources())
+    is modified. """
+    plan = {
+        'version': OBS_PLAN_VERSION,
+        'list_hash': file_hash(userlistname),
+        'sources': dict([(fn, _file_stamp(fn)) for fn in sources]),
+        'entries': userEntries,
+    }
+    # replaced, not overwritten, slave directories may hardlink the old one
+    ftmp = '%s.%i.tmp' % (fplan, os.getpid())
+    with open(ftmp, 'wb') as f:
+        pickle.dump(plan, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(ftmp, fplan)
+
+def load_obs_plan(fplan, userlistname='goPESTobs.list'):
+    """ Returns list of UserEntryObserv saved by save_obs_plan(), ready for
+    makeObfValues().  Returns None if the plan does not exist, or is outdated,
+    ie. goPESTobs.list or any of the plan's sources has been modified since
+    gopest init.  The plan is kept in memory by an agent daemon, see
+    resident_load(). """
+    if fplan is None:
+        return None
+    plan = resident_load(_load_obs_plan, fplan, userlistname)
+    if plan is None:
+        return None
+    for fn,stamp in sorted(plan['sources'].items()):
+        if _file_changed(fn, stamp):
+            print("Warning! '%s' changed since observation plan '%s' was made, " \
+                  "ignored.  Re-run 'gopest init' to update." % (fn, fplan))
+            return None
+    return plan['entries']
+
+def _load_obs_plan(fplan, userlistname):
+    if not os.path.isfile(fplan):
+        return None
+    try:
+        with open(fplan, 'rb') as f:
+            plan = pickle.load(f)
+    except Exception as e:
+        print("Warning! Unable to load observation plan '%s': %s" % (fplan, str(e)))
+        return None
+    if plan.get('version') != OBS_PLAN_VERSION:
+        print("Warning! Observation plan '%s' is from an older goPEST, ignored." % fplan)
+        return None
+    if plan.get('list_hash') != file_hash(userlistname):
+        print("Warning! '%s' changed since observation plan '%s' was made, " \
+              "ignored.  Re-run 'gopest init' to update." % (userlistname, fplan))
+        return None
+    return plan
+
+def generate_obses_and_ins(fgeo, fdat, insToWrite, fobses, fplts='goPESTobs.json', fcovs='goPESTobs.coverage', fplan='goPESTobs.plan'):
     """ reads goPESTobs.list and generate observation data lines and instruction
-    file for PEST """
-    # reset unique obs name
-    obs_def.obsBaseNameCount = {}
+    file for PEST.  An observation plan is also saved (if fplan is not None) for
+    read_from_real_model() to use, as well as the geometry cache. """
+    reset_obs_names()
     geo = mulgrid(fgeo)
     if fdat.endswith('.json'):
-        with open(fdat, 'r') as f:
-            dat = json.load(f)
+        dat = load_json(fdat)
     else:
         dat = t2data(fdat)
 
     userEntries = readUserObservation('goPESTobs.list')
-    pstLines, insLines, plots, coverage = [], [], [], {}
+    obs_def.field_files_loaded.clear()
+    obses, plots, coverage = [], [], {}
     for ue in userEntries:
         ue.makeObsDataInsLines(geo,dat)
-        pstLines = pstLines + ue.all_pst_lines
-        insLines = insLines + ue.all_ins_lines
+        obses.extend(ue.all_obses)
         plots += ue.batch_plot_entry
         coverage = merge_dols(coverage, ue.coverage)
 
-    f = open(insToWrite, 'w')
-    f.write('pif #\n')
-    for line in insLines:
-        f.write(line+'\n')
-    f.close()
-
-    obs = open(fobses, 'w')
-    for line in pstLines:
-        obs.write(line + '\n')
-    obs.close()
+    write_ins(insToWrite, obses)
+    write_obs_data(fobses, obses)
 
     plt = open(fplts, 'w')
     json.dump(plots, plt, indent=4, sort_keys=True)
@@ -200,37 +344,103 @@ def generate_obses_and_ins(fgeo, fdat, insToWrite, fobses, fplts='goPESTobs.json
     json.dump(coverage, cov, indent=4, sort_keys=True)
     cov.close()
 
-def read_from_real_model(fgeo, fdat, flst, fobf, waiwera=False):
-    """ This reads TOUGH2's results and write in appropriate format into obf
-    file for PEST """
-    # reset unique obs name
-    obs_def.obsBaseNameCount = {}
-    geo = mulgrid(fgeo)
+    if fplan is not None:
+        save_obs_plan(userEntries, fplan, sources=plan_sources(fgeo))
+    # geo now has the spatial indices and well tracks used by obs
+    save_geometry_cache(geo, fgeo)
+
+def load_model(fgeo, fdat, waiwera=False):
+    """ returns (geo, dat) of the model, dat is the parsed JSON if waiwera """
+    geo = load_geometry(fgeo)
     if waiwera:
-        with open(fdat, 'r') as f:
-            dat = json.load(f)
-        lst = wlisting(flst, geo, fjson=fdat)
+        dat = load_json(fdat)
     else:
         dat = t2data(fdat)
-        if flst.lower().endswith('.h5'):
-            lst = t2listingh5(flst)
-        else:
-            lst = t2listing(flst)
+    return geo, dat
 
-    userEntries = readUserObservation('goPESTobs.list')
-    obfLines = []
-    for ue in userEntries:
-        ue.makeObsDataInsLines(geo,dat)
-        ue.makeObfLines(geo,dat,lst)
-        obfLines = obfLines + ue.all_obf_lines
+def open_listing(fgeo, flst, geo, dat, waiwera=False, face_cache=True):
+    """ returns a (read-only) listing object of model results flst, dat is the
+    model input as returned by load_model().  The face cache of fgeo is not
+    used (nor written) if face_cache is False. """
+    if waiwera:
+        fcache = face_cache_filename(fgeo) if face_cache else None
+        return wlisting(flst, geo, fjson=dat, face_cache=fcache)
+    elif flst.lower().endswith('.h5'):
+        return t2listingh5(flst)
+    else:
+        return t2listing(flst)
+
+# (geo, dat, lst) opened by each obs worker process, see _init_obs_worker()
+_obs_worker_model = None
+
+def _init_obs_worker(fgeo, fdat, flst, waiwera):
+    global _obs_worker_model
+    reset_obs_names()
+    geo, dat = load_model(fgeo, fdat, waiwera)
+    lst = open_listing(fgeo, flst, geo, dat, waiwera)
+    _obs_worker_model = (geo, dat, lst)
+
+def _obf_values_worker(ue):
+    geo, dat, lst = _obs_worker_model
+    return ue.makeObfValues(geo, dat, lst)
+
+def make_obf_values_parallel(fgeo, fdat, flst, userEntries, workers, waiwera=False):
+    """ Runs makeObfValues() of userEntries in a pool of worker processes,
+    each worker loads the model and opens its own handle of the model results.
+    Returns list of values of each of userEntries. """
+    from multiprocessing import Pool
+    chunksize = max(1, len(userEntries) // (workers * 4))
+    with Pool(workers, initializer=_init_obs_worker,
+              initargs=(fgeo, fdat, flst, waiwera)) as pool:
+        return pool.map(_obf_values_worker, userEntries, chunksize=chunksize)
+
+def collect_obf(userEntries, all_values):
+    """ returns (names, values) of all userEntries, from all_values (values
+    of each entry, as returned by makeObfValues()) """
+    names, values = [], []
+    for ue,vs in zip(userEntries, all_values):
+        names.extend([obs.OBSNME for obs in ue.all_obses[:len(vs)]])
+        values.extend(vs)
+    return names, values
+
+def read_from_real_model(fgeo, fdat, flst, fobf, waiwera=False, fplan='goPESTobs.plan',
+                         workers=1, dat=None):
+    """ This reads TOUGH2's results and write in appropriate format into obf
+    file for PEST.  If a valid observation plan exists, the field data
+    processing of goPESTobs.list is skipped.  Otherwise the field data is
+    processed for this run only, the plan is not saved here, as forward runs
+    of slaves share (hardlink) the plan made by generate_obses_and_ins().
+
+    If workers > 1, observations of each user entry are extracted by a pool of
+    worker processes, see make_obf_values_parallel().
+
+    If the model input of fdat is already in memory (eg. kept by run_ns_pr()),
+    it can be passed in as dat so fdat is not loaded again. """
+    reset_obs_names()
+    if dat is None:
+        geo, dat = load_model(fgeo, fdat, waiwera)
+    else:
+        geo = load_geometry(fgeo)
 
-    if flst.lower().endswith('.listing'):
-        lst.close()
+    userEntries = load_obs_plan(fplan)
+    if userEntries is None:
+        userEntries = readUserObservation('goPESTobs.list')
+        obs_def.field_files_loaded.clear()
+        for ue in userEntries:
+            ue.makeObsDataInsLines(geo,dat)
 
-    f = open(fobf,'w')
-    for line in obfLines:
-        f.write(line+'\n')
-    f.close()
+    if workers > 1 and len(userEntries) > 1:
+        all_values = make_obf_values_parallel(fgeo, fdat, flst, userEntries,
+                                              min(workers, len(userEntries)),
+                                              waiwera=waiwera)
+    else:
+        lst = open_listing(fgeo, flst, geo, dat, waiwera)
+        all_values = [ue.makeObfValues(geo,dat,lst) for ue in userEntries]
+        if flst.lower().endswith('.listing'):
+            lst.close()
+
+    names, values = collect_obf(userEntries, all_values)
+    write_obf(fobf, names, values)
 
 def goPESTobs(argv=[]):
     START_TIME = time.time()
@@ -255,42 +465,14 @@ def goPESTobs(argv=[]):
                                fobses, fplts, fcovs)
 
     if len(argv) == 5:
-        
         fgeo = argv[1]
         fdat = argv[2]
         flst = argv[3]
         obfToWrite = argv[4]
 
-        geo = mulgrid(fgeo)
-        if fdat.lower().endswith('.json'):
-            with open(fdat, 'r') as f:
-                dat = json.load(f)
-        else:
-            dat = t2data(fdat)
-        
-        if flst.lower().endswith('.listing'):
-            lst = t2listing(flst)
-        elif flst.lower().endswith('.h5'):
-            if fdat.lower().endswith('.json'):
-                lst = wlisting(flst, geo, fjson=fdat)
-            else:
-                lst = t2listingh5(flst)
-
-
+        read_from_real_model(fgeo, fdat, flst, obfToWrite,
+                             waiwera=fdat.lower().endswith('.json'))
 
-        userEntries = readUserObservation(userlistname)
-        obfLines = []
-        for ue in userEntries:
-            ue.makeObsDataInsLines(geo,dat)
-            ue.makeObfLines(geo,dat,lst)
-            obfLines = obfLines + ue.all_obf_lines
-
-
-        f = open(obfToWrite,'w')
-        for line in obfLines:
-            f.write(line+'\n')
-        f.close()
-        
     # print('goPESTobs finished after', (time.time() - START_TIME), 'seconds')
         
 
@@ -18,7 +18,14 @@
 # customFilter is a string that can be evaluated by the code to eg. limit range of
 #     data etc
 # obsDefault is an PestObservData object, the .OBSNME is the basename that should be
-#     used for all created obs, other properties used as default.
+#     used for all created obs, other properties used as default.  Each obs is
+#     created by obsDefault.new(), a slotted PestObservation.
+#
+# _modelresult is called on every forward run, after userEntry.all_obses has
+#     been set from _fielddata (usually loaded from the observation plan saved
+#     by gopest init).  Anything _modelresult needs from the field data should
+#     be kept in the obses (eg. obs._block_, obs._mtime_), rather than by
+#     reading the field data file or calling _fielddata again.
 #
 # Each Observation is specified like this:
 # [Obs]
@@ -39,6 +46,9 @@
 #
 # I have done something major to allow the more flexible ways of specifying each observation.
 
+import os
+import re
+
 from gopest.common import config as cfg
 
 if 'waiwera' in cfg['simulator']['executable']:
@@ -174,7 +184,6 @@ def external_fielddata(geo, dat, userEntry):
     code next time.  Further investigation for best design is required.
     """
     import numpy as np
-    from copy import deepcopy
 
     obsInfo = userEntry.obsInfo
     customFilter = userEntry.customFilter
@@ -188,7 +197,7 @@ def external_fielddata(geo, dat, userEntry):
             raise Exception
         ### single values
         expected = float(expected)
-        obs = deepcopy(obsDefault)
+        obs = obsDefault.new()
         obs.OBSNME = unique_obs_name(obs.OBSNME, key)
         obs.OBSVAL = float(expected)
         obses.append(obs)
@@ -197,14 +206,14 @@ def external_fielddata(geo, dat, userEntry):
         if isinstance(expected[0], tuple):
             # list of tuples
             for x,y in expected:
-                obs = deepcopy(obsDefault)
+                obs = obsDefault.new()
                 obs.OBSNME = unique_obs_name(obs.OBSNME, key)
                 obs.OBSVAL = y
                 obses.append(obs)
         elif isinstance(expected[0], float) or isinstance(expected[0], int):
             # list of values
             for y in expected:
-                obs = deepcopy(obsDefault)
+                obs = obsDefault.new()
                 obs.OBSNME = unique_obs_name(obs.OBSNME, key)
                 obs.OBSVAL = y
                 obses.append(obs)
@@ -214,13 +223,11 @@ def external_fielddata(geo, dat, userEntry):
 
 def external_modelresult(geo, dat, lst, userEntry):
     import numpy as np
-    import json
     obsInfo = userEntry.obsInfo
     customFilter = userEntry.customFilter
     obsDefault = userEntry.obsDefault
 
-    with open(obsInfo[0], 'r') as f:
-        data = json.load(f)
+    data = load_field_json(obsInfo[0])
     key = eval(obsInfo[1])        # usually use string as data key
 
     values = []
@@ -260,8 +267,7 @@ def ns_gener_enthalpy_fielddata(geo, dat, userEntry):
     expected_value = float(obsInfo[1])
 
     obses = []
-    from copy import deepcopy
-    obs = deepcopy(obsDefault)
+    obs = obsDefault.new()
     obs.OBSNME = unique_obs_name(obs.OBSNME, gname)
     obs.OBSVAL = float(expected_value)
     obses.append(obs)
@@ -294,8 +300,7 @@ def ns_gener_rate_fielddata(geo, dat, userEntry):
     expected_value = float(obsInfo[1])
 
     obses = []
-    from copy import deepcopy
-    obs = deepcopy(obsDefault)
+    obs = obsDefault.new()
     obs.OBSNME = unique_obs_name(obs.OBSNME, gname)
     obs.OBSVAL = float(expected_value)
     obses.append(obs)
@@ -327,8 +332,7 @@ def target_time_fielddata(geo, dat, userEntry):
     expected_value = float(eval(obsInfo[0]))
 
     obses = []
-    from copy import deepcopy
-    obs = deepcopy(obsDefault)
+    obs = obsDefault.new()
     obs.OBSNME = unique_obs_name(obs.OBSNME, 'Se')
     obs.OBSVAL = float(expected_value)
     obses.append(obs)
@@ -379,8 +383,7 @@ def totalheat_fielddata(geo,dat,userEntry):
         ap = ''
 
     obses = []
-    from copy import deepcopy
-    obs = deepcopy(obsDefault)
+    obs = obsDefault.new()
     obs.OBSNME = unique_obs_name(obs.OBSNME, eval(obsInfo[1]) + ap)
     obs.OBSVAL = float(expected_value)
     obses.append(obs)
@@ -407,8 +410,7 @@ def totalupflow_fielddata(geo,dat,userEntry):
         ap = ''
 
     obses = []
-    from copy import deepcopy
-    obs = deepcopy(obsDefault)
+    obs = obsDefault.new()
     obs.OBSNME = unique_obs_name(obs.OBSNME, eval(obsInfo[1]) + ap)
     obs.OBSVAL = float(expected_value)
     obses.append(obs)
@@ -446,8 +448,7 @@ def heatflowminimum_fielddata(geo,dat,userEntry):
         obsBaseNameCount[baseName] = 0
     obses = []
     obsBaseNameCount[baseName] += 1
-    from copy import deepcopy
-    obs = deepcopy(obsDefault)
+    obs = obsDefault.new()
     obs.OBSNME = baseName +'_'+ ('%04d' % obsBaseNameCount[baseName])
     obs.OBSVAL = expected_value
     obses.append(obs)
@@ -501,8 +502,7 @@ def heatflow_fielddata(geo,dat,userEntry):
         obsBaseNameCount[baseName] = 0
     obses = []
     obsBaseNameCount[baseName] += 1
-    from copy import deepcopy
-    obs = deepcopy(obsDefault)
+    obs = obsDefault.new()
     obs.OBSNME = baseName +'_'+ ('%04d' % obsBaseNameCount[baseName])
     obs.OBSVAL = expected_value
     obses.append(obs)
@@ -570,20 +570,239 @@ def private_well_track_blocks(geo,wname):
         geo.wellblocks[wname] = (blocks, blocks_cen)
         return geo.wellblocks[wname]
 
-def _loadBlockTempFile(fname, customFilter):
-    """ get all block names and temp out of field data file """
-    from mulgrids import fix_blockname
-    allblks, alltemp = [], []
+# [DataFilter] expressions compiled, keyed by expression string, each is
+# (code, set of names used)
+_compiled_filters = {}
+
+def _code_names(code):
+    """ returns set of names used by code object, including nested ones (eg.
+    of comprehensions) """
+    names = set(code.co_names)
+    for c in code.co_consts:
+        if hasattr(c, 'co_names'):
+            names |= _code_names(c)
+    return names
+
+def _compile_filter(customFilter):
+    """ returns (code, names used) of [DataFilter] expression customFilter """
+    if customFilter not in _compiled_filters:
+        code = compile(customFilter.strip(), '<DataFilter>', 'eval')
+        _compiled_filters[customFilter] = (code, _code_names(code))
+    return _compiled_filters[customFilter]
+
+def filter_mask(customFilter, columns, context=None):
+    """ returns numpy bool array, True for rows of field data where the
+    [DataFilter] expression customFilter is true.  columns is a dict of data
+    name (eg. 'time', 'val', 'elev', 'temp') to sequence of values, context a
+    dict of other names the expression may use (eg. 'wname', usually the
+    caller's locals(), as the expression used to be eval'd there).
+
+    The expression is compiled once, and evaluated on whole numpy arrays.
+    Expressions that do not work on arrays (eg. 'and', chained comparisons),
+    string columns (eg. 'block') and expressions giving a single value that
+    depends on the columns (eg. 'time[0] > 1990') are evaluated row by row,
+    with the original values. """
+    import numpy as np
+    n = len(next(iter(columns.values())))
+    if customFilter.strip() == 'True':
+        return np.ones(n, dtype=bool)
+    code, used = _compile_filter(customFilter)
+    arrays = [(k, np.asarray(v)) for k,v in columns.items()]
+    if all(a.dtype.kind in 'biuf' for k,a in arrays):
+        names = dict(context or {})
+        names.update(arrays)
+        try:
+            with np.errstate(all='ignore'):
+                mask = np.asarray(eval(code, globals(), names))
+            if mask.dtype == bool and (mask.shape == (n,) or
+                    (mask.shape == () and not used & set(columns))):
+                return np.array(np.broadcast_to(mask, (n,)))
+        except Exception:
+            pass
+    names = dict(context or {})
+    mask = np.zeros(n, dtype=bool)
+    for i,row in enumerate(zip(*columns.values())):
+        names.update(zip(columns.keys(), row))
+        mask[i] = bool(eval(code, globals(), names))
+    return mask
+
+def filter_rows(customFilter, columns, context=None):
+    """ returns lists of columns (same order as dict columns) with only the rows
+    where customFilter is true, values are kept as they are, see filter_mask() """
+    from itertools import compress
+    mask = filter_mask(customFilter, columns, context)
+    return [list(compress(v, mask)) for v in columns.values()]
+
+# bump this whenever the content of field data cache files changes
+FIELD_CACHE_VERSION = 1
+
+# field data files parsed by this process, keyed by (kind, file name), each
+# is (size, mtime_ns, data)
+_field_data = {}
+
+# names of field data files loaded by load_field_data(), cleared by the caller
+# before *_fielddata is run, so an observation plan knows what it depends on
+field_files_loaded = set()
+
+# cache files of field data are not written if False, eg. while extracting
+# results of another directory, see phi.extract_obf()
+save_field_caches = True
+
+def field_cache_filename(fname):
+    """ binary cache file name of field data file fname """
+    return fname + '.cache'
+
+def _load_field_cache(fname, kind, st):
+    """ returns data of cache file of fname if it is of the same kind and up to
+    date (same size and mtime, or same content hash), None otherwise """
+    import pickle
+    from gopest.common import file_hash
+    fcache = field_cache_filename(fname)
+    if not os.path.isfile(fcache):
+        return None
+    try:
+        with open(fcache, 'rb') as f:
+            cache = pickle.load(f)
+    except Exception as e:
+        print("Warning! Unable to load field data cache '%s': %s" % (fcache, str(e)))
+        return None
+    if cache.get('version') != FIELD_CACHE_VERSION or cache.get('kind') != kind:
+        return None
+    if (cache['size'], cache['mtime_ns']) == (st.st_size, st.st_mtime_ns):
+        return cache['data']
+    if cache['size'] == st.st_size and cache['hash'] == file_hash(fname):
+        return cache['data']
+    return None
+
+def _save_field_cache(fname, kind, st, data):
+    """ saves parsed data of fname, silently skipped if not writable """
+    if not save_field_caches:
+        return
+    import pickle
+    from gopest.common import file_hash
+    fcache = field_cache_filename(fname)
+    cache = {
+        'version': FIELD_CACHE_VERSION,
+        'kind': kind,
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'hash': file_hash(fname),
+        'data': data,
+    }
+    ftmp = '%s.%i.tmp' % (fcache, os.getpid())
+    try:
+        with open(ftmp, 'wb') as f:
+            pickle.dump(cache, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(ftmp, fcache)
+    except OSError:
+        if os.path.exists(ftmp):
+            os.remove(ftmp)
+
+def load_field_data(fname, kind, parser):
+    """ Returns parser(fname), the parsed content of field data file fname.
+    Each file is parsed once, then served from memory for all obs entries
+    (and all runs of an agent daemon), and from the binary cache file (see
+    field_cache_filename()) by other processes, until the file is modified.
+    kind names the parser, the same file may be parsed differently.  The
+    caller must not modify the returned data. """
+    field_files_loaded.add(fname)
+    st = os.stat(fname)
+    key = (kind, os.path.abspath(fname))
+    if key in _field_data and _field_data[key][:2] == (st.st_size, st.st_mtime_ns):
+        return _field_data[key][2]
+    data = _load_field_cache(fname, kind, st)
+    if data is None:
+        data = parser(fname)
+        _save_field_cache(fname, kind, st, data)
+    _field_data[key] = (st.st_size, st.st_mtime_ns, data)
+    return data
+
+def _parse_json(fname):
+    import json
+    with open(fname, 'r') as f:
+        return json.load(f)
+
+def load_field_json(fname):
+    """ returns content of JSON field data file fname, see load_field_data() """
+    return load_field_data(fname, 'json', _parse_json)
+
+# first empty (or white space only) line, field data files end there
+_EMPTY_LINE = re.compile(r'^[ \t\r\f\v]*$', re.MULTILINE)
+
+def _parse_columns(fname, ncols):
+    import numpy as np
+    with open(fname, 'r') as f:
+        text = f.read()
+    m = _EMPTY_LINE.search(text)
+    if m is not None:
+        text = text[:m.start()]
+    lines = text.splitlines()
+    if not lines:
+        return [np.zeros(0) for i in range(ncols)]
+    data = np.loadtxt(lines, usecols=range(ncols), comments=None, ndmin=2)
+    return [data[:,i] for i in range(ncols)]
+
+def _read_columns(fname, ncols=2):
+    """ returns list of ncols numpy arrays, of the first ncols (white space
+    separated) numbers of each line of field data file fname, up to the first
+    empty line, see load_field_data() """
+    return load_field_data(fname, 'columns%i' % ncols,
+                           lambda f: _parse_columns(f, ncols))
+
+def _parse_lines(fname):
+    with open(fname, 'r') as f:
+        text = f.read()
+    m = _EMPTY_LINE.search(text)
+    if m is not None:
+        text = text[:m.start()]
+    return text.splitlines(True)
+
+def _read_lines(fname):
+    """ returns list of lines of field data file fname, up to the first empty
+    line, see load_field_data() """
+    return load_field_data(fname, 'lines', _parse_lines)
+
+def _read_filtered(fname, customFilter, names, context=None):
+    """ returns lists of the first len(names) columns of field data file fname,
+    only rows where customFilter is true, columns are called names in the
+    filter expression, and the text of each row is called 'line' """
+    cols = _read_columns(fname, len(names))
+    columns = dict(zip(names, cols))
+    if customFilter.strip() != 'True' and 'line' in _compile_filter(customFilter)[1]:
+        columns['line'] = _read_lines(fname)
+    mask = filter_mask(customFilter, columns, context)
+    return [c[mask].tolist() for c in cols]
+
+def _parse_block_temp(fname):
+    blocks, temps = [], []
     f = open(fname,'r')
     for line in f.readlines():
         if line.strip() == '': break
         block,temp = [eval(x) for x in line.split(',')[0:2]]
-        if eval(customFilter):
-            allblks.append(fix_blockname(block))
-            alltemp.append(float(temp))
+        blocks.append(block)
+        temps.append(temp)
     f.close()
+    return blocks, temps
+
+def _loadBlockTempFile(fname, customFilter):
+    """ get all block names and temp out of field data file """
+    from mulgrids import fix_blockname
+    blocks, temps = load_field_data(fname, 'blocktemp', _parse_block_temp)
+    columns = {'block': blocks, 'temp': temps}
+    if customFilter.strip() != 'True' and 'line' in _compile_filter(customFilter)[1]:
+        columns['line'] = _read_lines(fname)
+    blocks, temps = filter_rows(customFilter, columns)[:2]
+    allblks = [fix_blockname(b) for b in blocks]
+    alltemp = [float(t) for t in temps]
     return allblks, alltemp
 
+def _element_values(lst, blocks, field_name):
+    """ values of field_name for a list of blocks at lst's current time index,
+    uses table's bulk .take() if available (eg. t2listingh5) """
+    if hasattr(lst.element, 'take'):
+        return list(lst.element.take(blocks, field_name))
+    return [lst.element[b][field_name] for b in blocks]
+
 def blocktemperature_fielddata(geo,dat,userEntry):
     """ a user field data file is a list of blocks with oberved temperature """
     fieldDataFile = userEntry.obsInfo[1]
@@ -593,21 +812,18 @@ def blocktemperature_fielddata(geo,dat,userEntry):
     allblks, alltemp = _loadBlockTempFile(fieldDataFile, customFilter)
 
     from mulgrids import fix_blockname
-    from copy import deepcopy
     obses = []
     for (b,t) in zip(allblks,alltemp):
-        obs = deepcopy(obsDefault)
+        obs = obsDefault.new()
         obs.OBSNME = unique_obs_name(obsDefault.OBSNME, fix_blockname(b))
         obs.OBSVAL = t
+        obs._block_ = b
         obses.append(obs)
     return obses
 
 def blocktemperature_modelresult(geo,dat,lst,userEntry):
     """ a user field data file is a list of blocks with oberved temperature """
-    fieldDataFile = userEntry.obsInfo[1]
-    customFilter = userEntry.customFilter
-
-    allblks, alltemp = _loadBlockTempFile(fieldDataFile, customFilter)
+    allblks = [obs._block_ for obs in userEntry.all_obses]
 
     vals = eval(userEntry.obsInfo[0])
     time = 0.0
@@ -619,7 +835,7 @@ def blocktemperature_modelresult(geo,dat,lst,userEntry):
 
     field_name = [c for c in lst.element.column_name if c.startswith(FIELD['temp'])][0]
 
-    return [lst.element[b][field_name] for b in allblks]
+    return _element_values(lst, allblks, field_name)
 
 def temperature_fielddata(geo,dat,userEntry):
     # ugly, need re-writting and remove repeative actions
@@ -635,15 +851,8 @@ def temperature_fielddata(geo,dat,userEntry):
         wname = fix_blockname(vals[0])
 
     # get temp vs elev from datafile first
-    allelev, alltemp = [], []
-    f = open(fieldDataFile,'r')
-    for line in f.readlines():
-        if line.strip() == '': break
-        elev,temp = [float(x) for x in line.split()[0:2]]
-        if eval(customFilter):
-            allelev.append(elev)
-            alltemp.append(temp)
-    f.close()
+    allelev, alltemp = _read_filtered(fieldDataFile, customFilter,
+                                      ['elev', 'temp'], locals())
 
     (bs, bs_c) = private_well_track_blocks(geo,wname)
     blocks, blocks_cen = [], []
@@ -663,52 +872,26 @@ def temperature_fielddata(geo,dat,userEntry):
     obses = []
     for (b,t) in zip(blocks,blocks_temp):
         obsBaseNameCount[baseName] += 1
-        from copy import deepcopy
-        obs = deepcopy(obsDefault)
+        obs = obsDefault.new()
         obs.OBSNME = baseName +'_'+ ('%04d' % obsBaseNameCount[baseName])
         obs.OBSVAL = t
+        obs._block_ = b
         obses.append(obs)
     return obses
 
 def temperature_modelresult(geo,dat,lst,userEntry):
-    # ugly, need re-writting and remove repeative actions
-    # maybe communication between pre- and post - process is still needed
-    fieldDataFile = userEntry.obsInfo[1]
-    customFilter = userEntry.customFilter
-    obsDefault = userEntry.obsDefault
-    from mulgrids import fix_blockname
+    # well track blocks within the field data's elevations, from fielddata
+    blocks = [obs._block_ for obs in userEntry.all_obses]
     vals = eval(userEntry.obsInfo[0])
     time = 0.0
-    if isinstance(vals,str):
-        # only wellname is specified
-        wname = fix_blockname(vals)
-    elif isinstance(vals,tuple):
-        wname = fix_blockname(vals[0])
-        if len(vals) == 2:
-            time = float(vals[1])
-
-    # get temp vs elev from datafile first
-    allelev, alltemp = [], []
-    f = open(fieldDataFile,'r')
-    for line in f.readlines():
-        if line.strip() == '': break
-        elev,temp = [float(x) for x in line.split()[0:2]]
-        if eval(customFilter):
-            allelev.append(elev)
-            alltemp.append(temp)
-    f.close()
-
-    (bs, bs_c) = private_well_track_blocks(geo,wname)
-    blocks = []
-    for (b,c) in zip(bs, bs_c):
-        if allelev[-1] <= c <= allelev[0]:
-            blocks.append(b)
+    if isinstance(vals,tuple) and len(vals) == 2:
+        time = float(vals[1])
 
     import numpy as np
     lst.index = np.abs(lst.fulltimes-time).argmin()
 
     field_name = [c for c in lst.element.column_name if c.startswith(FIELD['temp'])][0]
-    return [lst.element[b][field_name] for b in blocks]
+    return _element_values(lst, blocks, field_name)
 
 def temperature_thickness_fielddata(geo,dat,userEntry):
     """ This is very simialr to the norml temperature obs type, only that the
@@ -727,15 +910,8 @@ def temperature_thickness_fielddata(geo,dat,userEntry):
         wname = fix_blockname(vals[0])
 
     # get temp vs elev from datafile first
-    allelev, alltemp = [], []
-    f = open(fieldDataFile,'r')
-    for line in f.readlines():
-        if line.strip() == '': break
-        elev,temp = [float(x) for x in line.split()[0:2]]
-        if eval(customFilter):
-            allelev.append(elev)
-            alltemp.append(temp)
-    f.close()
+    allelev, alltemp = _read_filtered(fieldDataFile, customFilter,
+                                      ['elev', 'temp'], locals())
 
     (bs, bs_c) = private_well_track_blocks(geo,wname)
     blocks, blocks_cen, blocks_thickness = [], [], []
@@ -765,11 +941,11 @@ def temperature_thickness_fielddata(geo,dat,userEntry):
         userEntry.coverage[obsDefault.OBGNME] = []
     for (b,t,h) in zip(blocks,blocks_temp, blocks_thickness):
         obsBaseNameCount[baseName] += 1
-        from copy import deepcopy
-        obs = deepcopy(obsDefault)
+        obs = obsDefault.new()
         obs.OBSNME = baseName +'_'+ ('%04d' % obsBaseNameCount[baseName])
         obs.OBSVAL = t
         obs.WEIGHT = h * obsDefault.WEIGHT
+        obs._block_ = b
         userEntry.coverage[obsDefault.OBGNME].append(b)
         obses.append(obs)
     return obses
@@ -853,10 +1029,8 @@ def temp_interp_thickness_json_fielddata(geo,dat,userEntry):
     obsDefault = userEntry.obsDefault
     tFactor = 365.25*24.*60.*60.
 
-    import json
     # 1st line is json file name (of all wells)
-    with open(jfilename, 'r') as f:
-        t_bywell = json.load(f)
+    t_bywell = load_field_json(jfilename)
 
     obses = []
 
@@ -867,22 +1041,24 @@ def temp_interp_thickness_json_fielddata(geo,dat,userEntry):
         else:
             geo_wname = wname
         time = t_bywell[wname]['time']
-        allelev, alltemp = [], []
-        for elev,temp in zip(t_bywell[wname]['elevations'],
-                             t_bywell[wname]['temperatures']):
-            if eval(customFilter):
-                allelev.append(elev)
-                alltemp.append(temp)
+        allelev, alltemp = filter_rows(customFilter, {
+            'elev': t_bywell[wname]['elevations'],
+            'temp': t_bywell[wname]['temperatures'],
+            }, locals())
 
         # bis, wps, es = blk indices, well positions, elevations
         bis, wps, es = _well_interp_layers(geo_wname, geo)
+        alltemp_raw = t_bywell[wname]['temperatures']
+        # layers are filtered by the same expression, temp is the last data
+        context = dict(locals(), temp=(alltemp_raw[-1] if alltemp_raw else None))
+        in_filter = filter_mask(customFilter, {'elev': es}, context)
         blocks, blocks_cen, blocks_thickness = [], [], []
         bis2, wps2, es2, bhs2 = [], [], [], []
-        for bidx, wpos, elev in zip(bis, wps, es):
+        for bidx, wpos, elev, ok in zip(bis, wps, es, in_filter):
             if elev > allelev[0] or elev < allelev[-1]:
                 # skip if out of field data range
                 continue
-            if eval(customFilter):
+            if ok:
                 bis2.append(bidx)
                 wps2.append(wpos)
                 es2.append(elev)
@@ -907,8 +1083,7 @@ def temp_interp_thickness_json_fielddata(geo,dat,userEntry):
 
         for bidx,pos,t,h in zip(bis2, wps2, blocks_temp, bhs2):
             obsBaseNameCount[baseName] += 1
-            from copy import deepcopy
-            obs = deepcopy(obsDefault)
+            obs = obsDefault.new()
             obs.OBSNME = baseName +'_'+ ('%04d' % obsBaseNameCount[baseName])
             obs.OBSVAL = t
             obs.WEIGHT = h * obsDefault.WEIGHT
@@ -943,7 +1118,7 @@ def temp_interp_thickness_json_modelresult(geo,dat,lst,userEntry):
             break
     print('+++ use field: %s' % field_name)
 
-    obses = temp_interp_thickness_json_fielddata(geo, dat, userEntry)
+    obses = userEntry.all_obses
     vals = []
 
     t_prev = obses[0]._dtime_
@@ -980,10 +1155,8 @@ def temperature_thickness_json_fielddata(geo,dat,userEntry):
     obsDefault = userEntry.obsDefault
     tFactor = 365.25*24.*60.*60.
 
-    import json
     # 1st line is json file name (of all wells)
-    with open(jfilename, 'r') as f:
-        t_bywell = json.load(f)
+    t_bywell = load_field_json(jfilename)
 
     obses = []
 
@@ -994,11 +1167,10 @@ def temperature_thickness_json_fielddata(geo,dat,userEntry):
         else:
             geo_wname = wname
         time = t_bywell[wname]['time']
-        allelev, alltemp = [], []
-        for elev,temp in zip(t_bywell[wname]['elevations'], t_bywell[wname]['temperatures']):
-            if eval(customFilter):
-                allelev.append(elev)
-                alltemp.append(temp)
+        allelev, alltemp = filter_rows(customFilter, {
+            'elev': t_bywell[wname]['elevations'],
+            'temp': t_bywell[wname]['temperatures'],
+            }, locals())
 
         if len(allelev) <= 1:
             print('temperature_thickness_json: User entry has no data, skipping: %s' % wname)
@@ -1025,8 +1197,7 @@ def temperature_thickness_json_fielddata(geo,dat,userEntry):
             userEntry.coverage[obsDefault.OBGNME] = []
         for (b,t,h) in zip(blocks,blocks_temp, blocks_thickness):
             obsBaseNameCount[baseName] += 1
-            from copy import deepcopy
-            obs = deepcopy(obsDefault)
+            obs = obsDefault.new()
             obs.OBSNME = baseName +'_'+ ('%04d' % obsBaseNameCount[baseName])
             obs.OBSVAL = t
             obs.WEIGHT = h * obsDefault.WEIGHT
@@ -1053,20 +1224,17 @@ def temperature_thickness_json_fielddata(geo,dat,userEntry):
 
 def temperature_thickness_json_modelresult(geo,dat,lst,userEntry):
     import numpy as np
-    obses = temperature_thickness_json_fielddata(geo, dat, userEntry)
+    obses = userEntry.all_obses
     vals = []
-    t_prev = obses[0]._dtime_
-    lst.index = np.abs(lst.fulltimes-t_prev).argmin()
+    t_prev, blocks = obses[0]._dtime_, []
     for obs in obses:
-        b = obs._block_
-        t = obs._dtime_
-
-        # TODO, this is slow, can be much faster
-        if t != t_prev:
-            lst.index = np.abs(lst.fulltimes-t).argmin()
-            t_prev = t
-
-        vals.append(lst.element[b][FIELD['temp']])
+        if obs._dtime_ != t_prev:
+            lst.index = np.abs(lst.fulltimes-t_prev).argmin()
+            vals += _element_values(lst, blocks, FIELD['temp'])
+            t_prev, blocks = obs._dtime_, []
+        blocks.append(obs._block_)
+    lst.index = np.abs(lst.fulltimes-t_prev).argmin()
+    vals += _element_values(lst, blocks, FIELD['temp'])
     return vals
 
 def temperature_plot(wname, time, elevs, temps, obsname, title):
@@ -1105,8 +1273,7 @@ def pressure_modelresult(geo,dat,lst,userEntry):
     from mulgrids import fix_blockname
     # name,timelist
     name = fix_blockname(eval(userEntry.obsInfo[0]))
-    entries = private_history_data(userEntry, 100000.0, 365.25*24.*60.*60.)
-    obses, timelist = zip(*entries)
+    timelist = private_model_times(userEntry)
     tbl = lst.history([('e',name,'Pressure')])
     if tbl is None:
         raise Exception("Observation (type pressure) '%s' does not match any block." % name)
@@ -1140,8 +1307,7 @@ def pressure_by_well_modelresult(geo,dat,lst,userEntry):
         raise Exception("Obs type 'pressure_by_well' well %s at %f is outside of the model." % (wname, elev))
 
     # print wname, elev, name
-    entries = private_history_data(userEntry, 100000.0, 365.25*24.*60.*60.)
-    obses, timelist = zip(*entries)
+    timelist = private_model_times(userEntry)
     tbl = lst.history([('e',name,'Pressure')])
     if tbl is None:
         raise Exception("Obs failed to extract Pressure for block %s." % name)
@@ -1229,17 +1395,10 @@ def pressure_block_average_fielddata(geo, dat, userEntry):
         wname, elev, fwell = eval(oline)
         elev = float(elev)
 
-        f = open(fwell,'r')
-        times, vals = [], []
-        for line in f.readlines():
-            if line.strip() == '': break
-            time,val = [float(x) for x in line.split()[0:2]]
-            if eval(customFilter):
-                times.append(time), vals.append(val)
-        f.close()
+        times, vals = _read_filtered(fwell, customFilter, ['time', 'val'],
+                                     locals())
 
         if len(times) == 0:
-            f.close()
             raise Exception("Pressure file: %s yields no observation" % fwell)
 
         desired_times = obsDefault._DESIRED_DATA_TIMES
@@ -1282,14 +1441,13 @@ def pressure_block_average_fielddata(geo, dat, userEntry):
             avgp.append(sum(bp_times[t]) / len(bp_times[t]))
 
         from gopest.common import private_cleanup_name
-        from copy import deepcopy
         baseName = obsDefault.OBSNME +'_'+ private_cleanup_name(b)
         if baseName not in obsBaseNameCount:
             obsBaseNameCount[baseName] = 0
         for time, val in zip(avgt, avgp):
             obsBaseNameCount[baseName] += 1
 
-            obs = deepcopy(obsDefault)
+            obs = obsDefault.new()
             obs.OBSNME = baseName +'_'+ ('%04d' % obsBaseNameCount[baseName])
             obs.OBSVAL = val * vFactor
             # additional for model result extraction
@@ -1308,7 +1466,7 @@ def pressure_block_average_fielddata(geo, dat, userEntry):
     return obses
 
 def pressure_block_average_modelresult(geo,dat,lst,userEntry):
-    obses = pressure_block_average_fielddata(geo, dat, userEntry)
+    obses = userEntry.all_obses
     bs, tss = [], []
     for obs in obses:
         b = obs._block_
@@ -1347,10 +1505,8 @@ def pressure_block_average_json_fielddata(geo, dat, userEntry):
     if any([not hasattr(obsDefault,a) for a in must_have]):
         raise Exception('Obs type pressure_block_average_json must have these default settings: ' + ', '.join(must_have))
 
-    import json
     # 1st line is json file name (of all wells)
-    with open(userEntry.obsInfo[0], 'r') as f:
-        p_bywell = json.load(f)
+    p_bywell = load_field_json(userEntry.obsInfo[0])
 
     p_byblock = {}
 
@@ -1359,13 +1515,10 @@ def pressure_block_average_json_fielddata(geo, dat, userEntry):
         elev = p_bywell[wname]['elevation']
 
         ts, vs = p_bywell[wname]['times'], p_bywell[wname]['pressures']
-        times, vals = [], []
-        for time, val in zip(ts, vs):
-            if eval(customFilter):
-                times.append(time), vals.append(val)
+        times, vals = filter_rows(customFilter, {'time': ts, 'val': vs},
+                                  locals())
 
         if len(times) == 0:
-            f.close()
             raise Exception("Pressure from %s: %s yields no observation" % (userEntry.obsInfo[0], wname))
 
         desired_times = obsDefault._DESIRED_DATA_TIMES
@@ -1424,14 +1577,13 @@ def pressure_block_average_json_fielddata(geo, dat, userEntry):
             avgp.append(sum(bp_times[t]) / len(bp_times[t]))
 
         from gopest.common import private_cleanup_name
-        from copy import deepcopy
         baseName = obsDefault.OBSNME +'_'+ private_cleanup_name(b)
         if baseName not in obsBaseNameCount:
             obsBaseNameCount[baseName] = 0
         for time, val in zip(avgt, avgp):
             obsBaseNameCount[baseName] += 1
 
-            obs = deepcopy(obsDefault)
+            obs = obsDefault.new()
             obs.OBSNME = baseName +'_'+ ('%04d' % obsBaseNameCount[baseName])
             obs.OBSVAL = val * vFactor
             # additional for model result extraction
@@ -1455,7 +1607,7 @@ def pressure_block_average_json_fielddata(geo, dat, userEntry):
     return obses
 
 def pressure_block_average_json_modelresult(geo,dat,lst,userEntry):
-    obses = pressure_block_average_json_fielddata(geo, dat, userEntry)
+    obses = userEntry.all_obses
     bs, tss = [], []
     for obs in obses:
         b = obs._block_
@@ -1537,7 +1689,6 @@ def private_boiling_plot(blockname, gener, datafile, timelist, obsname):
 
 def boiling_fielddata(geo, dat, userEntry):
     """ called by goPESTobs.py """
-    from copy import deepcopy
     from gopest.common import private_cleanup_name
     obsDefault = userEntry.obsDefault
 
@@ -1557,9 +1708,12 @@ def boiling_fielddata(geo, dat, userEntry):
             obsBaseNameCount[baseName] = 0
         for o, t in entries:
             obsBaseNameCount[baseName] += 1
-            obs = deepcopy(obsDefault)
+            obs = obsDefault.new()
             obs.OBSNME = baseName +'_'+ ('%04d' % obsBaseNameCount[baseName])
             obs.OBSVAL = 0.0
+            # additional for model result extraction
+            obs._block_ = b
+            obs._mtime_ = t
             psat_obses.append(obs)
         # generate batch plot entries
         userEntry.batch_plot_entry.append(private_boiling_plot(
@@ -1572,17 +1726,15 @@ def boiling_modelresult(geo, dat, lst, userEntry):
     from numpy import interp
     obsDefault = userEntry.obsDefault
 
-    entries = private_history_data_with_boiling(userEntry)
-    obses, timelist = map(list, zip(*entries))
-
-    name = eval(userEntry.obsInfo[0])
-    bs = private_all_blocks_in_geners(name, lst.generation.row_name)
-    if len(bs) == 0:
-        msg = 'No GENERs matches with ' + name
-        raise Exception(msg + "User entry yields no observation: " + str(userEntry))
+    bs, tss = [], []
+    for obs in userEntry.all_obses:
+        if obs._block_ not in bs:
+            bs.append(obs._block_)
+            tss.append([])
+        tss[-1].append(obs._mtime_)
     selection = []
     for b in bs:
-        # print "Boiling Block '%s' from '%s'" % (b, name)
+        # print "Boiling Block '%s'" % b
         selection.append(('e',b,FIELD['temp']))
         selection.append(('e',b,FIELD['pres']))
     tbl = lst.history(selection)
@@ -1594,7 +1746,7 @@ def boiling_modelresult(geo, dat, lst, userEntry):
         pdiff_to_boil = []
         for (t,p) in zip(ts,ps):
             pdiff_to_boil.append(p - sat(t))
-        pdiffs = interp(timelist,alltimes,np.array(pdiff_to_boil))
+        pdiffs = interp(tss[i],alltimes,np.array(pdiff_to_boil))
         allpdiffs += list(pdiffs)
     return allpdiffs
 
@@ -1631,8 +1783,7 @@ def enthalpy_fielddata(geo,dat,userEntry):
 def enthalpy_modelresult(geo,dat,lst,userEntry):
     # name,timelist
     name = eval(userEntry.obsInfo[0])
-    entries = private_history_data(userEntry, 1000.0, 365.25*24.*60.*60.)
-    obses, timelist = map(list, zip(*entries))
+    timelist = private_model_times(userEntry)
     """
     # nearest value
     import numpy as np
@@ -1721,10 +1872,8 @@ def enthalpy_json_fielddata(geo,dat,userEntry):
             final_weights[i] = final_weights[i] * (add_fac + 1.0)
         return final_weights
 
-    import json
     # 1st line is json file name (of all wells)
-    with open(jfilename, 'r') as f:
-        e_bywell = json.load(f)
+    e_bywell = load_field_json(jfilename)
 
     obses = []
 
@@ -1732,10 +1881,10 @@ def enthalpy_json_fielddata(geo,dat,userEntry):
     skipped_gradient = []
     for oline in userEntry.obsInfo[1:]:
         wname = eval(oline)
-        times, vals = [], []
-        for time,val in zip(e_bywell[wname]['times'], e_bywell[wname]['enthalpy']):
-            if eval(customFilter):
-                times.append(time), vals.append(val)
+        times, vals = filter_rows(customFilter, {
+            'time': e_bywell[wname]['times'],
+            'val': e_bywell[wname]['enthalpy'],
+            }, locals())
 
         if len(times) == 0:
             raise Exception("User entry yields no observation: %s" % wname + str(userEntry))
@@ -1770,8 +1919,7 @@ def enthalpy_json_fielddata(geo,dat,userEntry):
 
         for time, val, w in zip(final_times, final_vals, final_weights):
             obsBaseNameCount[baseName] += 1
-            from copy import deepcopy
-            obs = deepcopy(obsDefault)
+            obs = obsDefault.new()
             from gopest.common import private_cleanup_name
             obs.OBSNME = baseName +'_'+ ('%04d' % obsBaseNameCount[baseName])
             obs.OBSVAL = val * vFactor
@@ -1780,10 +1928,12 @@ def enthalpy_json_fielddata(geo,dat,userEntry):
 
         gpattern = wname
         if hasattr(obsDefault, '_WELL_TO_GENERS'):
-            import json
-            with open(obsDefault._WELL_TO_GENERS, 'r') as f:
-                well_to_geners_dict = json.load(f)
+            well_to_geners_dict = load_field_json(obsDefault._WELL_TO_GENERS)
             gpattern = well_to_geners_dict[wname]
+        # additional for model result extraction, gradients (if any) follow
+        for obs, time in zip(obses[len(obses)-len(final_times):], final_times):
+            obs._well_ = (wname, gpattern)
+            obs._mtime_ = time
 
         # generate batch plot entries
         plot = enthalpy_plot(
@@ -1809,8 +1959,7 @@ def enthalpy_json_fielddata(geo,dat,userEntry):
 
             for time, grad in zip(final_times, final_gradients):
                 obsBaseNameCount[baseName] += 1
-                from copy import deepcopy
-                obs = deepcopy(obsDefault)
+                obs = obsDefault.new()
                 from gopest.common import private_cleanup_name
                 obs.OBGNME = obs.OBGNME + '_g'
                 obs.OBSNME = baseName +'_'+ ('%04d' % obsBaseNameCount[baseName])
@@ -1830,55 +1979,29 @@ def private_remove_zeros(times, values):
     return np.array(ts), np.array(vs)
 
 def enthalpy_json_modelresult(geo,dat,lst,userEntry):
-    jfilename = userEntry.obsInfo[0]
-    customFilter = userEntry.customFilter
     offsetTime = userEntry.offsetTime
     obsDefault = userEntry.obsDefault
-    vFactor = 1.0 # assume given J/kg
     tFactor = 365.25*24.*60.*60. # assume given decimal years
 
-    import json
-    # 1st line is json file name (of all wells)
-    with open(jfilename, 'r') as f:
-        e_bywell = json.load(f)
-
-    if hasattr(obsDefault, '_WELL_TO_GENERS'):
-        with open(obsDefault._WELL_TO_GENERS, 'r') as f:
-            well_to_geners_dict = json.load(f)
+    # (well, gener pattern) and times of each well, worked out by _fielddata,
+    # gradient obses have no _well_
+    wells, tss = [], []
+    for obs in userEntry.all_obses:
+        well = getattr(obs, '_well_', None)
+        if well is None:
+            continue
+        if not wells or wells[-1] != well:
+            wells.append(well)
+            tss.append([])
+        tss[-1].append(obs._mtime_)
 
     alles = []
 
-    for oline in userEntry.obsInfo[1:]:
-        wname = eval(oline)
-        times, vals = [], []
-        for time,val in zip(e_bywell[wname]['times'], e_bywell[wname]['enthalpy']):
-            if eval(customFilter):
-                times.append(time), vals.append(val)
-
-        if len(times) == 0:
-            raise Exception("User entry yields no observation: " + str(userEntry))
-
-        if hasattr(obsDefault, '_DESIRED_DATA_TIMES'):
-            desired_times = obsDefault._DESIRED_DATA_TIMES
-            final_times = [t for t in desired_times if times[0] <= t <= times[-1]]
-            if hasattr(obsDefault, '_INTERP_LIMIT'):
-                interp_limit = obsDefault._INTERP_LIMIT
-                final_times = target_times(desired_times, interp_limit, list(zip(times,vals)))
-            if len(final_times) == 0:
-                raise Exception("User entry yields no observation: " + str(userEntry))
-            from numpy import interp
-            final_vals = list(interp(final_times,times,vals))
-        else:
-            final_times, final_vals = times, vals
-
+    for (wname, gpattern), final_times in zip(wells, tss):
         import numpy as np
         from mulgrids import unfix_blockname,fix_blockname
         allgs = lst.generation.row_name
 
-        gpattern = wname
-        if hasattr(obsDefault, '_WELL_TO_GENERS'):
-            gpattern = well_to_geners_dict[wname]
-
         import re
         pattern = re.compile(gpattern)
         gs = [(b,g) for (b,g) in allgs if pattern.match(unfix_blockname(g)) or pattern.match(g)]
@@ -1954,9 +2077,8 @@ def enthalpy_plot(gname, dataname, ts, es, title):
 
 def boiling_json_fielddata(geo, dat, userEntry):
     """ called by goPESTobs.py """
-    from copy import deepcopy
+    from itertools import compress
     from gopest.common import private_cleanup_name
-    import json
     import numpy as np
 
     jfilename = userEntry.obsInfo[0]
@@ -1973,8 +2095,7 @@ def boiling_json_fielddata(geo, dat, userEntry):
         eboil = userEntry.obsDefault._BOILING_ABOVE_ENTH
 
     # 1st line is json file name (of all wells)
-    with open(jfilename, 'r') as f:
-        e_bywell = json.load(f)
+    e_bywell = load_field_json(jfilename)
 
     obses = []
     boiling_blocks, blk_gener = [], {}
@@ -1983,16 +2104,13 @@ def boiling_json_fielddata(geo, dat, userEntry):
         wname = eval(oline)
         gpattern = wname
         if hasattr(obsDefault, '_WELL_TO_GENERS'):
-            import json
-            with open(obsDefault._WELL_TO_GENERS, 'r') as f:
-                well_to_geners_dict = json.load(f)
+            well_to_geners_dict = load_field_json(obsDefault._WELL_TO_GENERS)
             gpattern = well_to_geners_dict[wname]
 
-        times, vals = [], []
-        for time,val in zip(e_bywell[wname]['times'], e_bywell[wname]['enthalpy']):
-            if eval(customFilter):
-                if val >= eboil:
-                    times.append(time), vals.append(val)
+        ts, es = e_bywell[wname]['times'], e_bywell[wname]['enthalpy']
+        boiling = filter_mask(customFilter, {'time': ts, 'val': es}, locals())
+        boiling &= np.asarray(es, dtype=float) >= eboil
+        times, vals = list(compress(ts, boiling)), list(compress(es, boiling))
 
         if len(times) == 0:
             print(wname, e_bywell[wname]['times'], e_bywell[wname]['enthalpy'])
@@ -2034,7 +2152,7 @@ def boiling_json_fielddata(geo, dat, userEntry):
             #     obsBaseNameCount[baseName] = 0
             for time, val in zip(final_times, final_vals):
                 # obsBaseNameCount[baseName] += 1
-                obs = deepcopy(obsDefault)
+                obs = obsDefault.new()
                 # obs.OBSNME = baseName +'_'+ ('%04d' % obsBaseNameCount[baseName])
                 obs.OBSNME = unique_obs_name(obs.OBSNME, b)
                 obs.OBSVAL = 0.0
@@ -2052,7 +2170,7 @@ def boiling_json_modelresult(geo,dat,lst,userEntry):
     from t2thermo import sat
     import numpy as np
 
-    obses = boiling_json_fielddata(geo, dat, userEntry)
+    obses = userEntry.all_obses
     bs, tss = [], []
     for obs in obses:
         b = obs._block_
@@ -2101,14 +2219,9 @@ def private_history_data(userEntry,vFactor=1.0,tFactor=1.0):
     customFilter = userEntry.customFilter
     offsetTime = userEntry.offsetTime
     obsDefault = userEntry.obsDefault
-    f = open(fieldDataFile,'r')
     fo = open(fieldDataFile+'.obs', 'w')
-    times, vals = [], []
-    for line in f.readlines():
-        if line.strip() == '': break
-        time,val = [float(x) for x in line.split()[0:2]]
-        if eval(customFilter):
-            times.append(time), vals.append(val)
+    times, vals = _read_filtered(fieldDataFile, customFilter, ['time', 'val'],
+                                 locals())
 
     if len(times) == 0:
         raise Exception("User entry yields no observation: " + str(userEntry))
@@ -2134,18 +2247,24 @@ def private_history_data(userEntry,vFactor=1.0,tFactor=1.0):
     for time, val in zip(final_times, final_vals):
         obsBaseNameCount[baseName] += 1
 
-        from copy import deepcopy
-        obs = deepcopy(obsDefault)
+        obs = obsDefault.new()
         from gopest.common import private_cleanup_name
         obs.OBSNME = baseName +'_'+ ('%04d' % obsBaseNameCount[baseName])
         obs.OBSVAL = val * vFactor
-        entries.append((obs, time * tFactor - offsetTime))
+        # additional for model result extraction, see private_model_times()
+        obs._mtime_ = time * tFactor - offsetTime
+        entries.append((obs, obs._mtime_))
         # output data file in original unit (instead of PEST/TOUGH2)
         fo.write('%e %e\n' % (time, val))
     fo.close()
-    f.close()
     return entries
 
+def private_model_times(userEntry):
+    """ returns model times of obses of userEntry, as worked out from the
+    field data by private_history_data() in _fielddata, so _modelresult does
+    not read the field data again """
+    return [obs._mtime_ for obs in userEntry.all_obses]
+
 
 def private_has_re(text):
     """ simplified check of a string contains regular expression or not """
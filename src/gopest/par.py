@@ -1,9 +1,15 @@
 import json
+import os
 from os.path import splitext, basename, isfile
 import inspect
 import functools
+import pickle
+import re
+import ast
 from collections import OrderedDict
 
+import numpy as np
+
 from t2data import *
 
 from gopest.common import TwoWayDict
@@ -11,6 +17,11 @@ from gopest.common import Singleton
 from gopest.common import readList
 from gopest.common import updateObj
 from gopest.common import private_cleanup_name
+from gopest.common import file_hash
+from gopest.common import load_json
+from gopest.common import dump_json
+from gopest.common import resident_load
+from gopest.common import resident_cache_enabled
 
 # implementation:
 #   a user entry is something simple a user can undersand and easily enter
@@ -25,6 +36,13 @@ from gopest.common import config as cfg
 INPUT_TYPE = cfg['simulator']['input-type']
 
 from gopest import par_def
+from gopest.geo_cache import deep_recursion
+
+# bump this whenever the content of the parameter plan changes
+PAR_PLAN_VERSION = 1
+
+# a line in pest_model.tpl/.dat, eg.  1.0E-14, "permeability_1_byrock", "['R0001']"
+PEST_MODEL_LINE = re.compile(r'\s*([^,]*),\s*"([^"]*)"\s*,\s*"(.*)"\s*$')
 par_classes = {}
 for n,c in inspect.getmembers(par_def, inspect.isclass):
     if issubclass(c, par_def.ParDef):
@@ -251,17 +269,110 @@ def save_model_config(dat, config):
     with open(jname, 'w') as jf:
         json.dump(config, jf, indent=4)
 
-def generate_params_and_tpl(origInput, tplToWrite, par_data):
-    """ this reads goPESTpar.list and generate appropriate template file and
-    writes * parameter data lines into a file """
+def parse_pest_model_line(line):
+    """ returns (value, param type, names) of a line in pest_model.dat, value
+    is left as str (it is the template field in pest_model.tpl) """
+    m = PEST_MODEL_LINE.match(line)
+    if m is None:
+        raise Exception('Unable to parse PEST model file line: %s' % line.rstrip())
+    return m.group(1).strip(), m.group(2), ast.literal_eval(m.group(3))
+
+def read_pest_model(pestModel):
+    """ yields (value, param type, names) of each parameter in pest_model.dat """
+    with open(pestModel, 'r') as f:
+        for line in f:
+            if line.strip():
+                v, pt, names = parse_pest_model_line(line)
+                yield float(v), pt, names
+
+def read_pest_model_values(pestModel):
+    """ returns np.array of parameter values of pest_model.dat, only the first
+    field of each line is parsed """
+    with open(pestModel, 'r') as f:
+        return np.array([line.split(',', 1)[0] for line in f if line.strip()],
+                        dtype=float)
+
+def save_par_plan(ftpl, fplan):
+    """ Saves (param type, names) of each line of template ftpl as a parameter
+    plan, so forward runs only need to parse the values of pest_model.dat. """
+    entries = []
+    with open(ftpl, 'r') as f:
+        f.readline() # ptf $
+        for line in f:
+            if line.strip():
+                v, pt, names = parse_pest_model_line(line)
+                entries.append((pt, names))
+    plan = {
+        'version': PAR_PLAN_VERSION,
+        'tpl_hash': file_hash(ftpl),
+        'entries': entries,
+    }
+    # replaced, not overwritten, slave directories may hardlink the old one
+    ftmp = '%s.%i.tmp' % (fplan, os.getpid())
+    with open(ftmp, 'wb') as f:
+        pickle.dump(plan, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(ftmp, fplan)
+
+def load_par_plan(fplan, ftpl='pest_model.tpl'):
+    """ Returns list of (param type, names) saved by save_par_plan(), one for
+    each line of pest_model.dat.  Returns None if the plan does not exist, or
+    is out of date with the template ftpl.  The plan is kept in memory by an
+    agent daemon, see resident_load(). """
+    if fplan is None:
+        return None
+    return resident_load(_load_par_plan, fplan, ftpl)
+
+def _load_par_plan(fplan, ftpl):
+    if not isfile(fplan) or not isfile(ftpl):
+        return None
+    try:
+        with open(fplan, 'rb') as f:
+            plan = pickle.load(f)
+    except Exception as e:
+        print("Warning! Unable to load parameter plan '%s': %s" % (fplan, str(e)))
+        return None
+    if plan.get('version') != PAR_PLAN_VERSION:
+        print("Warning! Parameter plan '%s' is from an older goPEST, ignored." % fplan)
+        return None
+    if plan.get('tpl_hash') != file_hash(ftpl):
+        print("Warning! '%s' changed since parameter plan '%s' was made, " \
+              "ignored.  Re-run 'gopest init' to update." % (ftpl, fplan))
+        return None
+    return plan['entries']
+
+def _load_input(origInput):
     if INPUT_TYPE == 'aut2':
         dat = t2data(origInput)
         dat.config = load_model_config(dat)
     elif INPUT_TYPE == 'waiwera':
-        with open(origInput, 'r') as f:
-            dat = json.load(f)
+        dat = load_json(origInput)
     else:
         raise Exception()
+    return dat
+
+def _input_snapshot(origInput):
+    """ pickled model input, t2data's read_function cannot be pickled """
+    dat = _load_input(origInput)
+    if INPUT_TYPE == 'aut2':
+        dat.read_function = None
+    return deep_recursion(pickle.dumps, dat, pickle.HIGHEST_PROTOCOL)
+
+def load_original_input(origInput):
+    """ Returns model input (t2data or Waiwera JSON dict) of origInput, ready
+    to be modified.  An agent daemon keeps a pickled snapshot in memory, which
+    is faster to restore than re-parsing (esp. TOUGH2 data files). """
+    if not resident_cache_enabled():
+        return _load_input(origInput)
+    dat = deep_recursion(pickle.loads, resident_load(_input_snapshot, origInput))
+    if INPUT_TYPE == 'aut2':
+        dat.read_function = default_read_function
+    return dat
+
+def generate_params_and_tpl(origInput, tplToWrite, par_data, fplan='goPESTpar.plan'):
+    """ this reads goPESTpar.list and generate appropriate template file and
+    writes * parameter data lines into a file.  A parameter plan is also saved
+    (if fplan is not None) for generate_real_model() to use. """
+    dat = _load_input(origInput)
 
     uentry = readUserParameter('goPESTpar.list', dat)
 
@@ -278,36 +389,51 @@ def generate_params_and_tpl(origInput, tplToWrite, par_data):
     tpl.close()
     if parf is not None:
         parf.close()
-
-def generate_real_model(origInput, pestModel, realInput):
-    """ this reads PEST generated model file and create the real TOUGH2 model
+    if fplan is not None:
+        save_par_plan(tplToWrite, fplan)
+
+def generate_real_model(origInput, pestModel, realInput, fplan='goPESTpar.plan',
+                        ftpl='pest_model.tpl', write=True):
+    """ this reads PEST generated model file and create the real TOUGH2 model.
+    If a valid parameter plan exists, only the values are parsed from the PEST
+    model file.  Returns the model input (t2data or Waiwera JSON dict), which
+    is only written into realInput if write is True.
     """
-    if INPUT_TYPE == 'aut2':
-        dat = t2data(origInput)
-        dat.config = load_model_config(dat)
-    elif INPUT_TYPE == 'waiwera':
-        with open(origInput, 'r') as f:
-            dat = json.load(f)
-    else:
-        raise Exception()
+    dat = load_original_input(origInput)
 
     # reuse ParDef instances (used as getter/setter here) for param type
     par_setters = {}
 
-    with open(pestModel,'r') as pmodel:
-        for line in pmodel.readlines():
-            vals = eval(line.strip())
-            pestValue, paramType, names = vals[0], vals[1], eval(vals[2])
-            if paramType not in par_setters:
-                par_setters[paramType] = par_classes[paramType](INPUT_TYPE)
-            par_setters[paramType].set(dat, names[0], pestValue)
-
+    plan = load_par_plan(fplan, ftpl)
+    if plan is not None:
+        values = read_pest_model_values(pestModel)
+        if len(values) != len(plan):
+            print("Warning! '%s' does not match parameter plan '%s', ignored." % (pestModel, fplan))
+            plan = None
+    if plan is not None:
+        pars = ((v, pt, names) for v,(pt,names) in zip(values, plan))
+    else:
+        pars = read_pest_model(pestModel)
+    # group by param type, so each type's setter is called once
+    par_values = OrderedDict()
+    for pestValue, paramType, names in pars:
+        if paramType not in par_values:
+            par_values[paramType] = ([], [])
+        par_values[paramType][0].append(names[0])
+        par_values[paramType][1].append(pestValue)
+    for paramType, (names, values) in par_values.items():
+        if paramType not in par_setters:
+            par_setters[paramType] = par_classes[paramType](INPUT_TYPE)
+        par_setters[paramType].set_many(dat, names, values)
+
+    if not write:
+        return dat
     if INPUT_TYPE == 'aut2':
         dat.write(realInput, extra_precision=True, echo_extra_precision=True)
         save_model_config(dat, dat.config)
     elif INPUT_TYPE == 'waiwera':
-        with open(realInput, 'w') as f:
-            json.dump(dat, f, indent=4, sort_keys=True)
+        dump_json(dat, realInput, indent=4)
+    return dat
 
 def goPESTpar(argv=[]):
     userlistname = 'goPESTpar.list'
@@ -23,6 +23,22 @@ import re
 
 from gopest.common import getFromDict, setInDict
 
+def _items_by_name(items):
+    """ returns dict of name to list of items (JSON objects) with that name """
+    byname = {}
+    for item in items:
+        if 'name' in item:
+            byname.setdefault(item['name'], []).append(item)
+    return byname
+
+def _gener_by_name(dat):
+    """ returns dict of gener name to the first matching t2generator """
+    byname = {}
+    for g in dat.generatorlist:
+        if g.name not in byname:
+            byname[g.name] = g
+    return byname
+
 class ParDef(object):
     """ Base class for parameter, used to access model input parameters """
     def __init__(self, simulator):
@@ -47,6 +63,18 @@ class ParDef(object):
     def set_waiwera(self, dat, name, value):
         raise NotImplementedError(self.__class__.__name__)
 
+    def set_many(self, dat, names, values):
+        """ same as .set() for each of names and values, subclasses can
+        override set_many_xxx() to look up the objects by name only once """
+        _set_many = getattr(self, 'set_many_' + self.simulator)
+        return _set_many(dat, names, values)
+    def set_many_aut2(self, dat, names, values):
+        for name,value in zip(names, values):
+            self.set_aut2(dat, name, value)
+    def set_many_waiwera(self, dat, names, values):
+        for name,value in zip(names, values):
+            self.set_waiwera(dat, name, value)
+
     def find_names(self, dat, pattern):
         _find_names = getattr(self, 'find_names_' + self.simulator)
         return _find_names(dat, pattern)
@@ -71,6 +99,12 @@ class delivgener_productivity(ParDef):
                 g.gx = value
                 return
 
+    def set_many_aut2(self, dat, names, values):
+        geners = _gener_by_name(dat)
+        for name,value in zip(names, values):
+            if name in geners:
+                geners[name].gx = value
+
     def find_names_aut2(self, dat, pattern):
         rex = re.compile(pattern)
         return [g.name for g in dat.generatorlist if rex.match(g.name)]
@@ -85,6 +119,12 @@ class delivgener_productivity(ParDef):
             if source['name'] == name:
                 source['deliverability']['productivity'] = value
 
+    def set_many_waiwera(self, dat, names, values):
+        sources = _items_by_name(dat['source'])
+        for name,value in zip(names, values):
+            for source in sources.get(name, []):
+                source['deliverability']['productivity'] = value
+
     def find_names_waiwera(self, dat, pattern):
         rex = re.compile(pattern)
         return [s['name'] for s in dat['source'] if rex.match(s['name'])]
@@ -110,6 +150,12 @@ class permeability_1_byrock(ParDef):
             if rock['name'] == name:
                 rock['permeability'][0] = value
 
+    def set_many_waiwera(self, dat, names, values):
+        rocks = _items_by_name(dat['rock']['types'])
+        for name,value in zip(names, values):
+            for rock in rocks.get(name, []):
+                rock['permeability'][0] = value
+
     def find_names_waiwera(self, dat, pattern):
         rex = re.compile(pattern)
         return [r['name'] for r in dat['rock']['types'] if rex.match(r['name'])]
@@ -135,6 +181,12 @@ class permeability_2_byrock(ParDef):
             if rock['name'] == name:
                 rock['permeability'][1] = value
 
+    def set_many_waiwera(self, dat, names, values):
+        rocks = _items_by_name(dat['rock']['types'])
+        for name,value in zip(names, values):
+            for rock in rocks.get(name, []):
+                rock['permeability'][1] = value
+
     def find_names_waiwera(self, dat, pattern):
         rex = re.compile(pattern)
         return [r['name'] for r in dat['rock']['types'] if rex.match(r['name'])]
@@ -160,6 +212,12 @@ class permeability_3_byrock(ParDef):
             if rock['name'] == name:
                 rock['permeability'][2] = value
 
+    def set_many_waiwera(self, dat, names, values):
+        rocks = _items_by_name(dat['rock']['types'])
+        for name,value in zip(names, values):
+            for rock in rocks.get(name, []):
+                rock['permeability'][2] = value
+
     def find_names_waiwera(self, dat, pattern):
         rex = re.compile(pattern)
         return [r['name'] for r in dat['rock']['types'] if rex.match(r['name'])]
@@ -185,6 +243,12 @@ class porosity_byrock(ParDef):
             if rock['name'] == name:
                 rock['porosity'] = value
 
+    def set_many_waiwera(self, dat, names, values):
+        rocks = _items_by_name(dat['rock']['types'])
+        for name,value in zip(names, values):
+            for rock in rocks.get(name, []):
+                rock['porosity'] = value
+
     def find_names_waiwera(self, dat, pattern):
         rex = re.compile(pattern)
         return [r['name'] for r in dat['rock']['types'] if rex.match(r['name'])]
@@ -201,6 +265,12 @@ class massgener_rate(ParDef):
                 g.gx = value
                 return
 
+    def set_many_aut2(self, dat, names, values):
+        geners = _gener_by_name(dat)
+        for name,value in zip(names, values):
+            if name in geners:
+                geners[name].gx = value
+
     def find_names_aut2(self, dat, pattern):
         rex = re.compile(pattern)
         return [g.name for g in dat.generatorlist if rex.match(g.name)]
@@ -215,6 +285,12 @@ class massgener_rate(ParDef):
             if source['name'] == name:
                 source['rate'] = value
 
+    def set_many_waiwera(self, dat, names, values):
+        sources = _items_by_name(dat['source'])
+        for name,value in zip(names, values):
+            for source in sources.get(name, []):
+                source['rate'] = value
+
     def find_names_waiwera(self, dat, pattern):
         rex = re.compile(pattern)
         return [s['name'] for s in dat['source'] if rex.match(s['name'])]
@@ -24,8 +24,6 @@ from shutil import copy2
 from shutil import Error
 from time import sleep
 
-from numpy.testing import assert_approx_equal
-
 from gopest.run_ns_pr import run_ns_pr
 from gopest.par import generate_real_model
 from gopest.obs import read_from_real_model
@@ -58,6 +56,7 @@ def get_slave_id():
         return '0'
 
 def par_match(pf1, pf2):
+    from numpy.testing import assert_approx_equal
     matched = False
     with open(pf1,'r') as a:
         with open(pf2,'r') as b:
@@ -108,10 +107,16 @@ def main(obsreref, svda, testup, local, skiprun, useobf, sendbad, skippr, hdf5,
         PARCALC = path.join(get_pest_dir(), 'parcalc')
         system(PARCALC + ' > ' + devnull)
 
+    # Waiwera inputs are kept in memory from goPESTpar to goPESTobs, they are
+    # only written by run_ns_pr() just before the simulator is launched
+    inputs = {}
+
     ### goPESTpar
     if not skiprun:
         print("  --- goPESTpar")
-        generate_real_model(fdato, 'pest_model.dat', fdats[0])
+        dat = generate_real_model(fdato, 'pest_model.dat', fdats[0], write=not waiwera)
+        if waiwera:
+            inputs[fdats[0]] = dat
         # sleep(30)  # just in case shared file system slow
 
     if obsreref:
@@ -152,7 +157,7 @@ def main(obsreref, svda, testup, local, skiprun, useobf, sendbad, skippr, hdf5,
 
         START_TIME = time.time()
         print("  --- run_ns_pr()")
-        runok = run_ns_pr()
+        runok = run_ns_pr(inputs)
         if obsreref:
             if not local:
                 print("  --- reset Master INCON")
@@ -170,7 +175,9 @@ def main(obsreref, svda, testup, local, skiprun, useobf, sendbad, skippr, hdf5,
     ### goPESTobs
     # sleep(30)  # just in case shared file system slow
     print("  --- goPESTobs")
-    read_from_real_model(fgeo, fdats[-1], flsts[-1], 'pest_model.obf', waiwera=waiwera)
+    read_from_real_model(fgeo, fdats[-1], flsts[-1], 'pest_model.obf', waiwera=waiwera,
+                         workers=config['model']['obs-workers'],
+                         dat=inputs.get(fdats[-1]))
 
     if testup:
         print("  --- store lambda test (save,obf,pars) pair:" + get_slave_id())
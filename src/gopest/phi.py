@@ -0,0 +1,208 @@
+""" Objective function (phi) of model results, calculated by goPEST itself.
+
+PEST calculates phi as the sum of squared weighted residuals of all
+observations and prior information.  Here the observation data, groups and
+prior information are read from the PEST control file (.pst), the model
+values from the model output file (.obf, as written by 'gopest run-pest-model',
+or extracted from the model output h5/listing with the observation plan of
+the directory if the .obf is missing), and phi of each observation group is
+summed with numpy.  No file is written or modified and PEST is not run.
+
+Results use the same keys as PEST's record file (see check_slaves.read_rec()):
+'phi', 'phi measured' (groups not starting with 'regul'), 'phi regularisation'
+(groups starting with 'regul') and phi of each group.  The regularisation weight
+factor that PEST applies in regularisation mode is not included.
+"""
+
+import os
+import os.path
+import re
+
+import numpy as np
+
+from gopest.common import TPL_FIELD
+
+# parameter in prior information equation, eg. log(k1)
+PI_LOG = re.compile(r'log\((.+)\)', re.IGNORECASE)
+
+def _sections(fpst):
+    """ returns dict of section name (eg. 'observation data') to list of lines
+    of PEST control file fpst """
+    sections, lines = {}, None
+    with open(fpst, 'r') as f:
+        for line in f:
+            if line.startswith('*'):
+                lines = sections.setdefault(line[1:].strip().lower(), [])
+            elif lines is not None and line.strip():
+                lines.append(line.rstrip())
+    return sections
+
+def parse_prior_information(lines):
+    """ returns list of (pilbl, terms, pival, weight, obgnme) from lines of the
+    prior information section, terms is list of (factor, parnme, log) """
+    # lines starting with '&' continue the previous one
+    joined = []
+    for line in lines:
+        if line.lstrip().startswith('&') and joined:
+            joined[-1] += ' ' + line.lstrip()[1:]
+        else:
+            joined.append(line)
+    prior = []
+    for line in joined:
+        lhs, rhs = line.split('=')
+        pilbl, eq = lhs.split(None, 1)
+        # terms are 'factor * parnme' or 'factor * log(parnme)', joined by + or -
+        terms, sign = [], 1.0
+        tokens = eq.replace('*', ' * ').split()
+        i = 0
+        while i < len(tokens):
+            if tokens[i] in ('+', '-'):
+                sign = -1.0 if tokens[i] == '-' else 1.0
+                i += 1
+                continue
+            fac, item = sign * float(tokens[i]), tokens[i+2]
+            m = PI_LOG.match(item)
+            if m:
+                terms.append((fac, m.group(1).lower(), True))
+            else:
+                terms.append((fac, item.lower(), False))
+            sign = 1.0
+            i += 3
+        pival, weight, obgnme = rhs.split()[:3]
+        prior.append((pilbl.lower(), terms, float(pival), float(weight), obgnme.lower()))
+    return prior
+
+def read_pst(fpst):
+    """ reads observation data and prior information from PEST control file,
+    returns dict with numpy arrays 'obsnme', 'obsval', 'weight', 'group' (index
+    into 'groups'), list 'groups' of all group names, and 'prior' as returned
+    by parse_prior_information() """
+    sections = _sections(fpst)
+    groups = [line.split()[0].lower() for line in sections.get('observation groups', [])]
+    obsnme, obsval, weight, obgnme = [], [], [], []
+    for line in sections.get('observation data', []):
+        sps = line.split()
+        obsnme.append(sps[0].lower())
+        obsval.append(float(sps[1]))
+        weight.append(float(sps[2]))
+        obgnme.append(sps[3].lower())
+    prior = parse_prior_information(sections.get('prior information', []))
+    for g in obgnme + [p[4] for p in prior]:
+        if g not in groups:
+            groups.append(g)
+    igroup = dict([(g,i) for i,g in enumerate(groups)])
+    return {
+        'obsnme': np.array(obsnme),
+        'obsval': np.array(obsval),
+        'weight': np.array(weight),
+        'group': np.array([igroup[g] for g in obgnme], dtype=int),
+        'groups': groups,
+        'prior': prior,
+    }
+
+def read_obf(fobf):
+    """ returns (names, values) of model output file (.obf) """
+    names, values = [], []
+    with open(fobf, 'r') as f:
+        for line in f:
+            sps = line.split()
+            if sps:
+                names.append(sps[0].lower())
+                values.append(float(sps[1]))
+    return np.array(names), np.array(values)
+
+def read_model_pars(ftpl, fdat):
+    """ returns dict of parameter values in model input file fdat (as written
+    by PEST from template ftpl), read from the same columns as the fields """
+    pars = {}
+    with open(ftpl, 'r') as ft, open(fdat, 'r') as fd:
+        ft.readline() # ptf $
+        for tline, dline in zip(ft, fd):
+            for m in TPL_FIELD.finditer(tline):
+                pars[m.group(1).strip().lower()] = float(dline[m.start():m.end()])
+    return pars
+
+def calc_phi(pst, names, values, pars=None):
+    """ returns dict of phi (see module doc), of model output (names, values)
+    and parameter values pars (dict, only needed for prior information), with
+    observation data pst as returned by read_pst() """
+    obsnme = pst['obsnme']
+    if len(names) == len(obsnme) and np.array_equal(names, obsnme):
+        model = values
+    else:
+        index = dict([(n,i) for i,n in enumerate(names)])
+        missing = [n for n in obsnme if n not in index]
+        if missing:
+            raise Exception('%i observations (eg. %s) are missing from model output.' % (
+                len(missing), missing[0]))
+        model = values[np.array([index[n] for n in obsnme], dtype=int)]
+    ngroup = len(pst['groups'])
+    residual = pst['weight'] * (model - pst['obsval'])
+    phis = np.bincount(pst['group'], weights=residual**2, minlength=ngroup)
+    if pst['prior']:
+        if pars is None:
+            raise Exception('Parameter values are required for prior information.')
+        for pilbl, terms, pival, weight, g in pst['prior']:
+            v = sum([fac * (np.log10(pars[p]) if log else pars[p]) for fac,p,log in terms])
+            phis[pst['groups'].index(g)] += (weight * (v - pival))**2
+    results = dict(zip(pst['groups'], [float(p) for p in phis]))
+    regul = [g.startswith('regul') for g in pst['groups']]
+    results['phi'] = float(np.sum(phis))
+    results['phi measured'] = float(np.sum(phis[np.logical_not(regul)]))
+    results['phi regularisation'] = float(np.sum(phis[np.array(regul, dtype=bool)]))
+    return results
+
+def extract_obf(spath):
+    """ extracts model results of directory spath (as a slave/agent would in
+    spath), returns (names, values).  Only the observation plan of spath is
+    used, the field data of goPESTobs.list is not processed, and nothing is
+    written (no .obf, field data cache or face cache).  Raises Exception if
+    spath has no valid observation plan, the .obf is required then. """
+    from gopest.common import config, runtime
+    from gopest import obs_def
+    from gopest.obs import (reset_obs_names, load_obs_plan, load_model,
+                            open_listing, collect_obf)
+    fgeo = runtime['filename']['geom']
+    fdat = runtime['filename']['dat_seq'][-1]
+    flst = runtime['filename']['lst_seq'][-1]
+    waiwera = config['simulator']['input-type'] == 'waiwera'
+    original_dir = os.getcwd()
+    save_field_caches = obs_def.save_field_caches
+    try:
+        # file names in goPESTobs.list and the plan are relative to spath
+        os.chdir(spath)
+        obs_def.save_field_caches = False
+        userEntries = load_obs_plan('goPESTobs.plan')
+        if userEntries is None:
+            raise Exception('No valid observation plan in %s, model output '
+                            '(.obf) is required.' % spath)
+        reset_obs_names()
+        geo, dat = load_model(fgeo, fdat, waiwera)
+        lst = open_listing(fgeo, flst, geo, dat, waiwera, face_cache=False)
+        all_values = [ue.makeObfValues(geo,dat,lst) for ue in userEntries]
+        if flst.lower().endswith('.listing'):
+            lst.close()
+        names, values = collect_obf(userEntries, all_values)
+    finally:
+        obs_def.save_field_caches = save_field_caches
+        os.chdir(original_dir)
+    return np.array([n.lower() for n in names]), np.array(values)
+
+def dir_phi(spath, fpst, fobf='pest_model.obf', ftpl='pest_model.tpl',
+            fdat='pest_model.dat', flst=None):
+    """ returns phi (see module doc) of model results in directory spath.  Model
+    output is read from fobf, or extracted from the model output file flst if
+    fobf is missing or older than flst. """
+    pst = read_pst(os.path.join(spath, fpst))
+    fobf = os.path.join(spath, fobf)
+    if flst is not None:
+        flst = os.path.join(spath, flst)
+    if os.path.isfile(fobf) and (flst is None or not os.path.isfile(flst) or
+                                 os.path.getmtime(fobf) >= os.path.getmtime(flst)):
+        names, values = read_obf(fobf)
+    else:
+        names, values = extract_obf(spath)
+    pars = None
+    if pst['prior']:
+        pars = read_model_pars(os.path.join(spath, ftpl), os.path.join(spath, fdat))
+    return calc_phi(pst, names, values, pars)
@@ -0,0 +1,128 @@
+""" Provisioning of slave/worker directories from the master directory.
+
+Slave directories used to be wiped and re-copied (shutil.copytree) at every
+launch, ie. large files like the incon h5, mesh and geometry are copied once
+for every slave.  Here the read-only inputs (see readonly_inputs()) are
+hardlinked instead (or reflinked on copy-on-write file systems, if hardlinks
+are not possible, eg. across devices), only the other files are copied.
+
+Existing slave directories are synced instead of wiped: files already linked,
+or copies with the same size and modification time (and content hash if
+verify) are left alone.  Files are always replaced (never written into), so a
+file that is linked to the master can not be modified by accident.
+
+NOTE files slaves write must not be in readonly_inputs(), as a hardlink shares
+its content with the master directory.
+"""
+
+import os
+import os.path
+import shutil
+
+from gopest.common import file_hash
+
+# ioctl request of Linux copy-on-write clone of a whole file
+FICLONE = 0x40049409
+
+def readonly_inputs():
+    """ returns set of file names that slaves only read, which can be shared
+    with the master directory """
+    from gopest.common import config as cfg
+    from gopest.common import runtime
+    from gopest.geo_cache import geo_cache_filename, face_cache_filename
+    if not cfg['pest']['link_slave_inputs']:
+        return set()
+    fgeo = runtime['filename']['geom']
+    files = set(runtime['filename']['all_geoms'])
+    files.update([
+        geo_cache_filename(fgeo),
+        face_cache_filename(fgeo),
+        runtime['filename']['dat_orig'],
+        runtime['filename']['incon'],
+        'goPESTobs.plan',
+        'goPESTpar.plan',
+    ])
+    return files
+
+def reflink(src, dst):
+    """ copy-on-write clone of file src as dst, raises OSError if not
+    supported by OS or file system """
+    import fcntl
+    try:
+        with open(src, 'rb') as fs, open(dst, 'wb') as fd:
+            fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+    except (OSError, ImportError) as e:
+        if os.path.exists(dst):
+            os.remove(dst)
+        raise OSError(str(e))
+    shutil.copystat(src, dst)
+
+def _clone_or_copy(src, dst):
+    try:
+        reflink(src, dst)
+        return 'reflinked'
+    except OSError:
+        shutil.copy2(src, dst)
+        return 'copied'
+
+def _up_to_date(src, dst, verify=False):
+    """ True if file dst has the same content as src """
+    s, d = os.stat(src), os.stat(dst)
+    if s.st_size != d.st_size:
+        return False
+    if s.st_mtime_ns == d.st_mtime_ns and not verify:
+        return True
+    if file_hash(src) != file_hash(dst):
+        return False
+    shutil.copystat(src, dst)
+    return True
+
+def provision_dir(dst, src='.', readonly=None, verify=False):
+    """ Syncs all files (no sub-directories) of directory src into dst, files
+    in readonly are hardlinked if possible.  Returns dict of counts of files
+    'linked', 'reflinked', 'copied' and 'unchanged'. """
+    if readonly is None:
+        readonly = readonly_inputs()
+    if not os.path.isdir(dst):
+        os.makedirs(dst)
+    counts = {'linked': 0, 'reflinked': 0, 'copied': 0, 'unchanged': 0}
+    for f in sorted(os.listdir(src)):
+        fsrc, fdst = os.path.join(src, f), os.path.join(dst, f)
+        # skips directories, sockets etc.
+        if not os.path.isfile(fsrc):
+            continue
+        if os.path.exists(fdst):
+            if os.path.samefile(fsrc, fdst):
+                if f in readonly:
+                    counts['unchanged'] += 1
+                    continue
+                # linked previously, needs its own copy now
+            elif _up_to_date(fsrc, fdst, verify):
+                counts['unchanged'] += 1
+                continue
+        ftmp = fdst + '.provision'
+        if os.path.exists(ftmp):
+            os.remove(ftmp)
+        method = None
+        if f in readonly:
+            try:
+                os.link(fsrc, ftmp)
+                method = 'linked'
+            except OSError:
+                pass
+        if method is None:
+            method = _clone_or_copy(fsrc, ftmp)
+        os.replace(ftmp, fdst)
+        counts[method] += 1
+    return counts
+
+def provision_dirs(dsts, src='.', verify=False):
+    """ provision_dir() for each of dsts, prints a summary """
+    readonly = readonly_inputs()
+    total = {}
+    for dst in dsts:
+        for k,v in provision_dir(dst, src, readonly, verify).items():
+            total[k] = total.get(k, 0) + v
+    print('Provisioned %i directories: %s' % (len(dsts), ', '.join(
+        ['%i %s' % (v,k) for k,v in sorted(total.items())])))
+    return total
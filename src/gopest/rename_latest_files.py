@@ -9,13 +9,49 @@ def current_iteration():
     its.append(0)
     return max(its)
 
+def archive_latest_files(ii):
+    """ stores '*.999' files as iteration ii in the archive (see gopest.archive)
+    under their original names, then removes them """
+    from gopest.archive import archive_iteration
+    files = dict([(f[:-len('.999')], f) for f in glob.glob('*.999')])
+    counts = archive_iteration(ii, files)
+    for f in files.values():
+        os.remove(f)
+    print('    archived %i files (%.1f MB) as iteration %i, %.1f MB new in store' % (
+        counts['files'], counts['bytes'] / 1.e6, ii, counts['stored'] / 1.e6))
+
+def archive_cli(argv):
+    """ --list and --restore of archived iterations """
+    from gopest.archive import list_iterations, load_manifest, restore_iteration
+    if '--list' in argv:
+        for ii in list_iterations():
+            files = load_manifest(ii)['files']
+            print('  iteration %i: %s' % (ii, ', '.join(sorted(files.keys()))))
+    if '--restore' in argv:
+        iarg = argv.index('--restore') + 1
+        try:
+            ii = int(argv[iarg])
+        except (IndexError, ValueError):
+            raise Exception('--restore argument needs to be followed by an iteration number')
+        dest = argv[iarg+1] if len(argv) > iarg+1 else 'iteration_%i' % ii
+        for f in restore_iteration(ii, dest):
+            print('    restored %s' % f)
+
 def rename_latest_files(argv=[]):
     """ PEST_HP's file distribution will copy files from the best update slave
     to here.  They will be named as '*.999'.  This script renames these to the
-    latest iteration number.
+    latest iteration number, or stores them in the iteration archive if [pest]
+    archive_iterations is true.
+
+    Archived iterations can be listed with '--list', and restored (into
+    directory DIR, default 'iteration_N') with '--restore N [DIR]'.
     """
     print('gopest save-iter-model (rename_latest_files.py):')
 
+    if '--list' in argv or '--restore' in argv:
+        archive_cli(argv)
+        return
+
     # try:
     #     copy2('real_model.incon.999', 'real_model.incon')
     #     print("    real_model.incon.999 -> real_model.incon (copy)")
@@ -26,6 +62,10 @@ def rename_latest_files(argv=[]):
     ii = current_iteration()
     print('  Current iteration is %i' % ii)
 
+    if config['pest']['archive_iterations']:
+        archive_latest_files(ii)
+        return
+
     for f in glob.glob('*.999'):
         newname = f.replace('.999', '.%i' % ii)
         print('    %s -> %s' % (f, newname))
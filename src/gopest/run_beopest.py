@@ -7,6 +7,10 @@ from multiprocessing import cpu_count
 
 from gopest.common import config as cfg
 from gopest.common import runtime
+from gopest.provision import provision_dirs
+from gopest.provision import readonly_inputs
+from gopest.run_manager import gen_run_management_file
+from gopest.supervisor import AgentSlot, Supervisor
 
 NUM_SLAVES = cfg['pest']['num_slaves']
 SILENT_SLAVES = cfg['pest']['silent_slaves']
@@ -78,16 +82,6 @@ if NUM_SLAVES is None:
 if PESTDIR:
     BEOPEST = os.path.join(PESTDIR,BEOPEST)
 
-def ignore_dirs(folder, files):
-    """ for shutil.copytree, ignores all subdirectories, ie. copy only files
-    """
-    ignore_list = []
-    for f in files:
-        full_path = os.path.join(folder, f)
-        if os.path.isdir(full_path):
-            ignore_list.append(f)
-    return ignore_list
-
 def run_cli(argv=[]):
     """ generate master and slave commands, copy files into slave directories,
     and launch them as process, wait until all finished.
@@ -105,61 +99,21 @@ def run_cli(argv=[]):
     generate_comm_files()
     print('Running BeoPEST with silent=', SILENT_SLAVES)
 
-    # each command is a tuple (args, other options), see subproces.Popen()
-    master = ([MASTER, PST_NAME, SWITCHES, '/h :%s' % PORT], {} )
-    slaves, slaves_outs = [], []
-    for i in range(NUM_SLAVES):
-        s_dir = 'slave%i' % (i+1)
-        if os.path.exists(s_dir):
-            shutil.rmtree(s_dir)
-        shutil.copytree('.', s_dir, ignore=ignore_dirs)
-        if SILENT_SLAVES:
-            # stdout_file = DEVNULL
-            stdout_file = open(s_dir + '/stdout.txt', 'w')
-            slaves_outs.append(stdout_file)
-        else:
-            stdout_file = None
-        slaves.append((
-            [AGENT, PST_NAME, '/h localhost:%s' % PORT],
-            {
-                'cwd': s_dir,
-                'stdout': stdout_file,
-                'stderr': stdout_file,
-            }))
-
-    # start master, sleep a bit, then start all slaves
-    ps = []
-    ps.append(Popen(master[0], **master[1]))
-    time.sleep(0.1)
-    for s in slaves:
-        ps.append(Popen(s[0], **s[1]))
-    for p in ps:
-        p.wait()
-    for f in slaves_outs:
-        f.close()
-
-def gen_run_management_file(nslave, slaves, wait=0.2, parlam=1, runtime=3600):
-    """ generate run management file required by ppest/jactest.  I am
-    implementing the simplified version here, single template and instruction
-    file only.  TODO extend to be more flexible, which may require more info
-    from pest control file.  Each slaves is a list of tuple (SLAVNAME,SLAVDIR),
-    should have the same length as nslaves.
-    """
-    ifletyp = 0 # for now
-    lines = []
-    lines += [
-        'prf',
-        '%i %i %f %i' % (nslave, ifletyp, wait, parlam),
-    ]
-    for i in range(nslave):
-        slavname, slavdir = slaves[i]
-        if " " in slavname or "'" in slavname:
-            slavname = slavname.replace("'", "''")
-            slavname = "'" + slavname + "'"
-        lines.append(slavname + ' ' + slavdir)
-    lines.append(' '.join([str(runtime)] * nslave))
-    # TODO: support non-zero IFLETYP
-    return '\n'.join(lines)
+    master = [MASTER, PST_NAME, SWITCHES, '/h :%s' % PORT]
+    s_dirs = ['slave%i' % (i+1) for i in range(NUM_SLAVES)]
+    readonly = readonly_inputs()
+    provision_dirs(s_dirs)
+    slots = [AgentSlot(s_dir, [AGENT, PST_NAME, '/h localhost:%s' % PORT],
+                       silent=SILENT_SLAVES, daemon=cfg['pest']['agent_daemon'],
+                       readonly=readonly) for s_dir in s_dirs]
+    # master and slaves are launched and watched by supervisor, which restarts
+    # crashed slaves and (optionally) adapts number of slaves to memory
+    sup = Supervisor(master, slots,
+                     max_restarts=cfg['pest']['max_restarts'],
+                     adaptive=cfg['pest']['adaptive_slaves'],
+                     min_agents=cfg['pest']['min_slaves'],
+                     mem_reserve=cfg['pest']['mem_reserve_mb'])
+    sup.run()
 
 def run_pslaves(master_command):
     """ generate master and slave commands, copy files into slave directories,
@@ -169,11 +123,9 @@ def run_pslaves(master_command):
     # each command is a tuple (args, other options), see subproces.Popen()
     master = (master_command, {} )
     slaves = []
-    for i in range(NUM_SLAVES):
-        s_dir = 'slave%i' % (i+1)
-        if os.path.exists(s_dir):
-            shutil.rmtree(s_dir)
-        shutil.copytree('.', s_dir, ignore=ignore_dirs)
+    s_dirs = ['slave%i' % (i+1) for i in range(NUM_SLAVES)]
+    provision_dirs(s_dirs)
+    for s_dir in s_dirs:
         slaves.append((
             [BEOPEST, PST_NAME, '/h localhost:%s' % PORT],
             {
@@ -0,0 +1,325 @@
+""" gopest-native parallel forward runs of many parameter sets.
+
+Each worker process works in its own directory (worker1, worker2, ..., synced
+from the working directory, see gopest.provision) and calls
+pest_model.main_cli() directly, so there is no new Python process or directory
+copy for every run.  Workers keep the geometry, original model and plans in
+memory between runs, like the agent daemon.  The workers can be used in two
+ways:
+
+'gopest run-batch' runs parameter sets given as PEST parameter value files
+(.par, as written by PEST, eg. case.par or the /f par sets of PEST_HP).  Runs
+are handed out one at a time to whichever worker is free, longest runs first
+(as recorded in goPESTruns.json by previous batches, by the position of the
+parameter set in the batch).  Results are saved next to each .par file, with
+extension .obf.
+
+'gopest run-workers' lets Parallel PEST (ppest, or jactest) drive the workers
+as its slaves.  The run management file (case.rmf) is written with the worker
+directories, each worker then serves runs like PSLAVE does, through signal
+files in its directory: PEST writes the model input and pest.rdy, the worker
+runs the model and writes pslave.fin, until PEST writes pest.stp.  The expected
+run time of each worker in case.rmf is a rolling estimate of its recent runs
+(goPESTruns.json).  If a master command is given, it is launched and the
+workers are stopped once it exits.
+
+Usage:
+    gopest run-batch PARFILE [PARFILE ...] [--workers N]
+    gopest run-workers [--workers N] [--master COMMAND [ARG ...]]
+"""
+
+import glob
+import json
+import math
+import os
+import os.path
+import sys
+import time
+import traceback
+
+from gopest.common import TPL_FIELD
+from gopest.provision import provision_dirs
+
+RUN_HISTORY = 'goPESTruns.json'
+
+# Parallel PEST signal files, in each slave (worker) directory
+PSLAVE_READY = 'pslave.rdy'
+PEST_READY = 'pest.rdy'
+PSLAVE_FINISHED = 'pslave.fin'
+PEST_STOP = 'pest.stp'
+
+# expected run time (seconds) of workers without history, as PEST's default
+DEFAULT_RUNTIME = 3600
+
+def read_par_file(fpar):
+    """ returns dict of parameter name (lower case) to value, from PEST
+    parameter value file, scale and offset applied """
+    pars = {}
+    with open(fpar, 'r') as f:
+        f.readline() # single/double point, point
+        for line in f:
+            if line.strip():
+                name, value, scale, offset = line.split()[:4]
+                pars[name.lower()] = float(value) * float(scale) + float(offset)
+    return pars
+
+def write_pest_model(ftpl, pars, fdat):
+    """ writes model file fdat (as PEST would) from template ftpl, with
+    parameter values pars (dict of name to value) """
+    def sub(m):
+        name = m.group(1).strip().lower()
+        if name not in pars:
+            raise Exception("Parameter '%s' of template '%s' not found." % (name, ftpl))
+        return '%.15e' % pars[name]
+    with open(ftpl, 'r') as f, open(fdat, 'w') as fout:
+        f.readline() # ptf $
+        for line in f:
+            fout.write(TPL_FIELD.sub(sub, line))
+
+def gen_run_management_file(nslave, slaves, wait=0.2, parlam=1, runtime=3600):
+    """ generate run management file required by ppest/jactest.  I am
+    implementing the simplified version here, single template and instruction
+    file only.  TODO extend to be more flexible, which may require more info
+    from pest control file.  Each slaves is a list of tuple (SLAVNAME,SLAVDIR),
+    should have the same length as nslaves.  runtime is the expected run time
+    (seconds) of all slaves, or a list of each slave's.
+    """
+    if not isinstance(runtime, (list, tuple)):
+        runtime = [runtime] * nslave
+    ifletyp = 0 # for now
+    lines = []
+    lines += [
+        'prf',
+        '%i %i %f %i' % (nslave, ifletyp, wait, parlam),
+    ]
+    for i in range(nslave):
+        slavname, slavdir = slaves[i]
+        if " " in slavname or "'" in slavname:
+            slavname = slavname.replace("'", "''")
+            slavname = "'" + slavname + "'"
+        lines.append(slavname + ' ' + slavdir)
+    lines.append(' '.join([str(r) for r in runtime]))
+    # TODO: support non-zero IFLETYP
+    return '\n'.join(lines)
+
+def load_history(fhistory=RUN_HISTORY):
+    """ returns run time history, dict with 'par sets' (run seconds keyed by
+    position of the parameter set in a batch, see run_batch()) and 'workers'
+    (run seconds keyed by worker name, see run_workers()).  History of older
+    goPEST (keyed by .par file name) is ignored. """
+    history = {}
+    if os.path.isfile(fhistory):
+        with open(fhistory, 'r') as f:
+            history = json.load(f)
+    return {
+        'par sets': history.get('par sets', {}),
+        'workers': history.get('workers', {}),
+    }
+
+def save_history(history, fhistory=RUN_HISTORY):
+    with open(fhistory, 'w') as f:
+        json.dump(history, f, indent=4, sort_keys=True)
+
+def update_estimate(estimate, secs):
+    """ returns rolling estimate of run time, updated with a run of secs
+    seconds, recent runs count more """
+    if estimate is None:
+        return secs
+    return 0.5 * (estimate + secs)
+
+def provision_workers(nworkers):
+    """ returns list of worker directories, synced from working directory """
+    wdirs = [os.path.abspath('worker%i' % (i+1)) for i in range(nworkers)]
+    provision_dirs(wdirs)
+    return wdirs
+
+def _init_worker(wdirs, silent):
+    """ each worker process takes a directory and stays there """
+    from gopest.common import enable_resident_cache
+    w_dir = wdirs.get()
+    os.chdir(w_dir)
+    if silent:
+        # also catches output of simulator launched by run_ns_pr
+        fout = os.open('stdout.txt', os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+        os.dup2(fout, 1)
+        os.dup2(fout, 2)
+    enable_resident_cache()
+
+def _run_model():
+    """ runs the model with pest_model.dat in the worker's directory, returns
+    (ok, seconds, obf text or error message) """
+    from gopest.pest_model import main_cli
+    START_TIME = time.time()
+    try:
+        if os.path.isfile('pest_model.obf'):
+            os.remove('pest_model.obf')
+        main_cli(['run-pest-model', '--local'])
+        with open('pest_model.obf', 'r') as f:
+            result = (True, f.read())
+    except (Exception, SystemExit):
+        result = (False, traceback.format_exc())
+    finally:
+        sys.stdout.flush()
+    return (result[0], time.time() - START_TIME, result[1])
+
+def _run_one(args):
+    """ runs a single parameter set in the worker's directory, returns
+    (iset, fpar, ok, seconds, obf text or error message) """
+    iset, fpar, pars = args
+    write_pest_model('pest_model.tpl', pars, 'pest_model.dat')
+    return (iset, fpar) + _run_model()
+
+def _touch(fn):
+    with open(fn, 'w'):
+        pass
+
+def _serve_pest(wait):
+    """ serves model runs of Parallel PEST in the worker's directory (as
+    PSLAVE), until PEST signals stop.  Returns (worker directory, list of
+    seconds of all runs). """
+    _touch(PSLAVE_READY)
+    secs = []
+    while not os.path.isfile(PEST_STOP):
+        if not os.path.isfile(PEST_READY):
+            time.sleep(wait)
+            continue
+        os.remove(PEST_READY)
+        ok, s, out = _run_model()
+        if not ok:
+            # PEST finds no model output, which it handles as a failed run
+            print(out)
+            sys.stdout.flush()
+        secs.append(s)
+        _touch(PSLAVE_FINISHED)
+    os.remove(PEST_STOP)
+    return (os.getcwd(), secs)
+
+def run_batch(fpars, nworkers, silent=True):
+    """ runs all PEST parameter files fpars in a pool of nworkers workers,
+    .obf written for each successful run.  Returns dict of fpar to
+    (ok, seconds). """
+    from multiprocessing import Pool, Queue
+    history = load_history()
+    sets = history['par sets']
+    # longest first, unknown runs first of all, so the pool does not end up
+    # waiting for a single long run
+    order = sorted(range(len(fpars)), key=lambda i: -sets.get(str(i), float('inf')))
+    jobs = [(i, os.path.abspath(fpars[i]), read_par_file(fpars[i])) for i in order]
+
+    nworkers = max(1, min(nworkers, len(jobs)))
+    wdirs = Queue()
+    for w in provision_workers(nworkers):
+        wdirs.put(w)
+    results = {}
+    with Pool(nworkers, initializer=_init_worker, initargs=(wdirs, silent)) as pool:
+        for iset, fpar, ok, secs, out in pool.imap_unordered(_run_one, jobs, chunksize=1):
+            results[fpar] = (ok, secs)
+            if ok:
+                with open(os.path.splitext(fpar)[0] + '.obf', 'w') as f:
+                    f.write(out)
+                sets[str(iset)] = update_estimate(sets.get(str(iset)), secs)
+                print('  --- %s finished after %.2f seconds' % (fpar, secs))
+            else:
+                print('  --- %s failed after %.2f seconds:' % (fpar, secs))
+                print(out)
+    save_history(history)
+    return results
+
+def run_workers(nworkers, master=None, wait=0.2, silent=True):
+    """ starts nworkers workers as slaves of Parallel PEST, see _serve_pest().
+    The run management file of the PEST case is written for them.  If master
+    (list of command and arguments) is given, it is launched and the workers
+    are stopped once it exits, otherwise they run until PEST stops them.
+    Returns dict of worker directory to list of seconds of its runs. """
+    from multiprocessing import Pool, Queue
+    from subprocess import Popen
+    from gopest.common import config as cfg
+    history = load_history()
+    workers = history['workers']
+    w_dirs = provision_workers(nworkers)
+    names = [os.path.basename(w) for w in w_dirs]
+    runtimes = [int(math.ceil(workers.get(n, DEFAULT_RUNTIME))) for n in names]
+    with open(cfg['pest']['case-name'] + '.rmf', 'w') as f:
+        f.write(gen_run_management_file(nworkers,
+                                        [(n, w + os.sep) for n,w in zip(names, w_dirs)],
+                                        wait=wait, runtime=runtimes) + '\n')
+    wdirs = Queue()
+    for w in w_dirs:
+        # signals left by an earlier PEST, cleared before any worker starts,
+        # so the stop signal of a master that exits early is not lost
+        for fn in [PSLAVE_READY, PEST_READY, PSLAVE_FINISHED, PEST_STOP]:
+            if os.path.isfile(os.path.join(w, fn)):
+                os.remove(os.path.join(w, fn))
+        wdirs.put(w)
+    with Pool(nworkers, initializer=_init_worker, initargs=(wdirs, silent)) as pool:
+        # one serving loop for each worker, none is free to take another
+        serving = pool.map_async(_serve_pest, [wait] * nworkers, chunksize=1)
+        if master is not None:
+            Popen(master).wait()
+            for w in w_dirs:
+                _touch(os.path.join(w, PEST_STOP))
+        results = dict(serving.get())
+    for w,secs in results.items():
+        name = os.path.basename(w)
+        for s in secs:
+            workers[name] = update_estimate(workers.get(name), s)
+        print('  --- %s finished %i runs' % (name, len(secs)))
+    save_history(history)
+    return results
+
+def run_batch_cli(argv=[]):
+    from gopest.common import config as cfg
+    from multiprocessing import cpu_count
+    if len(argv) < 2 or '--help' in argv:
+        print(__doc__)
+        return
+    nworkers = cfg['pest'].get('num_slaves')
+    if nworkers is None:
+        nworkers = max(cpu_count() - 2, 1)
+    fpars = []
+    args = argv[1:]
+    while args:
+        a = args.pop(0)
+        if a == '--workers':
+            nworkers = int(args.pop(0))
+        else:
+            fpars += sorted(glob.glob(a))
+    if not fpars:
+        print('Error! No PEST parameter file found.')
+        exit(1)
+    START_TIME = time.time()
+    results = run_batch(fpars, nworkers, silent=cfg['pest']['silent_slaves'])
+    nfail = len([r for r in results.values() if not r[0]])
+    print('%i runs (%i failed) by %i workers, finished after %.2f seconds' % (
+        len(results), nfail, nworkers, time.time() - START_TIME))
+    if nfail:
+        exit(1)
+
+def run_workers_cli(argv=[]):
+    from gopest.common import config as cfg
+    from multiprocessing import cpu_count
+    if '--help' in argv:
+        print(__doc__)
+        return
+    nworkers = cfg['pest'].get('num_slaves')
+    if nworkers is None:
+        nworkers = max(cpu_count() - 2, 1)
+    master = None
+    args = argv[1:]
+    while args:
+        a = args.pop(0)
+        if a == '--workers':
+            nworkers = int(args.pop(0))
+        elif a == '--master':
+            master, args = args, []
+        else:
+            print("Error! Unknown argument '%s'." % a)
+            exit(1)
+    if master == []:
+        print('Error! Option --master requires a command.')
+        exit(1)
+    START_TIME = time.time()
+    results = run_workers(nworkers, master=master, silent=cfg['pest']['silent_slaves'])
+    print('%i runs by %i workers, finished after %.2f seconds' % (
+        sum([len(secs) for secs in results.values()]), nworkers,
+        time.time() - START_TIME))
@@ -22,6 +22,8 @@ from gopest.utils import gener_groups
 
 from gopest.common import config
 from gopest.common import runtime
+from gopest.common import load_json
+from gopest.common import dump_json
 
 def tail(filename, n=10):
     """ Return the last n lines of a file """
@@ -164,8 +166,11 @@ def del_files_no_check(files):
         except OSError:
             pass
 
-def run_user_pre(seq):
-    """ run user supplied pre-processing function if exists """
+def run_user_pre(seq, inputs=None):
+    """ run user supplied pre-processing function if exists.  User functions
+    work on files, so any in-memory Waiwera inputs (dict of filename to JSON
+    dict, see run_ns_pr_waiwera()) are written out and removed from inputs
+    before the call. """
     file_path = 'goPESTuser.py'
     module_name = 'user'
     if os.path.exists(file_path):
@@ -176,19 +181,29 @@ def run_user_pre(seq):
         for name,func in inspect.getmembers(module, inspect.isfunction):
             print('%s has user func: %s()' % (file_path, name))
             if name == 'pre_' + seq:
+                if inputs:
+                    for fname in list(inputs.keys()):
+                        dump_json(inputs.pop(fname), fname, indent=2)
                 print('  -> calling %s() ...' % name)
                 func()
                 break
 
 def run_ns_pr_waiwera(skippr=False, sav2inc=False, simulator='waiwera-dkr',
-              allow_failed_ns=True, silent=True):
+              allow_failed_ns=True, silent=True, inputs=None):
     """
     supported platforms:
         'waiwera' - local native waiwera executable
         'waiwera-dkr' - local waiwera running on docker
         'waiwera-Maui' - NeSI Maui (uses submit_beopest.py)
         'waiwera-Mahuika' - NeSI Mahuika (uses submit_beopest.py)
+
+    inputs is an optional dict of filename to Waiwera input (JSON dict) already
+    in memory, eg. from goPESTpar.  These are used instead of loading the
+    files, each input is only written once before the simulator is launched.
+    The inputs used are left in the dict, for goPESTobs to use.
     """
+    if inputs is None:
+        inputs = {}
     fgeo = runtime['filename']['geom']
     fsav = runtime['filename']['save']
     finc = runtime['filename']['incon']
@@ -210,10 +225,13 @@ def run_ns_pr_waiwera(skippr=False, sav2inc=False, simulator='waiwera-dkr',
 
     # call user pre-processing
     # user is responsible of reading/writing files
-    run_user_pre(sequence[0])
+    run_user_pre(sequence[0], inputs)
 
-    with open(fdats[0], 'r') as f:
-        wai_ns = json.load(f)
+    if fdats[0] in inputs:
+        wai_ns = inputs[fdats[0]]
+    else:
+        wai_ns = load_json(fdats[0])
+        inputs[fdats[0]] = wai_ns
     # overwrite these just to be safe
     wai_ns["output"]["filename"] = flsts[0]
     wai_ns["mesh"]["filename"] = "g_real_model.msh"
@@ -222,8 +240,7 @@ def run_ns_pr_waiwera(skippr=False, sav2inc=False, simulator='waiwera-dkr',
         wai_ns["logfile"] = {"echo": False}
     else:
         wai_ns["logfile"] = {"echo": True}
-    with open(fdats[0], 'w') as f:
-        json.dump(wai_ns, f, indent=2, sort_keys=True)
+    dump_json(wai_ns, fdats[0], indent=2)
 
     # clean up
     del_files_no_check([
@@ -267,10 +284,13 @@ def run_ns_pr_waiwera(skippr=False, sav2inc=False, simulator='waiwera-dkr',
 
     # call user pre-processing
     # user is responsible of reading/writing files
-    run_user_pre(sequence[-1])
+    run_user_pre(sequence[-1], inputs)
 
-    with open(fdats[-1], 'r') as f:
-        wai_pr = json.load(f)
+    if fdats[-1] in inputs:
+        wai_pr = inputs[fdats[-1]]
+    else:
+        wai_pr = load_json(fdats[-1])
+        inputs[fdats[-1]] = wai_pr
     wai_pr['output']['filename'] = flsts[-1]
     wai_pr["initial"] = {"filename": flsts[0], "index": inc_idx}
     wai_pr["mesh"]["filename"] = "g_real_model.msh"
@@ -278,8 +298,7 @@ def run_ns_pr_waiwera(skippr=False, sav2inc=False, simulator='waiwera-dkr',
         wai_pr["logfile"] = {"echo": False}
     else:
         wai_pr["logfile"] = {"echo": True}
-    with open(fdats[-1], 'w') as f:
-        json.dump(wai_pr, f, indent=2, sort_keys=True)
+    dump_json(wai_pr, fdats[-1], indent=2)
 
     # clean up
     del_files_no_check([
@@ -582,14 +601,15 @@ def get_t2():
         line = f.readlines()[0].strip()
         return line
 
-def run_ns_pr():
-    """ call this from pest_model.py """
+def run_ns_pr(inputs=None):
+    """ call this from pest_model.py, see run_ns_pr_waiwera() for inputs """
     if config['simulator']['input-type'] == 'waiwera':
         return run_ns_pr_waiwera(skippr=config['model']['skip-pr'],
                                  sav2inc=True,
                                  simulator=config['simulator']['executable'],
                                  allow_failed_ns=True,
-                                 silent=False)
+                                 silent=False,
+                                 inputs=inputs)
     elif config['simulator']['input-type'] == 'aut2':
         return run_ns_pr_aut2(skippr=config['model']['skip-pr'],
                               sav2inc=False,
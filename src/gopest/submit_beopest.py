@@ -5,6 +5,7 @@ import subprocess
 
 from gopest.common import config as cfg
 from gopest.common import runtime
+from gopest.geo_cache import geo_cache_filename
 
 """
 Run this script to submit BeoPEST jobs on NeSI using Slurm.  This includes
@@ -67,16 +68,16 @@ F_PAR_SETS = ["prandom", "11", "50", "40", PST_NAME+".rrf"]
 # Enter parallel run packet size:
 # Enter name for run results file:
 
-# used for slurm to redirect as standard input
-use_input = False
-with open('_input', 'w') as f:
-    # if PEST_HP asks name of jacobian file, then use file named PST_NAME + ".jco"
-    if "/i" in SWITCHES:
-        f.write(PST_NAME + ".jco\n")
-        use_input = True
-    if "/f" in SWITCHES:
-        f.write("\n".join(F_PAR_SETS))
-        use_input = True
+# used for slurm to redirect as standard input, see write_input()
+use_input = ("/i" in SWITCHES) or ("/f" in SWITCHES)
+
+def write_input(fname='_input'):
+    with open(fname, 'w') as f:
+        # if PEST_HP asks name of jacobian file, then use file named PST_NAME + ".jco"
+        if "/i" in SWITCHES:
+            f.write(PST_NAME + ".jco\n")
+        if "/f" in SWITCHES:
+            f.write("\n".join(F_PAR_SETS))
 
 SLAVES_ON_SCRATCH = False
 KEEP_TARGZ_SLAVES = False
@@ -103,12 +104,13 @@ ENV_MODULES = [
     # "module load GCC/7.1.0",
     # "module load Python-Geo/2.7.14-gimkl-2017a",
 ]
-# user can load these modules by command 'source _load_modules.sh'
-with open('_load_modules.sh', 'w') as f:
-    f.write('\n'.join([
-        "echo !!! Please source this file to modify environment in calling shell",
-        "echo \"    'source _load_modules.sh'\"",
-        ] + ENV_MODULES))
+def write_load_modules(fname='_load_modules.sh'):
+    """ user can load these modules by command 'source _load_modules.sh' """
+    with open(fname, 'w') as f:
+        f.write('\n'.join([
+            "echo !!! Please source this file to modify environment in calling shell",
+            "echo \"    'source %s'\"" % fname,
+            ] + ENV_MODULES))
 
 ENV_MODULES_MAUI = cfg['nesi']['maui']['env_init']
 ENV_MODULES_MAHUIKA = cfg['nesi']['mahuika']['env_init']
@@ -137,6 +139,8 @@ slave_files = [
     "goPESTconfig.toml",
     "goPESTpar.list",
     "goPESTobs.list",
+    "goPESTobs.plan",
+    "goPESTpar.plan",
     # user supplied function, may not exist
     "goPESTuser.py",
 ]
@@ -147,6 +151,7 @@ slave_files += [
     runtime['filename']['dat_orig'],
 ]
 slave_files += runtime['filename']['all_geoms']
+slave_files.append(geo_cache_filename(runtime['filename']['geom']))
 slave_files += runtime['filename']['dat_seq']
 # slave_files += runtime['filename']['lst_seq']
 # user files -> copied from toml
@@ -737,6 +742,8 @@ def submit_cli(argv=[]):
 
     ### print basic info
     print("You are working under directory: %s" % SCRIPT_DIR)
+    write_input()
+    write_load_modules()
     write_to('_pest_dir', PESTDIR)
     write_to('_tough2', SIMULATOR)
     write_to('_master_dir', SCRIPT_DIR)
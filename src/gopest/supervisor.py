@@ -0,0 +1,271 @@
+""" Supervisor of the PEST agents (slaves) launched by 'gopest run'.
+
+Instead of simply waiting for the master and all agents to finish, the
+supervisor polls the agents while the master is running:
+
+- An agent that crashes (non-zero exit code, or killed by a signal other than
+  a deliberate SIGTERM/SIGINT/SIGHUP, e.g. by OOM) is restarted in a clean
+  directory (wiped and provisioned again from the master directory), up to
+  [pest] max_restarts times for each slave.  The crashed agent's stdout.txt
+  is kept next to the slave directory, as eg. slave1.stdout.crash1.txt.  Agents that exit cleanly, or
+  after the master has exited, are not restarted.
+
+- If [pest] adaptive_slaves is true, only [pest] min_slaves agents are started
+  at first, more are started (up to num_slaves) while there is enough memory
+  available (MemAvailable, less [pest] mem_reserve_mb, fits the largest memory
+  used by an agent so far) and the load average is below the number of CPUs.
+  When available memory drops below the reserve, the most recently started
+  agent is paused (SIGSTOP of its process group, including the simulator), and
+  resumed when memory becomes available again.  PEST simply sees a slow run.
+
+Memory and load are read from /proc (Linux), adaptive_slaves has no effect on
+other systems.
+"""
+
+import os
+import os.path
+import shutil
+import signal
+import time
+from subprocess import Popen, TimeoutExpired
+from multiprocessing import cpu_count
+
+from gopest.provision import provision_dir
+
+# agents killed by these were shut down on purpose, not restarted
+STOP_SIGNALS = (signal.SIGTERM, signal.SIGINT, signal.SIGHUP)
+
+def mem_available():
+    """ returns available memory (MB) of the system, None if unknown """
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024.
+    except OSError:
+        pass
+    return None
+
+def _children_map():
+    """ returns dict of pid to list of child pids, of all processes """
+    children = {}
+    for d in os.listdir('/proc'):
+        if not d.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % d, 'r') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # comm (2nd field) is in brackets, and may contain spaces
+        ppid = int(stat[stat.rindex(')')+2:].split()[1])
+        children.setdefault(ppid, []).append(int(d))
+    return children
+
+def process_tree_rss(pid, children=None):
+    """ returns resident memory (MB) of process pid and all its descendants """
+    if children is None:
+        children = _children_map()
+    total, stack = 0, [pid]
+    while stack:
+        p = stack.pop()
+        stack += children.get(p, [])
+        try:
+            with open('/proc/%i/status' % p, 'r') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+                        break
+        except OSError:
+            pass
+    return total / 1024.
+
+class AgentSlot(object):
+    """ an agent (and optionally its agent daemon) running in directory s_dir
+    """
+    def __init__(self, s_dir, cmd, silent=True, daemon=False, src='.', readonly=()):
+        self.s_dir = s_dir
+        self.cmd = cmd
+        self.silent = silent
+        self.daemon = daemon
+        self.src = src
+        self.readonly = readonly
+        self.proc, self.daemon_proc, self.stdout = None, None, None
+        self.paused = False
+        self.restarts = 0
+
+    def start(self):
+        if self.silent:
+            self.stdout = open(os.path.join(self.s_dir, 'stdout.txt'), 'a')
+        opts = {
+            'cwd': self.s_dir,
+            'stdout': self.stdout,
+            'stderr': self.stdout,
+            # own process group, so the simulator can be paused/stopped too
+            'start_new_session': True,
+        }
+        if self.daemon:
+            self.daemon_proc = Popen(['gopest', 'agent-daemon'], **opts)
+        self.proc = Popen(self.cmd, **opts)
+        self.paused = False
+
+    def running(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def exited(self):
+        return self.proc is not None and self.proc.poll() is not None
+
+    def crashed(self):
+        """ True if agent exited with an error or an unexpected signal """
+        if not self.exited():
+            return False
+        code = self.proc.returncode
+        return code > 0 or (code < 0 and -code not in STOP_SIGNALS)
+
+    def signal(self, sig):
+        """ signals whole process groups, the simulator may still be running
+        even if agent itself exited """
+        for p in [self.proc, self.daemon_proc]:
+            if p is not None:
+                try:
+                    os.killpg(p.pid, sig)
+                except OSError:
+                    pass
+
+    def pause(self):
+        self.signal(signal.SIGSTOP)
+        self.paused = True
+
+    def resume(self):
+        self.signal(signal.SIGCONT)
+        self.paused = False
+
+    def stop(self, timeout=10.0):
+        """ terminates agent (and daemon) and all their child processes """
+        if self.paused:
+            self.resume()
+        self.signal(signal.SIGTERM)
+        for p in [self.proc, self.daemon_proc]:
+            if p is not None:
+                try:
+                    p.wait(timeout)
+                except TimeoutExpired:
+                    self.signal(signal.SIGKILL)
+                    p.wait()
+        self.daemon_proc = None
+        if self.stdout is not None:
+            self.stdout.close()
+            self.stdout = None
+
+    def restart(self):
+        """ restarts agent in a clean directory, the output of the crashed
+        agent is kept, see crash_log() """
+        self.stop()
+        self.restarts += 1
+        fout = os.path.join(self.s_dir, 'stdout.txt')
+        if os.path.isfile(fout):
+            os.replace(fout, self.crash_log())
+        shutil.rmtree(self.s_dir)
+        provision_dir(self.s_dir, self.src, self.readonly)
+        self.start()
+
+    def crash_log(self):
+        """ file name the output of the latest crash is kept as """
+        s_dir = os.path.normpath(self.s_dir)
+        return '%s.stdout.crash%i.txt' % (s_dir, self.restarts)
+
+    def rss(self, children=None):
+        if not self.running():
+            return 0.0
+        total = process_tree_rss(self.proc.pid, children)
+        if self.daemon_proc is not None:
+            total += process_tree_rss(self.daemon_proc.pid, children)
+        return total
+
+class Supervisor(object):
+    """ launches master command and agents of slots, supervises the agents
+    until master finishes, see module doc. """
+    def __init__(self, master_cmd, slots, max_restarts=3, adaptive=False,
+                 min_agents=1, mem_reserve=2000.0, interval=5.0):
+        self.master_cmd = master_cmd
+        self.slots = slots
+        self.max_restarts = max_restarts
+        self.adaptive = adaptive and mem_available() is not None
+        self.min_agents = max(1, min(min_agents, len(slots)))
+        self.mem_reserve = mem_reserve
+        self.interval = interval
+        self.peak_rss = 0.0
+        self.master = None
+
+    def log(self, msg):
+        print('Supervisor: %s' % msg)
+
+    def started(self):
+        return [s for s in self.slots if s.proc is not None]
+
+    def check_exited(self):
+        """ restarts agents that crashed while master is still running """
+        if self.master is not None and self.master.poll() is not None:
+            return
+        for i,s in enumerate(self.slots):
+            if s.crashed() and s.restarts < self.max_restarts:
+                self.log('agent %i crashed (%s), restart %i in clean directory %s' % (
+                    i+1, str(s.proc.returncode), s.restarts+1, s.s_dir))
+                s.restart()
+
+    def adapt(self, avail, load):
+        """ starts, pauses or resumes one agent according to available memory
+        avail (MB) and load average """
+        children = _children_map()
+        for s in self.slots:
+            self.peak_rss = max(self.peak_rss, s.rss(children))
+        active = [s for s in self.started() if s.running() and not s.paused]
+        paused = [s for s in self.started() if s.running() and s.paused]
+        if avail < self.mem_reserve and len(active) > 1:
+            active[-1].pause()
+            self.log('low memory (%.0f MB available), paused agent in %s' % (avail, active[-1].s_dir))
+        elif avail > self.mem_reserve + self.peak_rss:
+            if paused:
+                paused[0].resume()
+                self.log('resumed agent in %s' % paused[0].s_dir)
+            elif load < cpu_count():
+                for s in self.slots:
+                    if s.proc is None:
+                        s.start()
+                        self.log('started agent in %s, %i agents (peak %.0f MB each)' % (
+                            s.s_dir, len(self.started()), self.peak_rss))
+                        break
+
+    def stop_all(self):
+        for s in self.slots:
+            s.stop()
+
+    def run(self):
+        self.master = Popen(self.master_cmd)
+        time.sleep(0.1)
+        nstart = self.min_agents if self.adaptive else len(self.slots)
+        for s in self.slots[:nstart]:
+            s.start()
+        try:
+            while self.master.poll() is None:
+                time.sleep(self.interval)
+                if self.master.poll() is not None:
+                    break
+                self.check_exited()
+                avail = mem_available() if self.adaptive else None
+                # /proc/meminfo may become unreadable, skipped until it is back
+                if avail is not None:
+                    self.adapt(avail, os.getloadavg()[0])
+        finally:
+            if self.master.poll() is None:
+                self.master.terminate()
+            self.master.wait()
+            # agents normally exit with master, give them a little time
+            for s in self.slots:
+                if s.running() and not s.paused:
+                    try:
+                        s.proc.wait(self.interval)
+                    except TimeoutExpired:
+                        pass
+            self.stop_all()
+        return self.master.returncode
@@ -39,6 +39,11 @@ class h5table(listingtable):
     dictionary), table[rowname] returns the row with the specified name, and
     table[colname] returns the column with the specified name.
 
+    Columns of the current time slice are read from h5 only once and kept in
+    memory, so repeated row/column lookups at the same time index do not go
+    back to the h5 file.  Use .take() to get values of many rows at once.
+    Columns returned are the cached arrays, hence read-only.
+
     !!! IMPORTANT !!!
     .index needs to be set whenever listing object changed time index
     """
@@ -63,32 +68,79 @@ class h5table(listingtable):
         self._row = dict([(r,i) for i,r in enumerate(rows)])
         self._h5_table = h5_table
         self._index = index # time index
+        self._cache = {} # column index -> values of time slice _cache_index
+        self._cache_index = index
 
     def __repr__(self):
         # h5 table lst._h5['element'][time index, eleme index, field index]
         return repr(self.column_name) + '\n' + repr(self._h5_table[self._index, :, :])
 
+    def _check_cache(self):
+        """ cached columns are only valid for the time index they were read """
+        if self._cache_index != self._index:
+            self._cache = {}
+            self._cache_index = self._index
+
+    def _column(self, ci):
+        """ values of column index ci at current time index, cached """
+        self._check_cache()
+        if ci not in self._cache:
+            values = self._h5_table[self._index, :, ci]
+            # shared by later lookups, must not be modified by callers
+            values.setflags(write=False)
+            self._cache[ci] = values
+        return self._cache[ci]
+
+    def _row_values(self, rowindex):
+        """ values of a row at current time index, only the row is read unless
+        all columns are already cached """
+        self._check_cache()
+        if len(self._cache) == len(self.column_name):
+            return [self._cache[ci][rowindex] for ci in range(len(self.column_name))]
+        return list(self._h5_table[self._index, rowindex, :])
+
     def __getitem__(self, key):
         if isinstance(key, int):
             return dict(zip(['key'] + self.column_name, [self.row_name[key]] +
-                            list(self._h5_table[self._index, key, :])))
+                            self._row_values(key)))
         else:
             if key in self.column_name:
-                return self._h5_table[self._index, :, self._col[key]]
-            elif key in self.row_name:
+                return self._column(self._col[key])
+            elif key in self._row:
                 rowindex = self._row[key]
                 return dict(zip(['key'] + self.column_name,
                                 [self.row_name[rowindex]] +
-                                list(self._h5_table[self._index, rowindex, :])))
+                                self._row_values(rowindex)))
             elif len(key) > 1 and self.allow_reverse_keys:
                 revkey = key[::-1] # try reversed key for multi-key tables
-                if revkey in self.row_name:
+                if revkey in self._row:
                     rowindex = self._row[revkey]
                     return dict(zip(['key'] + self.column_name,
                                     [self.row_name[rowindex][::-1]] +
-                                    list(-self._h5_table[self._index, rowindex, :])))
+                                    [-v for v in self._row_values(rowindex)]))
             else: return None
 
+    def take(self, rows, column):
+        """ Returns values (np.array) of column (name) for a list of rows at
+        the current time index.  Rows can be specified by index (int) or row
+        name, a reversed key of multi-key tables (if allow_reverse_keys) gives
+        negated values.
+        """
+        idx, sign = np.zeros(len(rows), dtype=int), np.ones(len(rows))
+        for i,r in enumerate(rows):
+            if isinstance(r, (int, np.integer)):
+                idx[i] = r
+            elif r in self._row:
+                idx[i] = self._row[r]
+            elif len(r) > 1 and self.allow_reverse_keys and r[::-1] in self._row:
+                idx[i], sign[i] = self._row[r[::-1]], -1.0
+            else:
+                raise KeyError(r)
+        values = self._column(self._col[column])[idx]
+        if self.allow_reverse_keys:
+            values = values * sign
+        return values
+
     def __add__(self, other):
         raise NotImplementedError
         """Adds two listing tables together."""
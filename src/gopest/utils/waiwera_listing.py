@@ -24,6 +24,9 @@ Wrap Waiwera's hdf5 output as t2listing
 import h5py
 import numpy as np
 
+import os.path
+import hashlib
+
 from mulgrids import mulgrid
 from t2listing import listingtable
 
@@ -32,8 +35,17 @@ import time
 import unittest
 from pprint import pprint as pp
 
+# .history() reads the whole hyperslab covering the selected columns if it is
+# no more than this many times the number of columns actually needed
+HISTORY_SLAB_FACTOR = 4
+
+# attributes only available after the connection table is set up
+CONNECTION_ATTRS = ['connection', 'face_idx', 'face_idx_dir',
+                    '_face_cell_keys', '_face_cell_order', '_face_cell_base']
+
 class wlisting(object):
-    def __init__(self, filename=None, geo=None, fjson=None, size_check=True):
+    def __init__(self, filename=None, geo=None, fjson=None, size_check=True,
+                 face_cache=None):
         """ Waiwera h5 output pretending to be t2listing
 
         If corresponding geo is supplied, wlisting can behave more like
@@ -41,6 +53,10 @@ class wlisting(object):
 
         If Waiwera input json is provided, then .generation has .row_name using
         (t2 block name, source name) instead of (cell index, source index).
+
+        If face_cache (a .npz filename) is supplied, the mapping between
+        Waiwera faces and geo connections is saved there and reused as long as
+        the faces in the h5 file and the geometry still match.
         """
         self._table = {}
         if isinstance(geo, str):
@@ -59,6 +75,7 @@ class wlisting(object):
         self.filename = filename
         self.simulator = 'waiwera'
         self.size_check = size_check # raise Exception if number of block does not match geo
+        self.face_cache = face_cache
         self.setup()
 
     def close(self):
@@ -98,93 +115,10 @@ class wlisting(object):
             cols = sorted([c for c in self._h5['cell_fields'].keys() if c.startswith('fluid_')])
             table = listingtable(cols, blocks, num_keys=1)
             self._table['element'] = table
-        ### connection table
+        ### connection table, only built when first used, see .__getattr__()
+        self._lazy_tables = {}
         if 'face_fields' in self._h5:
-            cid1 = self._h5['face_cell_1'][:,0]
-            cid2 = self._h5['face_cell_2'][:,0]
-            # .face_idx equivalent to .cell_idx and .source_idx, which maps waiwera h5 table into
-            # geo/mulgrid order, there is no "natural order" of faces in waiwera, so we have to
-            # build one here
-            self.face_idx = []
-            self.face_idx_dir = []
-            if self.geo is not None:
-                print('wlisting.connection: tuple of mulgrid block names (str, str) as key.')
-                face_keys = self.geo.block_connection_name_list
-                # w_boundary is a list of dict, in the order of wjson boundaries, each dict has key
-                # of block1, gives name of b2.
-                w_boundary = []
-                if self.wjson is not None and 'boundaries' in self.wjson:
-                    for bd in self.wjson['boundaries']:
-                        b2_names = {}
-                        for i1 in bd['faces']['cells']:
-                            b1 = w_blocks[i1]
-                            b2 = '     ' # default empty , overwritten if atmosphere
-                            if bd['faces']['normal'] == [0.0, 0.0, 1.0]:
-                                # if connect upwards, assume atmospheric, use mulgrid atm block names
-                                b1_col = self.geo.column[self.geo.column_name(b1)]
-                                b1_lay = self.geo.layer[self.geo.layer_name(b1)]
-                                if self.geo.column_surface_layer(b1_col).name == b1_lay.name:
-                                    if self.geo.atmosphere_type == 0:
-                                        b2 = self.geo.block_name_list[0]
-                                    elif self.geo.atmosphere_type == 1:
-                                        b2 = self.geo.block_name(self.geo.layerlist[0].name, b1_col.name)
-                            b2_names[b1] = b2
-                        w_boundary.append(b2_names)
-                # this translate waiwera cell ids in (face_cell_1, face_cell_2) into block names
-                # w_connection_name_index has keys of (b1 name, b2 name), value is waiwera face index
-                # ordered as in h5 file
-                w_connection_name_index = {}
-                self.w_connection_index_index = {} # useful if given two waiwera cell indices
-                for i,(c1,c2) in enumerate(zip(cid1, cid2)):
-                    self.w_connection_index_index[(c1,c2)] = i
-                    b1 = w_blocks[c1]
-                    if c2 < 0:
-                        if w_boundary:
-                            # face_cell_2 contains the negative of the (1-based) index of the boundaries
-                            # specified in json
-                            b2 = w_boundary[-c2-1][b1]
-                        else:
-                            # either wai JSON not loaded OR none are standard atm conne
-                            b2 = '     '
-                            # simply assumes atm conne if top of the model
-                            b1_col = self.geo.column[self.geo.column_name(b1)]
-                            b1_lay = self.geo.layer[self.geo.layer_name(b1)]
-                            if self.geo.column_surface_layer(b1_col).name == b1_lay.name:
-                                if self.geo.atmosphere_type == 0:
-                                    b2 = self.geo.block_name_list[0]
-                                elif self.geo.atmosphere_type == 1:
-                                    b2 = self.geo.block_name(self.geo.layerlist[0].name, b1_col.name)
-                    else:
-                        b2 = w_blocks[c2]
-                    w_connection_name_index[(b1,b2)] = i
-                for c in self.geo.block_connection_name_list:
-                    # (cell1, cell2) positive means cell1 -> cell2
-                    # NOTE this is opposite to T2/AUT2's result convention!
-                    if c in w_connection_name_index:
-                        self.face_idx.append(w_connection_name_index[c])
-                        self.face_idx_dir.append(-1.0)
-                    elif c[::-1] in w_connection_name_index:
-                        self.face_idx.append(w_connection_name_index[c[::-1]])
-                        self.face_idx_dir.append(1.0)
-                    else:
-                        debugxx = []
-                        for key in w_connection_name_index:
-                            if c[0] in key:
-                                debugxx.append(key)
-                        msg = str(debugxx)
-                        msg += '\nMulgrid connection name %s not found in Waiwera H5 output.' % str(c)
-                        raise Exception(msg)
-            else:
-                print('wlisting.connection: tuple of natural cell indices (as str, as str) as key.')
-                # keeps whatever order is in h5, NOTE the order is unpredictable
-                face_keys = [(str(i), str(j)) for i,j in zip(cid1, cid2)]
-                self.face_idx = list(range(len(cid1)))
-                self.face_idx_dir = [-1.0] * len(cid1)
-
-            self.face_idx_dir = np.array(self.face_idx_dir)
-            cols = sorted([c for c in self._h5['face_fields'].keys() if c.startswith('flux_')])
-            table = listingtable(cols, face_keys, num_keys=2, allow_reverse_keys=True)
-            self._table['connection'] = table
+            self._lazy_tables['connection'] = self.setup_connection
         ### gener table
         if 'source_fields' in self._h5:
             self.source_name_index = {} # allows either source name or (block name, gener name) as key
@@ -220,6 +154,180 @@ class wlisting(object):
         # have to be get first table ready
         self.index = 0
 
+    def __getattr__(self, name):
+        """ the connection table and face index maps are built on first use,
+        as they are expensive for large meshes and often not needed """
+        lazy = self.__dict__.get('_lazy_tables', {})
+        if name in CONNECTION_ATTRS and 'connection' in lazy:
+            setup = lazy.pop('connection')
+            try:
+                setup()
+            except:
+                lazy['connection'] = setup
+                raise
+            return getattr(self, name)
+        raise AttributeError("'%s' object has no attribute '%s'" % (type(self).__name__, name))
+
+    def setup_connection(self):
+        """ builds .connection table, and .face_idx/.face_idx_dir """
+        cid1 = self._h5['face_cell_1'][:,0].astype(np.int64)
+        cid2 = self._h5['face_cell_2'][:,0].astype(np.int64)
+        # waiwera cell index pairs (face_cell_1, face_cell_2) as sorted int keys
+        # for .face_index(), face_cell_2 is negative for boundary faces
+        nbnd = max(0, -int(cid2.min())) if len(cid2) else 0
+        self._face_cell_base = (len(self.cell_idx) + nbnd + 1, nbnd)
+        keys = cid1 * self._face_cell_base[0] + (cid2 + nbnd)
+        self._face_cell_order = np.argsort(keys, kind='stable')
+        self._face_cell_keys = keys[self._face_cell_order]
+        # .face_idx equivalent to .cell_idx and .source_idx, which maps waiwera h5 table into
+        # geo/mulgrid order, there is no "natural order" of faces in waiwera, so we have to
+        # build one here
+        if self.geo is not None:
+            print('wlisting.connection: tuple of mulgrid block names (str, str) as key.')
+            face_keys = self.geo.block_connection_name_list
+            cached = self._load_face_cache(cid1, cid2)
+            if cached is None:
+                self.face_idx, self.face_idx_dir = self._match_faces(cid1, cid2)
+                self._save_face_cache(cid1, cid2)
+            else:
+                self.face_idx, self.face_idx_dir = cached
+        else:
+            print('wlisting.connection: tuple of natural cell indices (as str, as str) as key.')
+            # keeps whatever order is in h5, NOTE the order is unpredictable
+            face_keys = [(str(i), str(j)) for i,j in zip(cid1, cid2)]
+            self.face_idx = np.arange(len(cid1))
+            self.face_idx_dir = np.full(len(cid1), -1.0)
+        cols = sorted([c for c in self._h5['face_fields'].keys() if c.startswith('flux_')])
+        table = listingtable(cols, face_keys, num_keys=2, allow_reverse_keys=True)
+        self._table['connection'] = table
+        self.connection = table
+        self.read_connection_table()
+
+    def _match_faces(self, cid1, cid2):
+        """ Returns (face_idx, face_idx_dir) arrays, matching each connection
+        in geo.block_connection_name_list to a face in h5.  Faces and
+        connections are both converted into keys of (block index 1, block
+        index 2) and matched by sorted search.
+
+        (cell1, cell2) positive means cell1 -> cell2
+        NOTE this is opposite to T2/AUT2's result convention!
+        """
+        geo = self.geo
+        natm = geo.num_atmosphere_blocks
+        ncell = len(self.cell_idx)
+        nkey = natm + ncell + 1
+        # the atmosphere block a cell connects to via a boundary face, only if
+        # the cell is at the top of its column, otherwise -1
+        top_atm = np.full(ncell, -1, dtype=np.int64)
+        if geo.atmosphere_type in [0, 1]:
+            for col in geo.columnlist:
+                lay = geo.column_surface_layer(col)
+                bi = geo.block_name_index[geo.block_name(lay.name, col.name)]
+                if geo.atmosphere_type == 0:
+                    top_atm[bi - natm] = 0
+                else:
+                    top_atm[bi - natm] = geo.block_name_index[geo.block_name(geo.layerlist[0].name, col.name)]
+        b1 = cid1 + natm
+        b2 = np.where(cid2 >= 0, cid2 + natm, -1)
+        bnd = cid2 < 0
+        if self.wjson is not None and self.wjson.get('boundaries'):
+            # face_cell_2 contains the negative of the (1-based) index of the
+            # boundaries specified in json, if connect upwards, assume atmospheric
+            upward = np.array([bd['faces']['normal'] == [0.0, 0.0, 1.0] for bd in self.wjson['boundaries']])
+            atm = bnd.copy()
+            atm[bnd] = upward[-cid2[bnd]-1]
+        else:
+            # either wai JSON not loaded OR none are standard atm conne, simply
+            # assumes atm conne if top of the model
+            atm = bnd
+        b2[atm] = top_atm[cid1[atm]]
+        valid = b2 >= 0
+        fkeys = b1[valid] * nkey + b2[valid]
+        fids = np.nonzero(valid)[0]
+        order = np.argsort(fkeys, kind='stable')
+        fkeys, fids = fkeys[order], fids[order]
+
+        names = np.array(geo.block_name_list)
+        border = np.argsort(names)
+        conn = np.array(geo.block_connection_name_list).reshape(-1, 2)
+        g = border[np.searchsorted(names[border], conn)].astype(np.int64)
+
+        def lookup(keys):
+            # last face with matching key, -1 if not found
+            if len(fkeys) == 0:
+                return np.full(len(keys), -1)
+            pos = np.searchsorted(fkeys, keys, side='right') - 1
+            pos_c = np.clip(pos, 0, None)
+            found = (pos >= 0) & (fkeys[pos_c] == keys)
+            return np.where(found, fids[pos_c], -1)
+        fwd = lookup(g[:,0] * nkey + g[:,1])
+        rev = lookup(g[:,1] * nkey + g[:,0])
+        face_idx = np.where(fwd >= 0, fwd, rev)
+        face_idx_dir = np.where(fwd >= 0, -1.0, 1.0)
+
+        missing = np.nonzero(face_idx < 0)[0]
+        if len(missing) > 0:
+            c = geo.block_connection_name_list[missing[0]]
+            bnames = geo.block_name_list + ['     '+str(i) for i in range(ncell + natm - geo.num_blocks)]
+            def bname(i): return bnames[i] if i >= 0 else '     '
+            debugxx = [(bname(i), bname(j)) for i,j in zip(b1, b2) if c[0] in (bname(i), bname(j))]
+            msg = str(debugxx)
+            msg += '\nMulgrid connection name %s not found in Waiwera H5 output.' % str(c)
+            raise Exception(msg)
+        return face_idx, face_idx_dir
+
+    def _face_cache_key(self, cid1, cid2):
+        """ identifies faces in h5 and the geometry they are matched to """
+        h = hashlib.sha1()
+        h.update(np.ascontiguousarray(cid1).tobytes())
+        h.update(np.ascontiguousarray(cid2).tobytes())
+        if self.wjson is not None and self.wjson.get('boundaries'):
+            h.update(str([bd['faces']['normal'] for bd in self.wjson['boundaries']]).encode())
+        h.update(str((self.geo.num_blocks, self.geo.num_connections,
+                      self.geo.atmosphere_type)).encode())
+        # a remeshed geometry may have the same numbers of blocks/connections
+        h.update('\n'.join(self.geo.block_name_list).encode())
+        h.update('\n'.join([c1 + c2 for c1,c2 in self.geo.block_connection_name_list]).encode())
+        return h.hexdigest()
+
+    def _load_face_cache(self, cid1, cid2):
+        if self.face_cache is None or not os.path.isfile(self.face_cache):
+            return None
+        try:
+            with np.load(self.face_cache) as npz:
+                if str(npz['key']) != self._face_cache_key(cid1, cid2):
+                    return None
+                return npz['face_idx'], npz['face_idx_dir']
+        except Exception as e:
+            print("Warning! Unable to load face cache '%s': %s" % (self.face_cache, str(e)))
+            return None
+
+    def _save_face_cache(self, cid1, cid2):
+        """ saves face mapping, silently skipped if not writable.  The cache
+        is replaced (never written into), as it may be shared (hardlinked)
+        with slave directories, see provision.readonly_inputs(). """
+        if self.face_cache is None:
+            return
+        ftmp = '%s.%i.tmp' % (self.face_cache, os.getpid())
+        try:
+            with open(ftmp, 'wb') as f:
+                np.savez(f, key=self._face_cache_key(cid1, cid2),
+                         face_idx=self.face_idx, face_idx_dir=self.face_idx_dir)
+            os.replace(ftmp, self.face_cache)
+        except OSError:
+            if os.path.exists(ftmp):
+                os.remove(ftmp)
+
+    def face_index(self, c1, c2):
+        """ Returns h5 face index of face between Waiwera cells (c1, c2) as in
+        face_cell_1 and face_cell_2 """
+        base, nbnd = self._face_cell_base
+        key = c1 * base + (c2 + nbnd)
+        pos = np.searchsorted(self._face_cell_keys, key, side='right') - 1
+        if pos < 0 or self._face_cell_keys[pos] != key:
+            raise KeyError((c1, c2))
+        return self._face_cell_order[pos]
+
     def history(self, selection, short=False, start_datetime=None):
         """ Returns time histories for specified selection of table type, names
         (or indices) and column names.  This is implemented to be similar to
@@ -241,72 +349,114 @@ class wlisting(object):
             a name and each source has a single cell in the Waiwera JSON input.
 
         short and start_datetime are not implemented at the moment
+
+        All selections are resolved into h5 dataset column indices first, then
+        grouped by table and field, so that each dataset is read only once
+        regardless how many blocks/faces/sources are requested.
         """
         if short is True: raise Exception('.history() short=True not implemented yet')
         if start_datetime is not None: raise Exception('.history() start_datetime not implemented yet')
         if isinstance(selection, tuple):
             selection = [selection]
-        results = []
+        # (h5 group, field) -> list of dataset column indices
+        groups, locs = {}, []
         for tbl,b,cname in selection:
-            if tbl == 'e':
-                if isinstance(b, str):
-                    bi = self.geo.block_name_index[b]
-                elif isinstance(b, int):
-                    bi = b
-                else:
-                    raise Exception('.history() block must be an int or str: %s (%s)' % (str(b),str(type(b))))
-                if bi < 0:
-                    bi = self.geo.num_blocks + bi
-                if bi < self.geo.num_atmosphere_blocks:
-                    raise Exception('.history() does not support extracting results for atmosphere blocks')
-                ### important to convert cell index
-                bbi = self.cell_idx[bi-self.geo.num_atmosphere_blocks]
-                ys = self._h5['cell_fields'][cname][:,bbi]
-                results.append((self.fulltimes, ys))
-            elif tbl == 'c':
-                if isinstance(b[0], int):
-                    # (i1, i2) assume both are integer cell index in Waiwera sense
-                    cci = self.w_connection_index_index[b]
-                elif isinstance(b[0], str):
-                    # (b1, b2) assume both are string block names in mulgrid
-                    if self.geo is None:
-                        raise Exception('Mulgrid geometry is required if connection tuple is specified by block names.')
-                    ci = self.geo.block_connection_name_index[b]
-                    cci = self.face_idx[ci]
-                ys = self._h5['face_fields'][cname][:,cci]
-                results.append((self.fulltimes, ys))
-            elif tbl == 'g':
-                if isinstance(b, tuple):
-                    # (block name, source name) both str
-                    gi = self.source_name_index[b]
-                elif isinstance(b, str):
-                    # single natural source index !! diff from TOUGH2
-                    gi = self.source_name_index[b]
-                if isinstance(b, int):
-                    # directly as source index
-                    gi = b
-                ggi = self.source_idx[gi]
-                ys = self._h5['source_fields'][cname][:,ggi]
-                results.append((self.fulltimes, ys))
-            else:
-                raise Exception('Unsupported .history() selection table type: %s' % tbl)
+            grp, i = self.selection_index(tbl, b)
+            key = (grp, cname)
+            if key not in groups:
+                groups[key] = []
+            locs.append((key, len(groups[key])))
+            groups[key].append(i)
+        columns = {}
+        for (grp,cname),idx in groups.items():
+            columns[(grp,cname)] = self._read_columns(grp, cname, idx)
+        results = [(self.fulltimes, columns[key][j]) for key,j in locs]
         if len(results) == 1: results = results[0]
         return results
 
+    def selection_index(self, tbl, b):
+        """ Returns (h5 group name, dataset column index) of a single .history()
+        selection, see .history() for the supported forms of b.
+        """
+        if tbl == 'e':
+            if self.geo is None:
+                natm, nblocks = 0, len(self.cell_idx)
+            else:
+                natm, nblocks = self.geo.num_atmosphere_blocks, self.geo.num_blocks
+            if isinstance(b, str):
+                if self.geo is None:
+                    raise Exception('Mulgrid geometry is required if block is specified by name.')
+                bi = self.geo.block_name_index[b]
+            elif isinstance(b, int):
+                bi = b
+            else:
+                raise Exception('.history() block must be an int or str: %s (%s)' % (str(b),str(type(b))))
+            if bi < 0:
+                bi = nblocks + bi
+            if bi < natm:
+                raise Exception('.history() does not support extracting results for atmosphere blocks')
+            ### important to convert cell index
+            return 'cell_fields', self.cell_idx[bi-natm]
+        elif tbl == 'c':
+            if isinstance(b[0], int):
+                # (i1, i2) assume both are integer cell index in Waiwera sense
+                cci = self.face_index(*b)
+            elif isinstance(b[0], str):
+                # (b1, b2) assume both are string block names in mulgrid
+                if self.geo is None:
+                    raise Exception('Mulgrid geometry is required if connection tuple is specified by block names.')
+                ci = self.geo.block_connection_name_index[b]
+                cci = self.face_idx[ci]
+            return 'face_fields', cci
+        elif tbl == 'g':
+            if isinstance(b, tuple):
+                # (block name, source name) both str
+                gi = self.source_name_index[b]
+            elif isinstance(b, str):
+                # single natural source index !! diff from TOUGH2
+                gi = self.source_name_index[b]
+            if isinstance(b, int):
+                # directly as source index
+                gi = b
+            return 'source_fields', self.source_idx[gi]
+        else:
+            raise Exception('Unsupported .history() selection table type: %s' % tbl)
+
+    def _read_columns(self, grp, cname, idx):
+        """ Read columns idx (list of int, can be unsorted and repeated) of a h5
+        dataset over all times.  Returns an array of shape (len(idx), ntimes).
+
+        h5py only supports fancy indexing with increasing unique indices, which
+        is also slow if the selection is sparse but large.  If the selected
+        columns are reasonably dense, the whole hyperslab covering them is read
+        instead and sliced in memory.
+        """
+        ds = self._h5[grp][cname]
+        uniq, inv = np.unique(np.asarray(idx, dtype=int), return_inverse=True)
+        lo, hi = uniq[0], uniq[-1] + 1
+        if (hi - lo) <= HISTORY_SLAB_FACTOR * len(uniq):
+            data = ds[:, lo:hi][:, uniq - lo]
+        else:
+            data = ds[:, uniq]
+        return np.ascontiguousarray(data[:, inv.ravel()].T)
+
     def read_tables(self):
         """ copy values from h5 into listingtables, with slicing """
         if 'element' in self.table_names:
             nh5 = len(self.cell_idx)
             for i,cname in enumerate(self.element.column_name):
                 self.element._data[-nh5:,i] = self._h5['cell_fields'][cname][self._index][self.cell_idx]
-        if 'connection' in self.table_names:
-            for i,cname in enumerate(self.connection.column_name):
-                # re-order as geo.block_connection_name_list and reverse values if required
-                self.connection._data[:,i] = self._h5['face_fields'][cname][self._index][self.face_idx] * self.face_idx_dir
+        if 'connection' in self._table:
+            self.read_connection_table()
         if 'generation' in self.table_names:
             for i,cname in enumerate(self.generation.column_name):
                 self.generation._data[:,i] = self._h5['source_fields'][cname][self._index][self.source_idx]
 
+    def read_connection_table(self):
+        for i,cname in enumerate(self.connection.column_name):
+            # re-order as geo.block_connection_name_list and reverse values if required
+            self.connection._data[:,i] = self._h5['face_fields'][cname][self._index][self.face_idx] * self.face_idx_dir
+
     def get_index(self): return self._index
     def set_index(self, i):
         self._index = i
@@ -328,7 +478,7 @@ class wlisting(object):
         return more
 
     def get_table_names(self):
-        return sorted(self._table.keys())
+        return sorted(list(self._table.keys()) + list(self._lazy_tables.keys()))
     table_names = property(get_table_names)
 
     def get_time(self): return self.fulltimes[self.index]
@@ -0,0 +1,98 @@
+"""
+Summarise Waiwera's YAML log (.yaml) without loading the whole document.
+
+Waiwera writes its log as a YAML list of flow-style records, one per line:
+
+    - [info, timestep, end, {count: 10, tries: 1, size: 1.0e+15, time: ...}]
+
+Logs of long natural state runs can be hundreds of MB, while check-slaves only
+needs the last few records.  tail_records() reads blocks backwards from the
+end of the file and parses only the trailing records.  timestep_stats() scans
+the file once, line by line, matching timestep records as text.
+"""
+
+import os
+import re
+
+import yaml
+
+try:
+    Loader = yaml.CSafeLoader
+except AttributeError:
+    Loader = yaml.SafeLoader
+
+RECORD_START = b'- ['
+TIMESTEP_END = b', timestep, end, {'
+FIELD = re.compile(rb'\b(tries|size): *([^,}\s]+)')
+
+def tail_records(fyaml, n=3, blocksize=65536):
+    """ returns list of the last n records (each a list of level, source,
+    event, data) of Waiwera log file fyaml, fewer if the log is shorter """
+    with open(fyaml, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        tail = b''
+        while pos > 0:
+            step = min(blocksize, pos)
+            pos -= step
+            f.seek(pos)
+            tail = f.read(step) + tail
+            # need n complete records, ie. n+1 record starts unless at the top
+            if tail.count(b'\n' + RECORD_START) > n:
+                break
+    lines = tail.splitlines()
+    if pos > 0:
+        # first line may be a partial one
+        lines = lines[1:]
+    istarts = [i for i,line in enumerate(lines) if line.startswith(RECORD_START)]
+    if not istarts:
+        return []
+    text = b'\n'.join(lines[istarts[max(0, len(istarts) - n)]:])
+    records = yaml.load(text.decode('utf-8', errors='replace'), Loader=Loader)
+    return records or []
+
+def sim_ends(fyaml):
+    """ returns dict of 'endtime', 'stepsize' (of the last timestep) and
+    'elapsed' (seconds), empty if the simulation did not finish properly """
+    try:
+        records = tail_records(fyaml, n=3)
+    except (OSError, yaml.YAMLError):
+        return {}
+    if not records or records[-1][:3] != ['info', 'simulation', 'destroy']:
+        return {}
+    for r in reversed(records):
+        if r[:3] == ['info', 'timestep', 'end']:
+            return {
+                'endtime': r[3]['time'],
+                'stepsize': r[3]['size'],
+                'elapsed': records[-1][3]['elapsed_seconds'],
+            }
+    return {}
+
+def timestep_stats(fyaml):
+    """ returns dict of timestep statistics of Waiwera log file fyaml, from a
+    single pass over the lines: number of 'steps', 'retries' (extra tries of
+    steps that needed more than one), 'failures' (timestep warnings and
+    errors, eg. reductions or aborts), 'min_dt' and 'max_dt' """
+    steps, retries, failures = 0, 0, 0
+    min_dt, max_dt = None, None
+    with open(fyaml, 'rb') as f:
+        for line in f:
+            if TIMESTEP_END in line:
+                steps += 1
+                for k,v in FIELD.findall(line):
+                    if k == b'size':
+                        dt = float(v)
+                        min_dt = dt if min_dt is None else min(min_dt, dt)
+                        max_dt = dt if max_dt is None else max(max_dt, dt)
+                    else:
+                        retries += max(0, int(v) - 1)
+            elif line.startswith((b'- [warn, timestep,', b'- [error, timestep,')):
+                failures += 1
+    return {
+        'steps': steps,
+        'retries': retries,
+        'failures': failures,
+        'min_dt': min_dt,
+        'max_dt': max_dt,
+    }
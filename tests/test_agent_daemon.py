@@ -0,0 +1,200 @@
+import unittest
+import subprocess
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from gopest.bench import make_bench_case
+
+INIT_CASE = """
+from gopest.obs import generate_obses_and_ins
+from gopest.par import save_par_plan
+generate_obses_and_ins('g_real_model.dat', 'real_model_ns.json', 'pest_model.ins', '.pest_obs_data')
+save_par_plan('pest_model.tpl', 'goPESTpar.plan')
+"""
+
+class TestAgentDaemon(unittest.TestCase):
+    def setUp(self):
+        self.original_dir = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        make_bench_case(self.tmpdir, blocks=200, layers=4, sources=3, times=10,
+                        obs=40, params=20)
+        os.chdir(self.tmpdir)
+        shutil.copy('g_bench.dat', 'g_real_model.dat')
+        subprocess.run([sys.executable, '-c', INIT_CASE], check=True,
+                       capture_output=True)
+        self.daemon = None
+
+    def tearDown(self):
+        if self.daemon is not None and self.daemon.poll() is None:
+            self.daemon.kill()
+            self.daemon.wait()
+        os.chdir(self.original_dir)
+        shutil.rmtree(self.tmpdir)
+
+    def run_pest_model(self):
+        result = subprocess.run(['gopest', 'run-pest-model', '--local'],
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        with open('pest_model.obf', 'r') as f:
+            return f.read()
+
+    def test_daemon_run(self):
+        from gopest.agent_daemon import SOCKET_NAME
+        obf = self.run_pest_model()
+        os.remove('pest_model.obf')
+
+        self.daemon = subprocess.Popen(['gopest', 'agent-daemon', '--idle-timeout', '60'],
+                                       stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                       text=True)
+        for i in range(100):
+            if os.path.exists(SOCKET_NAME):
+                break
+            time.sleep(0.1)
+        self.assertTrue(os.path.exists(SOCKET_NAME))
+        # same results from the daemon, twice with cached model
+        self.assertEqual(self.run_pest_model(), obf)
+        self.assertEqual(self.run_pest_model(), obf)
+
+        subprocess.run(['gopest', 'agent-daemon', '--stop'], check=True,
+                       capture_output=True)
+        out, err = self.daemon.communicate(timeout=30)
+        self.assertEqual(self.daemon.returncode, 0, out)
+        self.assertIn('--- goPESTobs', out)
+        self.assertFalse(os.path.exists(SOCKET_NAME))
+
+    def test_runs_keep_resident_state(self):
+        """ two runs in one daemon process leave resident plan untouched """
+        script = """
+import pickle
+from gopest import agent_daemon
+from gopest.obs import load_obs_plan
+agent_daemon.preload()
+plan = load_obs_plan('goPESTobs.plan')
+before = pickle.dumps([ue.__dict__ for ue in plan])
+obfs = []
+for i in range(2):
+    assert agent_daemon.run_model(['run-pest-model', '--local'])['ok']
+    assert load_obs_plan('goPESTobs.plan') is plan
+    assert pickle.dumps([ue.__dict__ for ue in plan]) == before
+    obfs.append(open('pest_model.obf').read())
+assert obfs[0] == obfs[1]
+"""
+        result = subprocess.run([sys.executable, '-c', script],
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+
+class TestAgentDaemonTimeout(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fsock = os.path.join(self.tmpdir, 'agent.sock')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_hung_daemon(self):
+        """ a daemon that never replies is given up, the run is not done by
+        the client itself, the daemon may still pick it up later """
+        import socket
+        from gopest.agent_daemon import request
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.fsock)
+        server.listen(1)
+        try:
+            t0 = time.time()
+            self.assertRaisesRegex(Exception, 'not responding', request,
+                                   {'cmd': 'ping'}, self.fsock, timeout=0.5)
+            self.assertLess(time.time() - t0, 10.0)
+        finally:
+            server.close()
+
+    def test_client_gone(self):
+        """ a run request queued by a client that has given up is skipped """
+        import json
+        import socket
+        from gopest import agent_daemon
+        runs = []
+        run_model = agent_daemon.run_model
+        agent_daemon.run_model = lambda argv: runs.append(argv) or {'ok': True}
+        try:
+            for gone in [True, False]:
+                a, b = socket.socketpair()
+                b.sendall(json.dumps({'cmd': 'run', 'argv': ['x'], 'cwd': os.getcwd()}).encode())
+                b.shutdown(socket.SHUT_WR)
+                if gone:
+                    b.close()
+                agent_daemon.handle(a)
+                a.close()
+                if not gone:
+                    self.assertEqual(json.loads(b.recv(4096).decode()), {'ok': True})
+                    b.close()
+        finally:
+            agent_daemon.run_model = run_model
+        self.assertEqual(runs, [['x']])
+
+    def test_keepalive(self):
+        """ keep-alive spaces are sent during a long run, reply still parses """
+        import json
+        import socket
+        from gopest import agent_daemon
+        a, b = socket.socketpair()
+        run_model, keepalive = agent_daemon.run_model, agent_daemon.KEEPALIVE
+        agent_daemon.run_model = lambda argv: time.sleep(0.5) or {'ok': True}
+        agent_daemon.KEEPALIVE = 0.1
+        try:
+            reply = agent_daemon.run_with_keepalive(a, [])
+            a.sendall((json.dumps(reply) + '\n').encode())
+            a.close()
+            data = b''
+            while True:
+                chunk = b.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+        finally:
+            agent_daemon.run_model, agent_daemon.KEEPALIVE = run_model, keepalive
+            b.close()
+        self.assertTrue(data.startswith(b'  '))
+        self.assertEqual(json.loads(data.decode()), {'ok': True})
+
+class TestResidentLoad(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import gopest.common
+        gopest.common._resident = None
+        shutil.rmtree(self.tmpdir)
+
+    def test_reload_when_changed(self):
+        import gopest.common
+        from gopest.common import resident_load, enable_resident_cache
+        fname = os.path.join(self.tmpdir, 'a.txt')
+        loads = []
+        def loader(fn):
+            loads.append(fn)
+            if not os.path.exists(fn):
+                return None
+            with open(fn, 'r') as f:
+                return f.read()
+        self.assertEqual(resident_load(loader, fname), None)
+        self.assertEqual(resident_load(loader, fname), None)
+        self.assertEqual(len(loads), 2)
+        enable_resident_cache()
+        self.assertEqual(resident_load(loader, fname), None)
+        self.assertEqual(resident_load(loader, fname), None)
+        self.assertEqual(len(loads), 3)
+        with open(fname, 'w') as f:
+            f.write('one')
+        self.assertEqual(resident_load(loader, fname), 'one')
+        self.assertEqual(resident_load(loader, fname), 'one')
+        self.assertEqual(len(loads), 4)
+        with open(fname, 'w') as f:
+            f.write('two!')
+        self.assertEqual(resident_load(loader, fname), 'two!')
+        self.assertEqual(len(loads), 5)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,69 @@
+import unittest
+import subprocess
+import os
+import shutil
+import tempfile
+
+from gopest.archive import archive_iteration, list_iterations, restore_iteration
+from gopest.bench import BENCH_CONFIG
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self.original_dir = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+
+    def tearDown(self):
+        os.chdir(self.original_dir)
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, fname, data):
+        with open(fname, 'wb') as f:
+            f.write(data)
+
+    def read(self, fname):
+        with open(fname, 'rb') as f:
+            return f.read()
+
+    def test_dedup_restore(self):
+        big = os.urandom(3 * 1000)
+        self.write('real_model_ns.h5', big + b'iteration 1')
+        self.write('pest_model.dat', b'1.0\n')
+        store = 'store'
+        c1 = archive_iteration(1, {'real_model_ns.h5': 'real_model_ns.h5',
+                                   'pest_model.dat': 'pest_model.dat'}, store, 1000)
+        self.assertEqual(c1['files'], 2)
+        self.assertGreater(c1['stored'], 0)
+        # only the changed chunk is stored again
+        self.write('real_model_ns.h5', big + b'iteration 2')
+        c2 = archive_iteration(2, {'real_model_ns.h5': 'real_model_ns.h5'}, store, 1000)
+        self.assertEqual(c2['bytes'], 3011)
+        self.assertLess(c2['stored'], 100)
+        self.assertEqual(list_iterations(store), [1, 2])
+
+        restore_iteration(1, 'it1', store)
+        self.assertEqual(self.read(os.path.join('it1', 'real_model_ns.h5')), big + b'iteration 1')
+        self.assertEqual(self.read(os.path.join('it1', 'pest_model.dat')), b'1.0\n')
+        restore_iteration(2, 'it2', store)
+        self.assertEqual(os.listdir('it2'), ['real_model_ns.h5'])
+        self.assertEqual(self.read(os.path.join('it2', 'real_model_ns.h5')), big + b'iteration 2')
+        self.assertEqual(os.stat(os.path.join('it2', 'real_model_ns.h5')).st_mtime_ns,
+                         os.stat('real_model_ns.h5').st_mtime_ns)
+
+    def test_save_iter_files(self):
+        with open('goPESTconfig.toml', 'w') as f:
+            f.write((BENCH_CONFIG % 1).replace("case-name = 'bench'",
+                    "case-name = 'bench'\narchive_iterations = true"))
+        self.write('bench.jco.3', b'')
+        self.write('real_model_ns.h5.999', b'h5 output')
+        result = subprocess.run(['gopest', 'save-iter-model'], capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertFalse(os.path.exists('real_model_ns.h5.999'))
+        self.assertFalse(os.path.exists('real_model_ns.h5.3'))
+        result = subprocess.run(['gopest', 'save-iter-files', '--restore', '3'],
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertEqual(self.read(os.path.join('iteration_3', 'real_model_ns.h5')), b'h5 output')
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,40 @@
+import unittest
+import subprocess
+import os
+import json
+import shutil
+import tempfile
+
+STAGES = ['par-substitution', 'obs-plan', 'obs-extraction', 'obf-writing',
+          'read-from-model']
+
+class TestBench(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_bench_command(self):
+        fjson = os.path.join(self.tmpdir, 'bench.json')
+        fcase = os.path.join(self.tmpdir, 'case')
+        result = subprocess.run(['gopest', 'bench', '--blocks', '200',
+                                 '--layers', '4', '--sources', '3',
+                                 '--times', '10', '--obs', '40',
+                                 '--params', '20', '--repeat', '2',
+                                 '--dir', fcase, '--json', fjson],
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        for stage in STAGES:
+            self.assertIn(stage, result.stdout)
+        with open(fjson, 'r') as f:
+            bench = json.load(f)
+        self.assertEqual(list(bench['results'].keys()), STAGES)
+        for ts in bench['results'].values():
+            self.assertEqual(len(ts), 2)
+        # all observations are extracted from the synthetic case
+        with open(os.path.join(fcase, 'pest_model.obf'), 'r') as f:
+            self.assertEqual(len(f.readlines()), bench['case']['obs'])
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
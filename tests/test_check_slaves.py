@@ -0,0 +1,141 @@
+import unittest
+import subprocess
+import os
+import json
+import shutil
+import tempfile
+
+from gopest.bench import BENCH_CONFIG
+
+WAIWERA_LOG = """- [info, simulation, init, {}]
+- [info, timestep, end, {count: %i, tries: 1, size: %.6e, time: %.6e, status: continuing}]
+- [info, output, time_data, {count: %i}]
+- [info, simulation, destroy, {elapsed_seconds: %.3f}]
+"""
+
+PST = """pcf
+* observation groups
+ temp
+* observation data
+ tt_0001         1.0000000000000e+02  2.00000e-01 temp
+ tt_0002         1.5000000000000e+02  1.00000e-01 temp
+* model command line
+gopest run-pest-model
+"""
+
+class TestCheckSlaves(unittest.TestCase):
+    def setUp(self):
+        self.original_dir = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+        with open('goPESTconfig.toml', 'w') as f:
+            f.write(BENCH_CONFIG % 1)
+        for i in range(5):
+            s_dir = os.path.join('slaves', 'slave%i' % (i+1))
+            os.makedirs(s_dir)
+            if i == 0:
+                continue
+            with open(os.path.join(s_dir, 'real_model_ns.h5'), 'w') as f:
+                pass
+            with open(os.path.join(s_dir, 'real_model_ns.yaml'), 'w') as f:
+                f.write(WAIWERA_LOG % (i * 10, 1.e15, i * 1.e16, i * 10, i * 1.5))
+
+    def tearDown(self):
+        os.chdir(self.original_dir)
+        shutil.rmtree(self.tmpdir)
+
+    def test_status_end_time(self):
+        with open('goPESTslaves.json', 'w') as f:
+            json.dump({'slave1': {'note': 'kept'}}, f)
+        result = subprocess.run(['gopest', 'check-slaves', '--dir', 'slaves',
+                                 '--status', '--end-time', '--timesteps'],
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertEqual(os.getcwd(), self.tmpdir)
+        with open('goPESTslaves.json', 'r') as f:
+            data = json.load(f)
+        self.assertEqual(sorted(data.keys()), ['slave%i' % (i+1) for i in range(5)])
+        self.assertEqual(data['slave1'], {'note': 'kept', 'run': {'ns': {'exists': False}}})
+        for i in range(1, 5):
+            self.assertEqual(data['slave%i' % (i+1)]['run']['ns'], {
+                'exists': True,
+                'endtime': i * 1.e16,
+                'stepsize': 1.e15,
+                'elapsed': i * 1.5,
+                'timestep-steps': 1,
+                'timestep-retries': 0,
+                'timestep-failures': 0,
+                'timestep-min_dt': 1.e15,
+                'timestep-max_dt': 1.e15,
+                })
+
+    def test_obj_fn(self):
+        s_dir = os.path.join('slaves', 'slave2')
+        with open(os.path.join(s_dir, 'bench.pst'), 'w') as f:
+            f.write(PST)
+        with open(os.path.join(s_dir, 'pest_model.obf'), 'w') as f:
+            f.write('tt_0001 110.0\ntt_0002 140.0\n')
+        result = subprocess.run(['gopest', 'check-slaves', '--dir', 'slaves', '--obj-fn'],
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        with open('goPESTslaves.json', 'r') as f:
+            data = json.load(f)
+        self.assertEqual(data['slave2']['obj-fn'], {'temp': 5.0, 'phi': 5.0,
+                         'phi measured': 5.0, 'phi regularisation': 0.0})
+        self.assertNotIn('obj-fn', data['slave1'])
+        # case file untouched, PEST not run
+        with open(os.path.join(s_dir, 'bench.pst'), 'r') as f:
+            self.assertEqual(f.read(), PST)
+
+    def test_obj_fn_extracted(self):
+        # slave3 after init and a forward run, but without its .obf
+        s_dir = os.path.join('slaves', 'slave3')
+        result = subprocess.run(['gopest', 'bench', '--dir', s_dir, '--blocks', '40',
+                                 '--layers', '4', '--sources', '3', '--times', '5',
+                                 '--obs', '20', '--params', '10', '--repeat', '1'],
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        shutil.copy(os.path.join(s_dir, 'g_bench.dat'), os.path.join(s_dir, 'g_real_model.dat'))
+        with open(os.path.join(s_dir, '.pest_obs_data'), 'r') as f:
+            obs_data = f.read()
+        with open(os.path.join(s_dir, 'bench.pst'), 'w') as f:
+            f.write('pcf\n* observation groups\n temp\n enth\n* observation data\n')
+            f.write(obs_data)
+        os.rename(os.path.join(s_dir, 'pest_model.obf'), 'pest_model.obf')
+        from gopest.phi import read_pst, read_obf, calc_phi
+        names, values = read_obf('pest_model.obf')
+        expected = calc_phi(read_pst(os.path.join(s_dir, 'bench.pst')), names, values)
+        os.remove('pest_model.obf')
+        def listing():
+            return dict([(f, os.path.getmtime(os.path.join(s_dir, f)))
+                         for f in os.listdir(s_dir)])
+        before = listing()
+
+        result = subprocess.run(['gopest', 'check-slaves', '--dir', 'slaves', '--obj-fn'],
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        with open('goPESTslaves.json', 'r') as f:
+            data = json.load(f)
+        # .obf has fewer digits than the extracted values
+        for k,v in expected.items():
+            self.assertAlmostEqual(data['slave3']['obj-fn'][k], v, delta=1.e-9 * abs(v))
+        # nothing written in the slave or the working directory
+        self.assertEqual(listing(), before)
+        self.assertEqual(sorted(os.listdir('.')), ['goPESTconfig.toml',
+                         'goPESTslaves.json', 'slaves'])
+
+        # the observation plan is required to extract
+        os.remove(os.path.join(s_dir, 'goPESTobs.plan'))
+        os.remove('goPESTslaves.json')
+        before = listing()
+        result = subprocess.run(['gopest', 'check-slaves', '--dir', 'slaves', '--obj-fn'],
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertIn('No valid observation plan', result.stdout)
+        with open('goPESTslaves.json', 'r') as f:
+            data = json.load(f)
+        self.assertNotIn('obj-fn', data['slave3'])
+        self.assertEqual(listing(), before)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
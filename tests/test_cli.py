@@ -1,17 +1,23 @@
 import unittest
 import subprocess
 import os
+import sys
 
 TESTDIR_EMPTY = './tests/data/test_empty_dir'
 
+# CPU seconds for importing gopest.commands, PEST calls gopest once per model
+# run.  Far above the ~1 ms it takes, below importing numpy alone (~0.1 s).
+STARTUP_BUDGET = 0.05
+# not to be imported by gopest.commands
+HEAVY_MODULES = ['numpy', 'h5py', 'mulgrids', 't2data', 't2listing', 'yaml',
+                 'xlwt', 'tomlkit', 'setuptools_scm', 'gopest.par', 'gopest.obs']
+
 class TestCLI_NoConfig(unittest.TestCase):
     def setUp(self):
         self.original_dir = os.getcwd()
+        self.addCleanup(os.chdir, self.original_dir)
         os.chdir(TESTDIR_EMPTY)
 
-    def tearDown(self):
-        os.chdir(self.original_dir)
-
     def test_help_command(self):
         expected_output_components = [
             'Version: (',
@@ -20,12 +26,15 @@ class TestCLI_NoConfig(unittest.TestCase):
             'init [--no-copy][--no-par][--no-obs]',
             'submit',
             'run',
+            'run-batch',
             'par',
             'obs',
             'run-pest-model',
+            'agent-daemon',
             'run-forward',
             'save-iter-files',
             'check-slaves',
+            'bench',
             'Important files for goPEST to work:',
             'goPESTconfig.toml',
             'goPESTpar.list',
@@ -39,5 +48,38 @@ class TestCLI_NoConfig(unittest.TestCase):
         for exp in expected_output_components:
             self.assertIn(exp, result.stdout)
 
+class TestCLI_Startup(unittest.TestCase):
+    def setUp(self):
+        self.original_dir = os.getcwd()
+        self.addCleanup(os.chdir, self.original_dir)
+        os.chdir(TESTDIR_EMPTY)
+
+    def run_python(self, code):
+        result = subprocess.run([sys.executable, '-c', code], capture_output=True,
+                                text=True, stdin=subprocess.DEVNULL)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return result.stdout
+
+    def test_lazy_imports(self):
+        files = sorted(os.listdir('.'))
+        out = self.run_python('import sys, gopest.commands, gopest.common; '
+                              'print(" ".join(sys.modules))')
+        modules = out.split()
+        for m in HEAVY_MODULES:
+            self.assertNotIn(m, modules)
+        # no config prompt or file written by importing
+        self.assertEqual(sorted(os.listdir('.')), files)
+
+    def test_startup_budget(self):
+        """ CPU time (less affected by machine load than wall-clock), best of
+        a few runs """
+        times = []
+        for i in range(3):
+            out = self.run_python('import time; t0 = time.process_time(); '
+                                  'import gopest.commands; '
+                                  'print(time.process_time() - t0)')
+            times.append(float(out))
+        self.assertLess(min(times), STARTUP_BUDGET)
+
 if __name__ == '__main__':
     unittest.main()
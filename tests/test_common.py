@@ -0,0 +1,53 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+TESTDIR = './tests/data'
+
+class TestJsonFormat(unittest.TestCase):
+    def setUp(self):
+        self.original_dir = os.getcwd()
+        self.addCleanup(os.chdir, self.original_dir)
+        os.chdir(TESTDIR)
+        self.tmpdir = tempfile.mkdtemp()
+        from gopest.common import config
+        self.json_format = config['simulator']['json-format']
+
+    def tearDown(self):
+        from gopest.common import config
+        config['simulator']['json-format'] = self.json_format
+        shutil.rmtree(self.tmpdir)
+
+    def test_dump_load(self):
+        from gopest.common import config, load_json, dump_json
+        data = {'source': [{'name': 'src1', 'rate': -1.5e-3}], 'mesh': {'filename': 'g.msh'},
+                'rock': {'types': [{'name': 'r1', 'permeability': [1.e-15, 1.e-15, 1.e-16]}]}}
+        fjson = os.path.join(self.tmpdir, 'model.json')
+        sizes = {}
+        for fmt in ['pretty', 'compact']:
+            config['simulator']['json-format'] = fmt
+            dump_json(data, fjson)
+            self.assertEqual(load_json(fjson), data)
+            sizes[fmt] = os.path.getsize(fjson)
+        self.assertLess(sizes['compact'], sizes['pretty'])
+
+    def test_compact_non_finite(self):
+        """ NaN raises with or without orjson, None is still written as null """
+        from gopest import common
+        common.config['simulator']['json-format'] = 'compact'
+        fjson = os.path.join(self.tmpdir, 'model.json')
+        orjson = common.orjson
+        try:
+            for lib in set([orjson, None]):
+                common.orjson = lib
+                self.assertRaises(ValueError, common.dump_json,
+                                  {'rock': {'porosity': float('nan')}}, fjson)
+                self.assertRaises(ValueError, common.dump_json, [float('inf')], fjson)
+                common.dump_json({'incon': None, 'rate': 1.0}, fjson)
+                self.assertEqual(common.load_json(fjson), {'incon': None, 'rate': 1.0})
+        finally:
+            common.orjson = orjson
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
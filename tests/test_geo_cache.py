@@ -0,0 +1,58 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from mulgrids import *
+
+TESTDIR = './tests/data'
+
+class TestGeoCache(unittest.TestCase):
+    def setUp(self):
+        self.original_dir = os.getcwd()
+        self.addCleanup(os.chdir, self.original_dir)
+        os.chdir(TESTDIR)
+        self.tmpdir = tempfile.mkdtemp()
+        self.fgeo = os.path.join(self.tmpdir, 'g.dat')
+        shutil.copy('gwai6307_06.dat', self.fgeo)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_save_load(self):
+        from gopest.geo_cache import save_geometry_cache, load_geometry_cache
+        from gopest.geo_cache import load_geometry, geo_cache_filename
+        geo = mulgrid(self.fgeo)
+        geo.wellblocks = {'TM  1': (['AP530'], [0.0])}
+        self.assertIsNone(load_geometry_cache(self.fgeo))
+        save_geometry_cache(geo, self.fgeo)
+
+        geo2 = load_geometry_cache(self.fgeo)
+        self.assertEqual(geo2.block_name_list, geo.block_name_list)
+        self.assertEqual(geo2.wellblocks, geo.wellblocks)
+        pos = [2776000., 6287000., 300.]
+        self.assertEqual(geo2.block_name_containing_point(pos, geo2.qtree),
+                         geo.block_name_containing_point(pos))
+        self.assertEqual(geo2.node_nearest_to(pos[:2], kdtree=geo2.kdtree).name,
+                         geo.node_nearest_to(pos[:2]).name)
+
+        # a cache shared (hardlinked) by a slave dir is replaced, not modified
+        fshared = os.path.join(self.tmpdir, 'shared.pkl')
+        os.link(geo_cache_filename(self.fgeo), fshared)
+        with open(fshared, 'rb') as f:
+            shared = f.read()
+        geo.wellblocks = {}
+        save_geometry_cache(geo, self.fgeo)
+        with open(fshared, 'rb') as f:
+            self.assertEqual(f.read(), shared)
+        self.assertEqual(load_geometry_cache(self.fgeo).wellblocks, {})
+        self.assertEqual([f for f in os.listdir(self.tmpdir) if f.endswith('.tmp')], [])
+
+        # cache ignored once geometry file changed
+        with open(self.fgeo, 'a') as f:
+            f.write('\n')
+        self.assertIsNone(load_geometry_cache(self.fgeo))
+        self.assertNotIn('qtree', load_geometry(self.fgeo).__dict__)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,6 +12,7 @@ class TestObsDefs(unittest.TestCase):
     """ Test goPESTobs type by type, from users perspective. """
     def setUp(self):
         self.original_dir = os.getcwd()
+        self.addCleanup(os.chdir, self.original_dir)
         os.chdir(TESTDIR)
 
         self.geo = mulgrid("./gwai6307_06.dat")
@@ -23,7 +24,6 @@ class TestObsDefs(unittest.TestCase):
         del self.dat
         self.lst.close()
         del self.lst
-        os.chdir(self.original_dir)
 
     def test_totalheat_modelresult(self):
         """ totalheat should handle fixed/unfixed name even with regular expression """
@@ -54,6 +54,143 @@ class TestObsDefs(unittest.TestCase):
         self.assertEqual("En_EE_45_0002", unique_obs_name("enthalpy", "EE 45"))
         self.assertEqual("my_EE456_0001", unique_obs_name("myenthalpy", "EE[456]00"))
 
+    def test_new_obs(self):
+        """ observations are slotted records, without the default's extra settings """
+        import pickle
+        from gopest.obs import PestObservData
+        obsDefault = PestObservData('Pr', 0.0, 2.0, 'press')
+        obsDefault._DESIRED_DATA_TIMES = [1990.0, 2000.0]
+        obs = obsDefault.new()
+        obs.OBSNME, obs.OBSVAL, obs._block_ = 'Pr_0001', 5.e6, 'AB 12'
+        self.assertEqual(str(obs), 'Pr_0001 5000000.0 2.0 press')
+        self.assertEqual(obsDefault.OBSNME, 'Pr')
+        self.assertFalse(hasattr(obs, '_DESIRED_DATA_TIMES'))
+        self.assertFalse(hasattr(obs, '__dict__'))
+        obs2 = pickle.loads(pickle.dumps(obs))
+        self.assertEqual((obs2.OBSNME, obs2._block_), ('Pr_0001', 'AB 12'))
+
+    def test_format_lines(self):
+        """ whole file formatted at once, same as formatting each line """
+        import numpy as np
+        from gopest.obs import format_lines, OBF_LINE, PST_LINE
+        names = ['Pr_%04i' % i for i in range(1000)]
+        values = np.linspace(-1.e6, 2.e7, 1000)
+        expected = ''.join(['%-20s %20.13e\n' % (n,v) for n,v in zip(names, values)])
+        self.assertEqual(format_lines(OBF_LINE, [names, values]), expected)
+        self.assertEqual(format_lines(OBF_LINE, [[], []]), '')
+        self.assertEqual(format_lines(PST_LINE, [['T_1'], [150.0], [0.5], ['temp']]),
+                         ' %-20s %20.13e %12.5e %s\n' % ('T_1', 150.0, 0.5, 'temp'))
+
+    def test_data_filter(self):
+        """ [DataFilter] on whole arrays gives the same rows as eval() of each row """
+        from gopest.obs_def import filter_rows, _read_filtered
+        times = [1970.0, 1975, 1985.5, 2018.0, 2020.0]
+        vals = [100.0, 200.0, -1.0, 300.0, 250]
+        for customFilter in ['True', 'time <= 2018.0', '(time > 1971) & (val > 0)',
+                             'time > 1971 and val > 0', '1971 < time <= 2018',
+                             'abs(val - 200) < 60', "wname == 'WK 1'",
+                             'round(time) % 5 == 0', "wname[:2] == 'WK'",
+                             'len(wname) == 4',
+                             "userEntry['skip'] or val > 0"]:
+            expected = [[], []]
+            wname, userEntry = 'WK 1', {'skip': False}
+            for time,val in zip(times, vals):
+                if eval(customFilter):
+                    expected[0].append(time), expected[1].append(val)
+            self.assertEqual(filter_rows(customFilter, {'time': times, 'val': vals},
+                                         {'wname': wname, 'userEntry': userEntry}),
+                             expected, customFilter)
+        # single value from a column is not applied to all rows, each row's
+        # value cannot be indexed, as with eval() of each row
+        self.assertRaises(TypeError, filter_rows, 'time[0] > 1971',
+                          {'time': times, 'val': vals})
+        # string columns, eg. block names
+        blocks = ['AB 10', 'AB 11', 'XY 20', 'A  21', 'ab 12']
+        temps = [100.0, 150.0, 200.0, 250.0, 300.0]
+        for customFilter in ["block[0] == 'A'", "block[:2] == 'AB' and temp > 120",
+                             'len(block.split()) == 2', "block.startswith('AB')",
+                             'len(block) == 5', "block in ['XY 20', 'ab 12']"]:
+            expected = [[], []]
+            for block,temp in zip(blocks, temps):
+                if eval(customFilter):
+                    expected[0].append(block), expected[1].append(temp)
+            self.assertEqual(filter_rows(customFilter, {'block': blocks, 'temp': temps}),
+                             expected, customFilter)
+        self.assertEqual(_read_filtered('ex_obs_temp.dat', 'elev > 200.0', ['elev', 'temp']),
+                         [[410.0, 390.0, 300.0], [100.0, 100.0, 200.0]])
+        # text of each line, and caller's names
+        self.assertEqual(_read_filtered('ex_obs_temp.dat', "line.startswith('30') or elev < lim",
+                                        ['elev', 'temp'], {'lim': 200.0}),
+                         [[300.0, 100.0], [200.0, 200.0]])
+        os.remove('ex_obs_temp.dat.cache')
+
+    def test_field_data_cache(self):
+        """ field data parsed once, served from memory or cache file until modified """
+        import json
+        import shutil
+        import tempfile
+        from gopest import obs_def
+        parsed = []
+        def parser(fname):
+            parsed.append(fname)
+            return obs_def._parse_json(fname)
+        tmpdir = tempfile.mkdtemp()
+        try:
+            fjson = os.path.join(tmpdir, 'enth.json')
+            with open(fjson, 'w') as f:
+                json.dump({'WK 1': {'times': [1990.0], 'enthalpy': [1.e6]}}, f)
+            data = obs_def.load_field_data(fjson, 'json', parser)
+            self.assertIs(obs_def.load_field_data(fjson, 'json', parser), data)
+            self.assertEqual(len(parsed), 1)
+            self.assertTrue(os.path.isfile(obs_def.field_cache_filename(fjson)))
+            # another process, loaded from cache file
+            obs_def._field_data.clear()
+            self.assertEqual(obs_def.load_field_data(fjson, 'json', parser), data)
+            self.assertEqual(len(parsed), 1)
+            # modified, same size but newer, caught by the content hash
+            st = os.stat(fjson)
+            with open(fjson, 'w') as f:
+                json.dump({'WK 2': {'times': [1990.0], 'enthalpy': [2.e6]}}, f)
+            os.utime(fjson, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+            obs_def._field_data.clear()
+            self.assertEqual(list(obs_def.load_field_json(fjson).keys()), ['WK 2'])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_obs_plan_sources(self):
+        """ plan is outdated once any of its source files is modified """
+        import shutil
+        import tempfile
+        from gopest.obs import save_obs_plan, load_obs_plan
+        tmpdir = tempfile.mkdtemp()
+        try:
+            flist = os.path.join(tmpdir, 'goPESTobs.list')
+            fplan = os.path.join(tmpdir, 'goPESTobs.plan')
+            fsrc = os.path.join(tmpdir, 'field.json')
+            for fn in [flist, fsrc]:
+                with open(fn, 'w') as f:
+                    f.write('[1.0]')
+            save_obs_plan([], fplan, flist, sources=[fsrc, 'missing.dat'])
+            self.assertEqual(load_obs_plan(fplan, flist), [])
+            # touched, same content
+            st = os.stat(fsrc)
+            os.utime(fsrc, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+            self.assertEqual(load_obs_plan(fplan, flist), [])
+            with open(fsrc, 'w') as f:
+                f.write('[2.0]')
+            os.utime(fsrc, ns=(st.st_atime_ns, st.st_mtime_ns + 2000))
+            self.assertIsNone(load_obs_plan(fplan, flist))
+            # re-made, then a missing source appears
+            save_obs_plan([], fplan, flist, sources=[fsrc, 'missing.dat'])
+            self.assertEqual(load_obs_plan(fplan, flist), [])
+            with open('missing.dat', 'w') as f:
+                f.write('x')
+            self.assertIsNone(load_obs_plan(fplan, flist))
+        finally:
+            if os.path.exists('missing.dat'):
+                os.remove('missing.dat')
+            shutil.rmtree(tmpdir)
+
     def test_totalheat_raise_exp(self):
         """ totalheat should raise exception when creating obs, if specified geners does not match anything. """
         from gopest.obs import UserEntryObserv, OBS_USER_FUNC
@@ -81,11 +218,9 @@ class FullTest_goPESTobs(unittest.TestCase):
     """ Test running goPESTobs.py as an app, and check basic function """
     def setUp(self):
         self.original_dir = os.getcwd()
+        self.addCleanup(os.chdir, self.original_dir)
         os.chdir(TESTDIR)
 
-    def tearDown(self):
-        os.chdir(self.original_dir)
-
     def generateInput(self, fname, lines):
         f = open(fname, 'w')
         f.write('\n'.join(lines))
@@ -118,7 +253,8 @@ class FullTest_goPESTobs(unittest.TestCase):
         #      goPESTobs.py geo dat newPESTins
         # API:
         #      generate_obses_and_ins(fgeo, fdat, insToWrite,
-        #                             fobses, fplts='goPESTobs.json', fcovs='goPESTobs.coverage')
+        #                             fobses, fplts='goPESTobs.json', fcovs='goPESTobs.coverage',
+        #                             fplan='goPESTobs.plan')
         from gopest.obs import generate_obses_and_ins
         generate_obses_and_ins(
             "gwai6307_06.dat",
@@ -131,11 +267,14 @@ class FullTest_goPESTobs(unittest.TestCase):
         obs = self.linesFromOutput("pest_obs", cleanup=True)
         self.assertEqual(obs, obs_lines)
         self.cleanFiles(["pest_obs_ins", "pest_obs"])
+        # field data written for plotting at init only, not by forward runs
+        self.cleanFiles(["*.obs"])
 
         # to read Tough2 results and write result file for PEST to read:
         #      goPESTobs.py geo dat lst newPESTobf
         # API:
-        #      read_from_real_model(fgeo, fdat, flst, fobf, waiwera=False)
+        #      read_from_real_model(fgeo, fdat, flst, fobf, waiwera=False, fplan='goPESTobs.plan',
+        #                           workers=1)
         from gopest.obs import read_from_real_model
         read_from_real_model(
             "gwai6307_06.dat",
@@ -145,7 +284,60 @@ class FullTest_goPESTobs(unittest.TestCase):
 
         obf = self.linesFromOutput("pest_obs_obf", cleanup=True)
         self.assertEqual(obf, obf_lines)
-        self.cleanFiles(["goPESTobs.list", "pest_obs_obf"])
+        self.cleanFiles(["pest_obs_obf"])
+        import glob
+        self.assertEqual(glob.glob("*.obs"), [])
+
+        # extracted by a pool of workers, obf should be in the same order
+        read_from_real_model(
+            "gwai6307_06.dat",
+            "wai6307ns_021.dat",
+            "wai6307ns_021.listing",
+            "pest_obs_obf",
+            workers=2)
+        obf = self.linesFromOutput("pest_obs_obf", cleanup=True)
+        self.assertEqual(obf, obf_lines)
+        self.cleanFiles(["pest_obs_obf"])
+
+        # without the observation plan saved by generate_obses_and_ins()
+        from gopest.obs import load_obs_plan
+        self.assertIsNotNone(load_obs_plan("goPESTobs.plan"))
+        read_from_real_model(
+            "gwai6307_06.dat",
+            "wai6307ns_021.dat",
+            "wai6307ns_021.listing",
+            "pest_obs_obf",
+            fplan=None)
+        obf = self.linesFromOutput("pest_obs_obf", cleanup=True)
+        self.assertEqual(obf, obf_lines)
+        self.cleanFiles(["pest_obs_obf"])
+
+        # plan is ignored once goPESTobs.list is modified
+        self.generateInput('goPESTobs.list', list_lines + ['# modified'])
+        self.assertIsNone(load_obs_plan("goPESTobs.plan"))
+
+        # forward runs process field data without it, but do not save it
+        read_from_real_model(
+            "gwai6307_06.dat",
+            "wai6307ns_021.dat",
+            "wai6307ns_021.listing",
+            "pest_obs_obf")
+        obf = self.linesFromOutput("pest_obs_obf", cleanup=True)
+        self.assertEqual(obf, obf_lines)
+        self.assertIsNone(load_obs_plan("goPESTobs.plan"))
+        self.cleanFiles(["pest_obs_obf"])
+
+        # ... until remade by generate_obses_and_ins()
+        generate_obses_and_ins(
+            "gwai6307_06.dat",
+            "wai6307ns_021.dat",
+            "pest_obs_ins",
+            "pest_obs")
+        self.assertIsNotNone(load_obs_plan("goPESTobs.plan"))
+        self.cleanFiles(["pest_obs_ins", "pest_obs"])
+        self.cleanFiles(["goPESTobs.list", "goPESTobs.plan"])
+        self.cleanFiles(["gwai6307_06.dat.cache"])
+        self.cleanFiles(["ex_obs_*.dat.cache", "*.json.cache"])
 
         # TODO: review these additional, possibly some junk
         self.cleanFiles(["goPESTobs.coverage", "goPESTobs.json"])
@@ -0,0 +1,134 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+TESTDIR = './tests/data'
+
+TPL_LINES = [
+    'ptf $',
+    '$R1AAA01$, "permeability_1_byrock", "[\'AAA01\']"',
+    '$PObc 11$, "porosity_byrock"      , "[\'bc 11\']"',
+    '$CJabc  $, "json_values"          , "[([\'a\', 1], \'b, c\')]"',
+]
+
+DAT_LINES = [
+    '  1.000E-14, "permeability_1_byrock", "[\'AAA01\']"',
+    ' 0.1000000, "porosity_byrock"      , "[\'bc 11\']"',
+    '        2.5, "json_values"          , "[([\'a\', 1], \'b, c\')]"',
+]
+
+class TestPestModelFile(unittest.TestCase):
+    def setUp(self):
+        self.original_dir = os.getcwd()
+        self.addCleanup(os.chdir, self.original_dir)
+        os.chdir(TESTDIR)
+        self.tmpdir = tempfile.mkdtemp()
+        self.ftpl = os.path.join(self.tmpdir, 'pest_model.tpl')
+        self.fdat = os.path.join(self.tmpdir, 'pest_model.dat')
+        self.fplan = os.path.join(self.tmpdir, 'goPESTpar.plan')
+        with open(self.ftpl, 'w') as f:
+            f.write('\n'.join(TPL_LINES) + '\n')
+        with open(self.fdat, 'w') as f:
+            f.write('\n'.join(DAT_LINES) + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_read_pest_model(self):
+        from gopest.par import read_pest_model, read_pest_model_values
+        pars = list(read_pest_model(self.fdat))
+        self.assertEqual(pars, [
+            (1.0e-14, 'permeability_1_byrock', ['AAA01']),
+            (0.1, 'porosity_byrock', ['bc 11']),
+            (2.5, 'json_values', [(['a', 1], 'b, c')]),
+        ])
+        self.assertEqual(list(read_pest_model_values(self.fdat)), [1.0e-14, 0.1, 2.5])
+
+    def test_par_plan(self):
+        from gopest.par import save_par_plan, load_par_plan
+        save_par_plan(self.ftpl, self.fplan)
+        self.assertEqual(load_par_plan(self.fplan, self.ftpl), [
+            ('permeability_1_byrock', ['AAA01']),
+            ('porosity_byrock', ['bc 11']),
+            ('json_values', [(['a', 1], 'b, c')]),
+        ])
+        # plan is ignored once template is modified
+        with open(self.ftpl, 'a') as f:
+            f.write('$R1AAA02$, "permeability_1_byrock", "[\'AAA02\']"\n')
+        self.assertIsNone(load_par_plan(self.fplan, self.ftpl))
+        self.assertIsNone(load_par_plan(None, self.ftpl))
+        # a plan shared (hardlinked) by a slave dir is replaced, not modified
+        fshared = os.path.join(self.tmpdir, 'shared.plan')
+        os.link(self.fplan, fshared)
+        with open(fshared, 'rb') as f:
+            shared = f.read()
+        save_par_plan(self.ftpl, self.fplan)
+        self.assertEqual(len(load_par_plan(self.fplan, self.ftpl)), 4)
+        with open(fshared, 'rb') as f:
+            self.assertEqual(f.read(), shared)
+
+class TestGenerateRealModel(unittest.TestCase):
+    def setUp(self):
+        self.original_dir = os.getcwd()
+        self.addCleanup(os.chdir, self.original_dir)
+        os.chdir(TESTDIR)
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_in_memory(self):
+        from t2data import t2data
+        from gopest.par import generate_real_model
+        rocks = [r.name for r in t2data('wai6307ns_021.dat').grid.rocktypelist[:2]]
+        fpm = os.path.join(self.tmpdir, 'pest_model.dat')
+        freal = os.path.join(self.tmpdir, 'real_model.dat')
+        with open(fpm, 'w') as f:
+            for r,v in zip(rocks, [0.25, 0.35]):
+                f.write('%9.3e, %-20s, "%s"\n' % (v, '"porosity_byrock"', str([r])))
+        dat = generate_real_model('wai6307ns_021.dat', fpm, freal, fplan=None,
+                                  write=False)
+        self.assertFalse(os.path.exists(freal))
+        self.assertEqual([dat.grid.rocktype[r].porosity for r in rocks], [0.25, 0.35])
+
+def waiwera_input():
+    return {
+        'rock': {'types': [
+            {'name': 'rock1', 'permeability': [1.e-15, 1.e-15, 1.e-16], 'porosity': 0.1},
+            {'name': 'rock2', 'permeability': [2.e-15, 2.e-15, 2.e-16], 'porosity': 0.2},
+            {'name': 'rock1', 'permeability': [3.e-15, 3.e-15, 3.e-16], 'porosity': 0.3},
+        ]},
+        'source': [
+            {'name': 'src1', 'rate': 1.0, 'deliverability': {'productivity': 1.e-12}},
+            {'name': 'src2', 'rate': 2.0, 'deliverability': {'productivity': 2.e-12}},
+        ],
+    }
+
+class TestParDefSetMany(unittest.TestCase):
+    def setUp(self):
+        self.original_dir = os.getcwd()
+        self.addCleanup(os.chdir, self.original_dir)
+        os.chdir(TESTDIR)
+
+    def test_set_many_waiwera(self):
+        """ .set_many() should give the same results as .set() one by one """
+        from gopest.par_def import permeability_1_byrock, permeability_3_byrock
+        from gopest.par_def import porosity_byrock, massgener_rate
+        from gopest.par_def import delivgener_productivity
+        for cls, names in [(permeability_1_byrock, ['rock2', 'rock1', 'rockX']),
+                           (permeability_3_byrock, ['rock1', 'rock1']),
+                           (porosity_byrock, ['rock1', 'rock2']),
+                           (massgener_rate, ['src2', 'src1']),
+                           (delivgener_productivity, ['src1', 'srcX'])]:
+            values = [float(i) + 9.0 for i in range(len(names))]
+            pd = cls('waiwera')
+            dat1, dat2 = waiwera_input(), waiwera_input()
+            for n,v in zip(names, values):
+                pd.set(dat1, n, v)
+            pd.set_many(dat2, names, values)
+            self.assertEqual(dat1, dat2, cls.__name__)
+            self.assertNotEqual(dat2, waiwera_input(), cls.__name__)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,86 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from gopest.phi import read_pst, read_obf, read_model_pars, calc_phi, dir_phi
+
+PST = """pcf
+* control data
+restart  estimation
+2 4 2 2 3
+* parameter data
+k1 log factor 1e-14 1e-17 1e-12 k1 1.0 0.0 1
+por none relative 0.1 0.01 0.5 por 1.0 0.0 1
+* observation groups
+ temp
+ enth
+ regul_k
+* observation data
+ tt_0001         1.0000000000000e+02  2.00000e-01 temp
+ tt_0002         1.5000000000000e+02  1.00000e-01 TEMP
+ ee_0001         1.0000000000000e+03  1.00000e-02 enth
+ ee_0002         1.2000000000000e+03  0.00000e+00 enth
+* model command line
+gopest run-pest-model
+* model input/output
+pest_model.tpl pest_model.dat
+pest_model.ins  pest_model.obf
+* prior information
+pi_k1 1.0 * log(k1) = -14.0 2.0 regul_k
+pi_kp 1.0 * log(k1) - 10.0 *
+ & por = -15.0 1.0 regul_k
+"""
+
+TPL = """ptf $
+$k1                  $
+$por                 $
+"""
+
+class TestPhi(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for f,txt in [('case.pst', PST), ('pest_model.tpl', TPL),
+                      ('pest_model.dat', '%-22.15e\n%-22.15e\n' % (1.e-13, 0.2)),
+                      ('pest_model.obf', '\n'.join([
+                          'ee_0002 2.0e3', 'EE_0001 1.1e3',
+                          'tt_0001 110.0', 'tt_0002 140.0']))]:
+            with open(os.path.join(self.tmpdir, f), 'w') as fout:
+                fout.write(txt)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_read(self):
+        pst = read_pst(os.path.join(self.tmpdir, 'case.pst'))
+        self.assertEqual(list(pst['obsnme']), ['tt_0001', 'tt_0002', 'ee_0001', 'ee_0002'])
+        self.assertEqual(list(pst['group']), [0, 0, 1, 1])
+        self.assertEqual(pst['groups'], ['temp', 'enth', 'regul_k'])
+        self.assertEqual(pst['prior'], [
+            ('pi_k1', [(1.0, 'k1', True)], -14.0, 2.0, 'regul_k'),
+            ('pi_kp', [(1.0, 'k1', True), (-10.0, 'por', False)], -15.0, 1.0, 'regul_k'),
+            ])
+        pars = read_model_pars(os.path.join(self.tmpdir, 'pest_model.tpl'),
+                               os.path.join(self.tmpdir, 'pest_model.dat'))
+        self.assertEqual(pars, {'k1': 1.e-13, 'por': 0.2})
+
+    def test_phi(self):
+        phis = dir_phi(self.tmpdir, 'case.pst')
+        self.assertAlmostEqual(phis['temp'], 4.0 + 1.0)
+        self.assertAlmostEqual(phis['enth'], 1.0)
+        self.assertAlmostEqual(phis['regul_k'], 4.0 + 0.0)
+        self.assertAlmostEqual(phis['phi measured'], 6.0)
+        self.assertAlmostEqual(phis['phi regularisation'], 4.0)
+        self.assertAlmostEqual(phis['phi'], 10.0)
+        # nothing modified or written
+        self.assertEqual(sorted(os.listdir(self.tmpdir)), ['case.pst',
+                         'pest_model.dat', 'pest_model.obf', 'pest_model.tpl'])
+
+    def test_missing_obs(self):
+        pst = read_pst(os.path.join(self.tmpdir, 'case.pst'))
+        names, values = read_obf(os.path.join(self.tmpdir, 'pest_model.obf'))
+        with self.assertRaises(Exception):
+            calc_phi(pst, names[:3], values[:3], {'k1': 1.e-13, 'por': 0.2})
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,66 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from gopest.provision import provision_dir
+
+class TestProvisionDir(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.master = os.path.join(self.tmpdir, 'master')
+        self.slave = os.path.join(self.tmpdir, 'slave1')
+        os.makedirs(os.path.join(self.master, 'slave1'))
+        for f,txt in [('big.h5', 'incon' * 100), ('g_real_model.dat', 'geo'),
+                      ('pest_model.tpl', 'ptf $\n'), ('real_model_ns.json', '{}')]:
+            self.write(os.path.join(self.master, f), txt)
+        self.readonly = set(['big.h5', 'g_real_model.dat'])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, fname, txt):
+        with open(fname, 'w') as f:
+            f.write(txt)
+
+    def read(self, fname):
+        with open(fname, 'r') as f:
+            return f.read()
+
+    def test_link_and_sync(self):
+        counts = provision_dir(self.slave, self.master, self.readonly)
+        self.assertEqual(counts['linked'], 2)
+        self.assertEqual(counts['copied'] + counts['reflinked'], 2)
+        self.assertEqual(sorted(os.listdir(self.slave)), ['big.h5', 'g_real_model.dat',
+                         'pest_model.tpl', 'real_model_ns.json'])
+        for f in self.readonly:
+            self.assertTrue(os.path.samefile(os.path.join(self.master, f),
+                                             os.path.join(self.slave, f)))
+        fjson = os.path.join(self.slave, 'real_model_ns.json')
+        self.assertFalse(os.path.samefile(os.path.join(self.master, 'real_model_ns.json'), fjson))
+
+        # nothing to do second time, slave's own output files are kept
+        self.write(os.path.join(self.slave, 'real_model_ns.h5'), 'output')
+        counts = provision_dir(self.slave, self.master, self.readonly)
+        self.assertEqual(counts['unchanged'], 4)
+        self.assertTrue(os.path.isfile(os.path.join(self.slave, 'real_model_ns.h5')))
+
+        # slave modified file with same size and mtime, only caught by verify
+        st = os.stat(fjson)
+        self.write(fjson, '[]')
+        os.utime(fjson, ns=(st.st_atime_ns, st.st_mtime_ns))
+        counts = provision_dir(self.slave, self.master, self.readonly)
+        self.assertEqual(self.read(fjson), '[]')
+        counts = provision_dir(self.slave, self.master, self.readonly, verify=True)
+        self.assertEqual(self.read(fjson), '{}')
+        self.assertEqual(counts['unchanged'], 3)
+
+        # no longer read-only, the slave gets its own copy, master untouched
+        provision_dir(self.slave, self.master, set(['g_real_model.dat']))
+        fh5 = os.path.join(self.slave, 'big.h5')
+        self.assertFalse(os.path.samefile(os.path.join(self.master, 'big.h5'), fh5))
+        self.write(fh5, 'modified')
+        self.assertEqual(self.read(os.path.join(self.master, 'big.h5')), 'incon' * 100)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
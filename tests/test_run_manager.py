@@ -0,0 +1,182 @@
+import unittest
+import subprocess
+import os
+import json
+import shutil
+import sys
+import tempfile
+
+from gopest.bench import make_bench_case, BENCH_CONFIG
+
+INIT_CASE = """
+from gopest.obs import generate_obses_and_ins
+from gopest.par import save_par_plan
+generate_obses_and_ins('g_real_model.dat', 'real_model_ns.json', 'pest_model.ins', '.pest_obs_data')
+save_par_plan('pest_model.tpl', 'goPESTpar.plan')
+"""
+
+# stands in for Waiwera: output is the bench case's, with all source enthalpies
+# scaled by the rate of the first source, which is a parameter (massgener_rate)
+FAKE_SIMULATOR = """#!%s
+import json, shutil, sys
+import h5py
+with open(sys.argv[1]) as f:
+    wjson = json.load(f)
+fout = wjson['output']['filename']
+shutil.copy('bench_output.h5', fout)
+with h5py.File(fout, 'a') as h5:
+    h5['source_fields']['source_enthalpy'][...] *= abs(wjson['source'][0]['rate'])
+"""
+
+# stands in for Parallel PEST: runs set0.par, set1.par and set2.par on the
+# slaves of the run management file, through the slaves' signal files
+FAKE_PEST = """
+import os, shutil, time
+from gopest.run_manager import read_par_file, write_pest_model
+with open('bench.rmf', 'r') as f:
+    lines = f.read().splitlines()
+nslave = int(lines[1].split()[0])
+s_dirs = [line.split()[1] for line in lines[2:2+nslave]]
+def wait_for(fn):
+    while not os.path.isfile(fn):
+        time.sleep(0.05)
+    os.remove(fn)
+for s_dir in s_dirs:
+    wait_for(os.path.join(s_dir, 'pslave.rdy'))
+for i in range(3):
+    s_dir = s_dirs[i % nslave]
+    write_pest_model('pest_model.tpl', read_par_file('set%i.par' % i),
+                     os.path.join(s_dir, 'pest_model.dat'))
+    open(os.path.join(s_dir, 'pest.rdy'), 'w').close()
+    wait_for(os.path.join(s_dir, 'pslave.fin'))
+    shutil.copy(os.path.join(s_dir, 'pest_model.obf'), 'set%i.obf' % i)
+"""
+
+def use_fake_simulator():
+    """ sets up bench case in working dir to run FAKE_SIMULATOR """
+    shutil.copy('real_model_ns.h5', 'bench_output.h5')
+    shutil.copy('real_model_ns.h5', 'real_model_incon.h5')
+    with open('real_model_original.json', 'r') as f:
+        wjson = json.load(f)
+    wjson['output'] = {'filename': 'real_model_ns.h5'}
+    with open('real_model_original.json', 'w') as f:
+        json.dump(wjson, f)
+    with open('fake_waiwera.py', 'w') as f:
+        f.write(FAKE_SIMULATOR % sys.executable)
+    os.chmod('fake_waiwera.py', 0o755)
+    cfg = BENCH_CONFIG % 1
+    cfg = cfg.replace('skip = true', 'skip = false')
+    cfg = cfg.replace('executable = "waiwera"',
+                      'executable = "%s"' % os.path.abspath('fake_waiwera.py'))
+    with open('goPESTconfig.toml', 'w') as f:
+        f.write('mode = "local"\n' + cfg)
+
+def read_obf(fobf):
+    with open(fobf, 'r') as f:
+        return dict([(line.split()[0], float(line.split()[1])) for line in f])
+
+def write_par_file(fpar, names, values):
+    with open(fpar, 'w') as f:
+        f.write('single point\n')
+        for n,v in zip(names, values):
+            f.write('%-12s %20.13e %10.3e %10.3e\n' % (n, v, 1.0, 0.0))
+
+class TestRunBatch(unittest.TestCase):
+    def setUp(self):
+        self.original_dir = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        make_bench_case(self.tmpdir, blocks=200, layers=4, sources=3, times=10,
+                        obs=40, params=20)
+        os.chdir(self.tmpdir)
+        shutil.copy('g_bench.dat', 'g_real_model.dat')
+        use_fake_simulator()
+        subprocess.run([sys.executable, '-c', INIT_CASE], check=True,
+                       capture_output=True)
+        with open('pest_model.tpl', 'r') as f:
+            f.readline()
+            self.names = [line.split('$')[1].strip() for line in f]
+
+    def tearDown(self):
+        os.chdir(self.original_dir)
+        shutil.rmtree(self.tmpdir)
+
+    def test_write_pest_model(self):
+        from gopest.run_manager import read_par_file, write_pest_model
+        from gopest.par import read_pest_model
+        values = [1.5e-14 * (i+1) for i in range(len(self.names))]
+        write_par_file('a.par', self.names, values)
+        write_pest_model('pest_model.tpl', read_par_file('a.par'), 'a.dat')
+        pars = list(read_pest_model('a.dat'))
+        self.assertEqual(len(pars), len(self.names))
+        for (v, pt, names), ev in zip(pars, values):
+            self.assertAlmostEqual(float(v) / ev, 1.0)
+
+    def run_sets(self):
+        """ returns obf of pest_model.dat, and writes three parameter sets """
+        result = subprocess.run(['gopest', 'run-pest-model', '--local'],
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        for i in range(3):
+            write_par_file('set%i.par' % i, self.names, [0.1 * (i+1)] * len(self.names))
+        return read_obf('pest_model.obf')
+
+    def check_sets(self, obf):
+        """ checks obf of the three parameter sets written by run_sets() """
+        # source S0000 rate is -2.0 in pest_model.dat, 0.1 * (i+1) in set i
+        obfs = [read_obf('set%i.obf' % i) for i in range(3)]
+        enth = [n for n in obf if n.startswith('En_')]
+        self.assertTrue(enth)
+        for i,obfi in enumerate(obfs):
+            self.assertEqual(sorted(obfi.keys()), sorted(obf.keys()))
+            for n in obf:
+                scale = 0.1 * (i+1) / 2.0 if n in enth else 1.0
+                self.assertAlmostEqual(obfi[n] / obf[n], scale, places=6, msg=n)
+
+    def test_run_batch(self):
+        obf = self.run_sets()
+        result = subprocess.run(['gopest', 'run-batch', 'set*.par', '--workers', '2'],
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertIn('3 runs (0 failed) by 2 workers', result.stdout)
+        self.check_sets(obf)
+        # keyed by position in batch, not .par file names
+        with open('goPESTruns.json', 'r') as f:
+            self.assertEqual(sorted(json.load(f)['par sets'].keys()), ['0', '1', '2'])
+        self.assertTrue(os.path.isdir('worker2'))
+        self.assertFalse(os.path.isdir('worker3'))
+
+    def test_run_workers(self):
+        obf = self.run_sets()
+        with open('fake_pest.py', 'w') as f:
+            f.write(FAKE_PEST)
+        result = subprocess.run(['gopest', 'run-workers', '--workers', '2',
+                                 '--master', sys.executable, 'fake_pest.py'],
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertIn('3 runs by 2 workers', result.stdout)
+        self.check_sets(obf)
+        with open('bench.rmf', 'r') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[:2], ['prf', '2 0 0.200000 1'])
+        for i in range(2):
+            self.assertEqual(lines[2+i].split(), ['worker%i' % (i+1),
+                             os.path.join(self.tmpdir, 'worker%i' % (i+1)) + os.sep])
+        self.assertEqual(lines[4], '3600 3600')
+        # signal files all cleared
+        for w in ['worker1', 'worker2']:
+            self.assertEqual([f for f in os.listdir(w) if f.startswith(('pest.', 'pslave.'))], [])
+
+        # expected run times of workers updated by their runs
+        with open('goPESTruns.json', 'r') as f:
+            self.assertEqual(sorted(json.load(f)['workers'].keys()), ['worker1', 'worker2'])
+        result = subprocess.run(['gopest', 'run-workers', '--workers', '2',
+                                 '--master', sys.executable, '-c', 'pass'],
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertIn('0 runs by 2 workers', result.stdout)
+        with open('bench.rmf', 'r') as f:
+            runtimes = [int(r) for r in f.read().splitlines()[4].split()]
+        self.assertTrue(all([0 < r < 3600 for r in runtimes]), runtimes)
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,151 @@
+import unittest
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from gopest.supervisor import AgentSlot, Supervisor, process_tree_rss
+
+# crashes the first time it runs (counted in file argv[1]), then sleeps
+AGENT = """
+import os, sys, time
+n = int(open(sys.argv[1]).read()) if os.path.exists(sys.argv[1]) else 0
+open(sys.argv[1], 'w').write(str(n + 1))
+if n == 0:
+    print('crash %i' % n)
+    sys.exit(1)
+time.sleep(60)
+"""
+
+def process_state(pid):
+    with open('/proc/%i/stat' % pid, 'r') as f:
+        stat = f.read()
+    return stat[stat.rindex(')')+2]
+
+def is_stopped(pid, expected=True):
+    """ signals are delivered asynchronously, waits for a bit """
+    for i in range(50):
+        if (process_state(pid) == 'T') == expected:
+            break
+        time.sleep(0.05)
+    return process_state(pid) == 'T'
+
+@unittest.skipUnless(sys.platform.startswith('linux'), 'requires /proc')
+class TestSupervisor(unittest.TestCase):
+    def setUp(self):
+        self.original_dir = os.getcwd()
+        self.tmpdir = tempfile.mkdtemp()
+        os.chdir(self.tmpdir)
+        with open('pest_model.tpl', 'w') as f:
+            f.write('ptf $\n')
+
+    def tearDown(self):
+        os.chdir(self.original_dir)
+        shutil.rmtree(self.tmpdir)
+
+    def make_slots(self, n, crash=False):
+        slots = []
+        for i in range(n):
+            s_dir = 'slave%i' % (i+1)
+            os.makedirs(s_dir)
+            if crash:
+                cmd = [sys.executable, '-c', AGENT, os.path.join(self.tmpdir, s_dir + '.count')]
+            else:
+                cmd = [sys.executable, '-c', 'import time; time.sleep(60)']
+            slots.append(AgentSlot(s_dir, cmd, readonly=set(['pest_model.tpl'])))
+        return slots
+
+    def test_restart_crashed(self):
+        slots = self.make_slots(2, crash=True)
+        sup = Supervisor([sys.executable, '-c', 'import time; time.sleep(2)'],
+                         slots, interval=0.2)
+        self.assertEqual(sup.run(), 0)
+        for i,s in enumerate(slots):
+            with open('slave%i.count' % (i+1), 'r') as f:
+                self.assertEqual(f.read(), '2')
+            self.assertEqual(s.restarts, 1)
+            self.assertFalse(s.running())
+            # clean dir provisioned again
+            self.assertTrue(os.path.samefile('pest_model.tpl',
+                            os.path.join(s.s_dir, 'pest_model.tpl')))
+            # output of crashed agent kept
+            with open('slave%i.stdout.crash1.txt' % (i+1), 'r') as f:
+                self.assertEqual(f.read(), 'crash 0\n')
+
+    def test_memory_unknown(self):
+        """ adaptation skipped if available memory cannot be read mid-run """
+        from unittest import mock
+        slots = self.make_slots(2)
+        sup = Supervisor([sys.executable, '-c', 'import time; time.sleep(1)'],
+                         slots, adaptive=True, interval=0.1)
+        self.assertTrue(sup.adaptive)
+        with mock.patch('gopest.supervisor.mem_available', return_value=None):
+            self.assertEqual(sup.run(), 0)
+        self.assertIsNone(slots[1].proc)
+
+    def test_no_restart(self):
+        """ clean exits, deliberate stops and agents outliving master are not
+        restarted, other signals are """
+        slots = self.make_slots(4)
+        slots[0].cmd = [sys.executable, '-c', 'pass']
+        sup = Supervisor([sys.executable, '-c', 'import time; time.sleep(60)'],
+                         slots, interval=0.2)
+        sup.master = subprocess.Popen(sup.master_cmd)
+        try:
+            for s in slots:
+                s.start()
+            slots[0].proc.wait()
+            for s,sig in zip(slots[1:], [signal.SIGTERM, signal.SIGKILL]):
+                s.proc.send_signal(sig)
+                s.proc.wait()
+            sup.check_exited()
+            self.assertEqual([s.restarts for s in slots], [0, 0, 1, 0])
+            self.assertFalse(slots[0].running())
+            self.assertTrue(slots[2].running())
+            # master gone, crashes no longer matter
+            sup.master.terminate()
+            sup.master.wait()
+            slots[3].proc.send_signal(signal.SIGKILL)
+            slots[3].proc.wait()
+            sup.check_exited()
+            self.assertEqual(slots[3].restarts, 0)
+        finally:
+            if sup.master.poll() is None:
+                sup.master.kill()
+            sup.stop_all()
+
+    def test_adapt(self):
+        slots = self.make_slots(3)
+        sup = Supervisor(['true'], slots, adaptive=True, min_agents=1,
+                         mem_reserve=1000.0)
+        try:
+            slots[0].start()
+            sup.adapt(1.e9, 0.0)
+            self.assertTrue(slots[1].running())
+            self.assertIsNone(slots[2].proc)
+            self.assertGreater(sup.peak_rss, 0.0)
+            self.assertGreater(process_tree_rss(slots[0].proc.pid), 0.0)
+            # low memory pauses most recent agent, but not the last one
+            sup.adapt(10.0, 0.0)
+            self.assertTrue(slots[1].paused)
+            self.assertTrue(is_stopped(slots[1].proc.pid))
+            sup.adapt(10.0, 0.0)
+            self.assertFalse(slots[0].paused)
+            # resumes before starting more
+            sup.adapt(1.e9, 0.0)
+            self.assertFalse(slots[1].paused)
+            self.assertFalse(is_stopped(slots[1].proc.pid, False))
+            self.assertIsNone(slots[2].proc)
+            # high load, no more agents
+            sup.adapt(1.e9, 1.e6)
+            self.assertIsNone(slots[2].proc)
+        finally:
+            sup.stop_all()
+        for s in slots[:2]:
+            self.assertFalse(s.running())
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
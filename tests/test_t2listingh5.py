@@ -0,0 +1,70 @@
+import unittest
+import os
+import tempfile
+import shutil
+
+import numpy as np
+import h5py
+
+from gopest.utils.t2listingh5 import h5table
+
+class TestH5Table(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.data = np.random.default_rng(0).random((3, 5, 2))
+        self.h5 = h5py.File(os.path.join(self.tmpdir, 'table.h5'), 'w')
+        self.h5.create_dataset('connection', data=self.data)
+        rows = [('A', 'B'), ('B', 'C'), ('C', 'D'), ('D', 'E'), ('E', 'F')]
+        self.table = h5table(['Mass flow', 'Heat flow'], rows, self.h5['connection'],
+                             num_keys=2, allow_reverse_keys=True)
+
+    def tearDown(self):
+        self.h5.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_take(self):
+        vals = self.table.take([('C', 'D'), 0, ('F', 'E'), ('B', 'C')], 'Heat flow')
+        np.testing.assert_allclose(vals, [self.data[0,2,1], self.data[0,0,1],
+                                          -self.data[0,4,1], self.data[0,1,1]])
+        self.assertRaises(KeyError, self.table.take, [('A', 'F')], 'Heat flow')
+
+    def test_cached_column_follows_index(self):
+        self.assertAlmostEqual(self.table[('B', 'C')]['Mass flow'], self.data[0,1,0])
+        self.assertAlmostEqual(self.table[('C', 'B')]['Mass flow'], -self.data[0,1,0])
+        self.table._index = 2
+        np.testing.assert_allclose(self.table['Mass flow'], self.data[2,:,0])
+        np.testing.assert_allclose(self.table.take([3, 1], 'Mass flow'),
+                                   self.data[2,[3,1],0])
+        self.assertEqual(self.table[4]['key'], ('E', 'F'))
+        self.assertAlmostEqual(self.table[4]['Heat flow'], self.data[2,4,1])
+
+    def test_cached_column_read_only(self):
+        col = self.table['Mass flow']
+        with self.assertRaises(ValueError):
+            col[0] = 1.0e9
+        vals = self.table.take([0, 1], 'Mass flow')
+        vals[0] = 1.0e9
+        np.testing.assert_allclose(self.table['Mass flow'], self.data[0,:,0])
+
+    def test_row_reads_row(self):
+        """ single row lookups do not read (and cache) whole columns """
+        reads = []
+        class Recorder(object):
+            def __init__(self, ds):
+                self.ds = ds
+            def __getitem__(self, key):
+                reads.append(key)
+                return self.ds[key]
+        self.table._h5_table = Recorder(self.h5['connection'])
+        self.assertAlmostEqual(self.table[('C', 'D')]['Heat flow'], self.data[0,2,1])
+        self.assertAlmostEqual(self.table[('D', 'C')]['Mass flow'], -self.data[0,2,0])
+        self.assertEqual(reads, [(0, 2, slice(None)), (0, 2, slice(None))])
+        self.assertEqual(self.table._cache, {})
+        # served from cache once all columns are
+        self.table['Mass flow'], self.table['Heat flow']
+        del reads[:]
+        self.assertAlmostEqual(self.table[3]['Heat flow'], self.data[0,3,1])
+        self.assertEqual(reads, [])
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
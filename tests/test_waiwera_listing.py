@@ -0,0 +1,192 @@
+import unittest
+import os
+import tempfile
+import shutil
+
+import numpy as np
+import h5py
+
+from mulgrids import mulgrid
+
+from gopest.utils.waiwera_listing import wlisting
+
+def make_waiwera_faces(geo, rng):
+    """ returns (face_cell_1, face_cell_2, face_idx, face_idx_dir) for faces
+    of geo in shuffled order and direction, with atmosphere connections as
+    boundary faces.  face_idx/face_idx_dir are what wlisting should work out.
+    """
+    natm = geo.num_atmosphere_blocks
+    faces = []
+    for k,(b1,b2) in enumerate(geo.block_connection_name_list):
+        i1, i2 = geo.block_name_index[b1] - natm, geo.block_name_index[b2] - natm
+        if i2 < 0:
+            faces.append((i1, -1, k, -1.0))
+        elif rng.random() < 0.5:
+            faces.append((i2, i1, k, 1.0))
+        else:
+            faces.append((i1, i2, k, -1.0))
+    faces = [faces[i] for i in rng.permutation(len(faces))]
+    face_idx = np.zeros(len(faces), dtype=int)
+    face_idx_dir = np.zeros(len(faces))
+    for f,(c1,c2,k,d) in enumerate(faces):
+        face_idx[k], face_idx_dir[k] = f, d
+    cid = np.array([f[:2] for f in faces])
+    return cid[:,0], cid[:,1], face_idx, face_idx_dir
+
+def make_waiwera_h5(filename, geo, ntimes=5, nsources=4, seed=0):
+    """ write a small synthetic Waiwera output file matching geo, cells and
+    sources are stored in a shuffled order like a multi-cpu run would. """
+    rng = np.random.default_rng(seed)
+    ncells = geo.num_blocks - geo.num_atmosphere_blocks
+    cell_idx = rng.permutation(ncells)
+    source_idx = rng.permutation(nsources)
+    with h5py.File(filename, 'w') as h5:
+        h5.create_dataset('time', data=np.arange(ntimes, dtype=float).reshape(-1,1) * 1.e6)
+        h5.create_dataset('cell_index', data=cell_idx.reshape(-1,1))
+        h5.create_dataset('source_index', data=source_idx.reshape(-1,1))
+        cf = h5.create_group('cell_fields')
+        for f in ['fluid_pressure', 'fluid_temperature']:
+            cf.create_dataset(f, data=rng.random((ntimes, ncells)))
+        sf = h5.create_group('source_fields')
+        for f in ['source_rate', 'source_enthalpy']:
+            sf.create_dataset(f, data=rng.random((ntimes, nsources)))
+        cid1, cid2, face_idx, face_idx_dir = make_waiwera_faces(geo, rng)
+        h5.create_dataset('face_cell_1', data=cid1.reshape(-1,1))
+        h5.create_dataset('face_cell_2', data=cid2.reshape(-1,1))
+        ff = h5.create_group('face_fields')
+        ff.create_dataset('flux_water', data=rng.random((ntimes, len(cid1))))
+    return cell_idx, source_idx, face_idx, face_idx_dir
+
+class TestWaiweraListingHistory(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.geo = mulgrid().rectangular([100.]*4, [100.]*3, [10.]*3,
+                                         atmos_type=0, block_order='dmplex')
+        self.fh5 = os.path.join(self.tmpdir, 'model.h5')
+        self.cell_idx, self.source_idx, _, _ = make_waiwera_h5(self.fh5, self.geo)
+        self.lst = wlisting(self.fh5, self.geo)
+
+    def tearDown(self):
+        self.lst.close()
+        shutil.rmtree(self.tmpdir)
+
+    def expected(self, grp, field, i):
+        with h5py.File(self.fh5, 'r') as h5:
+            return h5[grp][field][:,i]
+
+    def test_single_selection(self):
+        natm = self.geo.num_atmosphere_blocks
+        b = self.geo.block_name_list[natm + 7]
+        xs, ys = self.lst.history(('e', b, 'fluid_pressure'))
+        np.testing.assert_allclose(xs, self.lst.fulltimes)
+        np.testing.assert_allclose(ys, self.expected('cell_fields', 'fluid_pressure', self.cell_idx[7]))
+        xs, ys = self.lst.history(('g', 2, 'source_rate'))
+        np.testing.assert_allclose(ys, self.expected('source_fields', 'source_rate', self.source_idx[2]))
+
+    def test_batched_matches_individual(self):
+        """ batched selection (unsorted, repeated, mixed tables/fields) should
+        give the same results as extracting one by one """
+        natm = self.geo.num_atmosphere_blocks
+        names = self.geo.block_name_list
+        selection = [
+            ('e', names[-1], 'fluid_pressure'),
+            ('e', names[natm], 'fluid_pressure'),
+            ('e', names[natm + 5], 'fluid_temperature'),
+            ('g', 3, 'source_enthalpy'),
+            ('e', names[-1], 'fluid_pressure'),
+            ('e', -2, 'fluid_pressure'),
+            ('g', 0, 'source_enthalpy'),
+            ('g', 3, 'source_rate'),
+        ]
+        tbl = self.lst.history(selection)
+        self.assertEqual(len(tbl), len(selection))
+        for sel, (xs, ys) in zip(selection, tbl):
+            xs1, ys1 = self.lst.history(sel)
+            np.testing.assert_allclose(xs, xs1)
+            np.testing.assert_allclose(ys, ys1)
+        # sparse selection that triggers fancy indexing instead of hyperslab
+        selection = [('e', names[-1], 'fluid_pressure'), ('e', names[natm], 'fluid_pressure')]
+        for (xs, ys), i in zip(self.lst.history(selection), [-1, 0]):
+            np.testing.assert_allclose(ys, self.expected('cell_fields', 'fluid_pressure', self.cell_idx[i]))
+
+    def test_atmosphere_block(self):
+        self.assertRaisesRegex(Exception, 'atmosphere', self.lst.history, ('e', 0, 'fluid_temperature'))
+
+class TestWaiweraListingConnection(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.geo = mulgrid().rectangular([100.]*4, [100.]*3, [10.]*3,
+                                         atmos_type=0, block_order='dmplex')
+        self.fh5 = os.path.join(self.tmpdir, 'model.h5')
+        _, _, self.face_idx, self.face_idx_dir = make_waiwera_h5(self.fh5, self.geo)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_lazy_connection(self):
+        lst = wlisting(self.fh5, self.geo)
+        self.assertIn('connection', lst.table_names)
+        self.assertNotIn('connection', lst.__dict__)
+        self.assertNotIn('face_idx', lst.__dict__)
+        lst.index = 2
+        np.testing.assert_equal(lst.face_idx, self.face_idx)
+        np.testing.assert_equal(lst.face_idx_dir, self.face_idx_dir)
+        with h5py.File(self.fh5, 'r') as h5:
+            flux = h5['face_fields']['flux_water'][2]
+        np.testing.assert_allclose(lst.connection['flux_water'],
+                                   flux[self.face_idx] * self.face_idx_dir)
+        lst.index = 3
+        self.assertEqual(lst.connection.row_name, self.geo.block_connection_name_list)
+        lst.close()
+
+    def test_connection_history(self):
+        lst = wlisting(self.fh5, self.geo)
+        c = self.geo.block_connection_name_list[5]
+        xs, ys = lst.history(('c', c, 'flux_water'))
+        f = self.face_idx[5]
+        with h5py.File(self.fh5, 'r') as h5:
+            np.testing.assert_allclose(ys, h5['face_fields']['flux_water'][:,f])
+            c1, c2 = h5['face_cell_1'][f,0], h5['face_cell_2'][f,0]
+        xs, ys2 = lst.history(('c', (int(c1), int(c2)), 'flux_water'))
+        np.testing.assert_allclose(ys, ys2)
+        self.assertRaises(KeyError, lst.history, ('c', (0, 0), 'flux_water'))
+        lst.close()
+
+    def test_face_cache(self):
+        fcache = os.path.join(self.tmpdir, 'faces.npz')
+        lst = wlisting(self.fh5, self.geo, face_cache=fcache)
+        lst.connection
+        lst.close()
+        self.assertTrue(os.path.isfile(fcache))
+        with np.load(fcache) as npz:
+            np.testing.assert_equal(npz['face_idx'], self.face_idx)
+        lst = wlisting(self.fh5, self.geo, face_cache=fcache)
+        np.testing.assert_equal(lst.face_idx, self.face_idx)
+        np.testing.assert_equal(lst.face_idx_dir, self.face_idx_dir)
+        lst.close()
+
+    def test_face_cache_renamed(self):
+        """ cache of a geometry with the same numbers of blocks/connections but
+        different names is not used, a shared cache is replaced, not modified """
+        from copy import deepcopy
+        fcache = os.path.join(self.tmpdir, 'faces.npz')
+        lst = wlisting(self.fh5, self.geo, face_cache=fcache)
+        lst.connection
+        lst.close()
+        fshared = os.path.join(self.tmpdir, 'shared.npz')
+        os.link(fcache, fshared)
+        with open(fshared, 'rb') as f:
+            shared = f.read()
+        geo2 = deepcopy(self.geo)
+        geo2.rename_column(geo2.columnlist[0].name, 'zz')
+        lst = wlisting(self.fh5, geo2, face_cache=fcache)
+        lst.connection
+        lst.close()
+        with open(fshared, 'rb') as f:
+            self.assertEqual(f.read(), shared)
+        self.assertFalse(os.path.samefile(fcache, fshared))
+        with np.load(fcache) as npz, np.load(fshared) as npz_shared:
+            self.assertNotEqual(str(npz['key']), str(npz_shared['key']))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import os
+import shutil
+import tempfile
+
+from gopest.utils.waiwera_log import tail_records, sim_ends, timestep_stats
+
+HEADER = """- [info, simulation, init, {}]
+- [info, mesh, init, {cells: 8, faces: 12,
+    dims: 3}]
+"""
+STEP = "- [info, timestep, end, {count: %i, tries: %i, size: %.6e, time: %.6e, status: continuing}]\n"
+REDUCTION = "- [warn, timestep, reduction, {new_size: %.6e}]\n"
+DESTROY = """- [info, output, time_data, {count: 1}]
+- [info, simulation, destroy, {elapsed_seconds: 12.5}]
+"""
+
+class TestWaiweraLog(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.fyaml = os.path.join(self.tmpdir, 'real_model_ns.yaml')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write_log(self, nsteps, finished=True):
+        time = 0.0
+        with open(self.fyaml, 'w') as f:
+            f.write(HEADER)
+            for i in range(nsteps):
+                size = 10. * 2**(i % 20)
+                time += size
+                if i % 100 == 99:
+                    f.write(REDUCTION % size)
+                f.write(STEP % (i+1, 2 if i % 100 == 99 else 1, size, time))
+            if finished:
+                f.write(DESTROY)
+        return time
+
+    def test_tail(self):
+        time = self.write_log(5000)
+        # blocks much smaller than the log
+        recs = tail_records(self.fyaml, n=3, blocksize=100)
+        self.assertEqual([r[:3] for r in recs], [['info', 'timestep', 'end'],
+                         ['info', 'output', 'time_data'], ['info', 'simulation', 'destroy']])
+        self.assertEqual(sim_ends(self.fyaml), {
+            'endtime': float('%.6e' % time),
+            'stepsize': 10. * 2**(4999 % 20),
+            'elapsed': 12.5,
+            })
+        # whole short log, including multi-line record
+        self.write_log(0)
+        recs = tail_records(self.fyaml, n=10, blocksize=7)
+        self.assertEqual(len(recs), 4)
+        self.assertEqual(recs[1][3], {'cells': 8, 'faces': 12, 'dims': 3})
+
+    def test_unfinished(self):
+        self.write_log(50, finished=False)
+        self.assertEqual(sim_ends(self.fyaml), {})
+        self.assertEqual(sim_ends(os.path.join(self.tmpdir, 'missing.yaml')), {})
+
+    def test_timestep_stats(self):
+        self.write_log(1000)
+        self.assertEqual(timestep_stats(self.fyaml), {
+            'steps': 1000,
+            'retries': 10,
+            'failures': 10,
+            'min_dt': 10.,
+            'max_dt': 10. * 2**19,
+            })
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)